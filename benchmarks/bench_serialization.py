@@ -0,0 +1,103 @@
+"""
+bench_serialization.py - Compare response serialization paths
+
+Times serializing a tracker's document listing the way FastAPI does it for a
+route with response_model=List[Document] (validate, jsonable_encoder, json.dumps)
+against the trusted orjson path used by util.responses.trusted_response().
+
+Usage:
+    python -m benchmarks.bench_serialization [--documents 10000] [--repeat 5]
+"""
+import argparse
+from datetime import datetime, timedelta
+import json
+import time
+from typing import List
+from uuid import uuid4
+from fastapi.encoders import jsonable_encoder
+from pydantic import TypeAdapter
+from models.document import Document
+from util.responses import FastJSONResponse, model_projection, with_model_defaults
+
+
+def make_documents(count: int) -> List[dict]:
+    """
+    Build synthetic documents shaped like the records in the documents collection
+    """
+    start = datetime(2020, 1, 1)
+    fields = model_projection(Document)
+    docs = []
+    for number in range(count):
+        doc = {
+            'id': str(uuid4()),
+            'path': f'x:\\shared\\plano\\open\\client\\discovery\\production\\{number:06d}.pdf',
+            'filename': f'{number:06d}.pdf',
+            'type': 'application/pdf',
+            'title': f'Bank Statement {number}',
+            'create_date': '2024-01-01',
+            'document_date': (start + timedelta(days=number % 1500)).strftime('%Y-%m-%d'),
+            'beginning_bates': f'TJD{number * 5:06d}',
+            'ending_bates': f'TJD{number * 5 + 4:06d}',
+            'page_count': 5,
+            'client_reference': 'DALTHO01A',
+            'added_username': 'test_user@test.com',
+            'added_date': start + timedelta(minutes=number),
+            'updated_username': 'test_user@test.com',
+            'updated_date': start + timedelta(minutes=number),
+            'version': str(uuid4()),
+            'classification': 'Bank Statement',
+            'sub_classification': {'institution': 'Bank of America', 'account': f'{number % 7:04d}'},
+            'page_max': 5,
+            'missing_pages': '',
+            'produced_date': '2024-02-01',
+        }
+        docs.append({key: value for key, value in doc.items() if key in fields})
+    return docs
+
+
+def validated_path(docs: List[dict]) -> bytes:
+    """
+    What FastAPI does for response_model=List[Document] with the default JSONResponse
+    """
+    models = TypeAdapter(List[Document]).validate_python(docs)
+    content = jsonable_encoder(models)
+    return json.dumps(content, ensure_ascii=False, allow_nan=False, separators=(',', ':')).encode('utf-8')
+
+
+def trusted_path(docs: List[dict]) -> bytes:
+    """
+    What trusted_response() does for the same records
+    """
+    return FastJSONResponse(with_model_defaults(Document, docs)).body
+
+
+def time_it(func, docs: List[dict], repeat: int) -> float:
+    """
+    Return the best of several runs in milliseconds
+    """
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(docs)
+        elapsed = (time.perf_counter() - start) * 1000.0
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare response serialization paths')
+    parser.add_argument('--documents', type=int, default=10000, help='Number of documents in the tracker')
+    parser.add_argument('--repeat', type=int, default=5, help='Number of runs; the best is reported')
+    args = parser.parse_args()
+
+    docs = make_documents(args.documents)
+    validated_ms = time_it(validated_path, docs, args.repeat)
+    trusted_ms = time_it(trusted_path, docs, args.repeat)
+    print(f"Documents:             {args.documents}")
+    print(f"Validated (stdlib):    {validated_ms:9.1f} ms")
+    print(f"Trusted (orjson):      {trusted_ms:9.1f} ms")
+    print(f"Speedup:               {validated_ms / trusted_ms:9.1f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,79 @@
+"""
+import_profile.py - Show which imports make the app slow to start
+
+Imports a module in a fresh interpreter with python -X importtime, and lists
+the modules that took longest, counting the imports they pulled in.
+
+Usage:
+    python -m benchmarks.import_profile [--module falconapi] [--top 25]
+"""
+import argparse
+import os
+import subprocess
+import sys
+from typing import List, Tuple
+
+# Lines look like: "import time:       412 |       9035 |   pymongo.mongo_client"
+IMPORTTIME_PREFIX = 'import time:'
+
+
+def parse_importtime(stderr: str) -> List[Tuple[int, int, str]]:
+    """
+    Parse the output of python -X importtime
+
+    Args:
+        stderr (str): The interpreter's stderr
+
+    Returns:
+        List[Tuple[int, int, str]]: (self microseconds, cumulative microseconds, module) for each import
+    """
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith(IMPORTTIME_PREFIX):
+            continue
+        fields = line[len(IMPORTTIME_PREFIX):].split('|')
+        if len(fields) != 3 or not fields[0].strip().isdigit():
+            continue  # The header line
+        rows.append((int(fields[0]), int(fields[1]), fields[2].strip()))
+    return rows
+
+
+def profile(module: str) -> Tuple[float, List[Tuple[int, int, str]]]:
+    """
+    Import a module in a fresh interpreter and collect its import times
+
+    Args:
+        module (str): The module to import
+
+    Returns:
+        Tuple[float, List]: Total import time in ms, and the parsed rows
+    """
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+        cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+        capture_output=True,
+        text=True,
+    )
+    if result.returncode != 0:
+        errors = [line for line in result.stderr.splitlines() if not line.startswith(IMPORTTIME_PREFIX)]
+        raise SystemExit(f"import {module} failed:\n" + '\n'.join(errors))
+    rows = parse_importtime(result.stderr)
+    total = next((cumulative for _, cumulative, name in rows if name == module), 0)
+    return total / 1000, rows
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--module', default='falconapi')
+    parser.add_argument('--top', type=int, default=25)
+    args = parser.parse_args()
+
+    total_ms, rows = profile(args.module)
+    print(f"import {args.module}: {total_ms:.1f} ms\n")
+    print(f"{'cumulative ms':>14} {'self ms':>9}  module")
+    for self_us, cumulative_us, name in sorted(rows, key=lambda row: row[1], reverse=True)[:args.top]:
+        print(f"{cumulative_us / 1000:>14.1f} {self_us / 1000:>9.1f}  {name}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,260 @@
+"""
+load.py - End-to-end load benchmark
+
+Sends concurrent requests to the main read endpoints. For each endpoint it
+reports p50/p95/p99 latency, throughput, and status codes. Results are saved
+as JSON so that runs can be compared.
+
+Seed the benchmark database first with benchmarks.seed. Then either:
+
+    # Run the app in this process, through its ASGI interface (no server needed)
+    python -m benchmarks.load --concurrency 16 --requests 400
+
+    # Or load a running server. Start it with DATABASE_NAME=falcon_bench and
+    # the same JWT_* settings as this process.
+    python -m benchmarks.load --base-url http://localhost:8000
+
+    # Compare with an earlier run
+    python -m benchmarks.load --compare benchmarks/results/load-20240101-120000.json
+
+Needs httpx.
+"""
+import argparse
+import asyncio
+from datetime import datetime, timedelta
+import json
+import math
+import os
+import random
+import subprocess
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+import httpx
+from jose import jwt
+from pymongo import MongoClient
+from benchmarks.seed import BENCH_DATABASE_NAME, BENCH_USERNAME
+import settings  # NOQA
+
+
+API_PREFIX = '/api/v1_0'
+RESULTS_DIR = os.path.join(os.path.dirname(__file__), 'results')
+
+# name -> function(manifest, rng) returning (method, path, json body)
+Endpoint = Callable[[dict, random.Random], Tuple[str, str, Optional[dict]]]
+
+
+def pick(manifest: dict, rng: random.Random, key: str) -> str:
+    """
+    Pick a random id of one kind from a random client
+    """
+    client = rng.choice(manifest['clients'])
+    return rng.choice(client[key])
+
+
+ENDPOINTS: Dict[str, Endpoint] = {
+    'tracker': lambda m, r: ('GET', f"/trackers/?tracker_id={pick(m, r, 'trackers')}", None),
+    'trackers_for_user': lambda m, r: ('GET', '/trackers/user', None),
+    'trackers_for_client': lambda m, r: ('GET', f"/trackers/client?client_id={r.choice(m['clients'])['id']}", None),
+    'tracker_documents': lambda m, r: ('GET', f"/trackers/{pick(m, r, 'trackers')}/documents", None),
+    'tracker_categories': lambda m, r: ('GET', f"/trackers/{pick(m, r, 'trackers')}/categories", None),
+    'tracker_category_pairs': lambda m, r: ('GET', f"/trackers/{pick(m, r, 'trackers')}/category_subcategory_pairs", None),
+    'tracker_list_dataset': lambda m, r: ('GET', f"/trackers/{pick(m, r, 'trackers')}/datasets/TRACKER_LIST", None),
+    'deposits_dataset': lambda m, r: ('GET', f"/trackers/{pick(m, r, 'trackers')}/datasets/DEPOSITS", None),
+    'document': lambda m, r: ('GET', f"/documents/?doc_id={pick(m, r, 'documents')}", None),
+    'document_props': lambda m, r: ('GET', f"/documents/props?doc_id={pick(m, r, 'documents')}", None),
+    'document_tables_csv': lambda m, r: ('GET', f"/documents/tables/csv?doc_id={pick(m, r, 'documents')}", None),
+    'documents_batch': lambda m, r: ('POST', '/documents/batch', {'ids': r.sample(r.choice(m['clients'])['documents'], 100)}),
+    'clients': lambda m, r: ('GET', '/clients/?search_field=client_id&search_value=*', None),
+    'discovery_files_for_client': lambda m, r: ('GET', f"/discovery_files/client/{r.choice(m['clients'])['id']}", None),
+    'discovery_requests_for_file': lambda m, r: ('GET', f"/discovery_requests/file/{pick(m, r, 'discovery_files')}", None),
+}
+
+
+def read_manifest(db_url: str, database_name: str, sample: int = 200) -> dict:
+    """
+    Read the ids the benchmark requests from a seeded database
+
+    Args:
+        db_url (str): MongoDB connection string
+        database_name (str): The seeded database
+        sample (int): Number of document ids to use per client
+
+    Returns:
+        dict: Clients with their tracker, document and discovery file ids
+    """
+    db = MongoClient(db_url)[database_name]
+    clients = []
+    for client in db['clients'].find({'authorized_users': BENCH_USERNAME}, {'_id': 0, 'id': 1}):
+        trackers = list(db['trackers'].find({'client_id': client['id']}, {'_id': 0, 'id': 1, 'documents': {'$slice': sample}}))
+        files = [file['id'] for file in db['discovery_files'].find({'client_id': client['id']}, {'_id': 0, 'id': 1})]
+        documents = [doc_id for tracker in trackers for doc_id in tracker.get('documents', [])]
+        if trackers and documents and files:
+            clients.append({
+                'id': client['id'],
+                'trackers': [tracker['id'] for tracker in trackers],
+                'documents': documents,
+                'discovery_files': files,
+            })
+    if not clients:
+        raise SystemExit(f"No benchmark data in {database_name}. Run python -m benchmarks.seed first.")
+    return {'database': database_name, 'clients': clients}
+
+
+def bench_token() -> str:
+    """
+    Sign an access token for the benchmark user with this process's JWT settings
+    """
+    payload = {'sub': BENCH_USERNAME, 'exp': datetime.utcnow() + timedelta(hours=2)}
+    return jwt.encode(payload, os.environ['JWT_SECRET_KEY'], algorithm=os.environ['JWT_ALGORITHM'])
+
+
+def percentile(sorted_values: List[float], fraction: float) -> float:
+    """
+    Nearest-rank percentile of an already sorted list
+    """
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, math.ceil(fraction * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+
+def summarize(latencies: List[float], statuses: Dict[str, int], elapsed: float) -> dict:
+    """
+    Latency percentiles (ms), throughput and status counts for one endpoint
+    """
+    ordered = sorted(latencies)
+    return {
+        'requests': len(ordered),
+        'p50_ms': round(percentile(ordered, 0.50) * 1000, 2),
+        'p95_ms': round(percentile(ordered, 0.95) * 1000, 2),
+        'p99_ms': round(percentile(ordered, 0.99) * 1000, 2),
+        'max_ms': round(ordered[-1] * 1000, 2) if ordered else 0.0,
+        'throughput_rps': round(len(ordered) / elapsed, 1) if elapsed else 0.0,
+        'statuses': statuses,
+    }
+
+
+async def run_endpoint(client: httpx.AsyncClient, name: str, manifest: dict, requests: int, concurrency: int, rng: random.Random) -> dict:
+    """
+    Send requests to one endpoint from several concurrent workers
+    """
+    endpoint = ENDPOINTS[name]
+    calls = [endpoint(manifest, rng) for _ in range(requests)]
+    latencies: List[float] = []
+    statuses: Dict[str, int] = {}
+    next_call = iter(calls)
+
+    async def worker() -> None:
+        for method, path, body in next_call:
+            start = time.perf_counter()
+            try:
+                response = await client.request(method, API_PREFIX + path, json=body)
+                status = str(response.status_code)
+            except httpx.HTTPError as e:
+                status = type(e).__name__
+            latencies.append(time.perf_counter() - start)
+            statuses[status] = statuses.get(status, 0) + 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return summarize(latencies, statuses, time.perf_counter() - start)
+
+
+async def run(args: argparse.Namespace, manifest: dict) -> dict:
+    """
+    Benchmark each selected endpoint in turn
+    """
+    headers = {'Authorization': f'Bearer {bench_token()}'}
+    timeout = httpx.Timeout(args.timeout)
+    rng = random.Random(args.seed)
+    results = {}
+
+    if args.base_url:
+        limits = httpx.Limits(max_connections=args.concurrency)
+        async with httpx.AsyncClient(base_url=args.base_url, headers=headers, timeout=timeout, limits=limits) as client:
+            for name in args.endpoints:
+                await run_endpoint(client, name, manifest, args.warmup, args.concurrency, rng)
+                results[name] = await run_endpoint(client, name, manifest, args.requests, args.concurrency, rng)
+                print_result(name, results[name])
+        return results
+
+    # In process: the app reads DATABASE_NAME when it is imported
+    os.environ['DATABASE_NAME'] = manifest['database']
+    from falconapi import app
+    transport = httpx.ASGITransport(app=app)
+    async with app.router.lifespan_context(app):
+        async with httpx.AsyncClient(transport=transport, base_url='http://bench', headers=headers, timeout=timeout) as client:
+            for name in args.endpoints:
+                await run_endpoint(client, name, manifest, args.warmup, args.concurrency, rng)
+                results[name] = await run_endpoint(client, name, manifest, args.requests, args.concurrency, rng)
+                print_result(name, results[name])
+    return results
+
+
+def print_result(name: str, result: dict) -> None:
+    print(
+        f"{name:<30} p50 {result['p50_ms']:>9.2f} ms  p95 {result['p95_ms']:>9.2f} ms  "
+        f"p99 {result['p99_ms']:>9.2f} ms  {result['throughput_rps']:>8.1f} req/s  {result['statuses']}"
+    )
+
+
+def compare(results: dict, baseline_file: str) -> None:
+    """
+    Print the change in p95 latency and throughput against an earlier run
+    """
+    with open(baseline_file, 'r', encoding='utf-8') as f:
+        baseline = json.load(f)['results']
+    print(f"\nCompared with {baseline_file}:")
+    for name, result in results.items():
+        before = baseline.get(name)
+        if not before or not before['p95_ms']:
+            continue
+        p95_change = (result['p95_ms'] - before['p95_ms']) / before['p95_ms'] * 100
+        rps_change = (result['throughput_rps'] - before['throughput_rps']) / before['throughput_rps'] * 100 if before['throughput_rps'] else 0.0
+        print(f"{name:<30} p95 {before['p95_ms']:>9.2f} -> {result['p95_ms']:>9.2f} ms ({p95_change:+.1f}%)  throughput {rps_change:+.1f}%")
+
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--db-url', default=os.getenv('DB_URL', 'mongodb://localhost:27017'))
+    parser.add_argument('--database', default=BENCH_DATABASE_NAME)
+    parser.add_argument('--base-url', default=None, help='Load a running server instead of the in-process app')
+    parser.add_argument('--endpoints', nargs='+', default=list(ENDPOINTS), choices=list(ENDPOINTS))
+    parser.add_argument('--requests', type=int, default=200, help='Measured requests per endpoint')
+    parser.add_argument('--warmup', type=int, default=20, help='Unmeasured requests per endpoint')
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--timeout', type=float, default=60.0)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--output', default=None, help='Results file (default benchmarks/results/load-<time>.json)')
+    parser.add_argument('--compare', default=None, help='An earlier results file to compare with')
+    args = parser.parse_args()
+
+    manifest = read_manifest(args.db_url, args.database)
+    results = asyncio.run(run(args, manifest))
+
+    output = args.output or os.path.join(RESULTS_DIR, f"load-{datetime.now():%Y%m%d-%H%M%S}.json")
+    os.makedirs(os.path.dirname(output) or '.', exist_ok=True)
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump({
+            'run_at': datetime.now().isoformat(),
+            'commit': git_commit(),
+            'mode': args.base_url or 'in-process',
+            'database': args.database,
+            'requests': args.requests,
+            'concurrency': args.concurrency,
+            'results': results,
+        }, f, indent=2)
+    print(f"\nSaved {output}")
+    if args.compare:
+        compare(results, args.compare)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,47 @@
+"""
+conftest.py - Shared data for the micro-benchmarks
+"""
+import os
+import random
+import pytest
+
+# auth.handler reads these when it is imported. Only set them if the environment has not.
+os.environ.setdefault('JWT_SECRET_KEY', 'micro-benchmark-secret')
+os.environ.setdefault('JWT_ALGORITHM', 'HS256')
+os.environ.setdefault('JWT_ACCESS_TOKEN_EXPIRE_MINUTES', '30')
+
+from benchmarks.seed import make_client, make_document, make_props, make_transactions  # NOQA: E402
+
+
+@pytest.fixture(scope='session')
+def rng() -> random.Random:
+    return random.Random(1)
+
+
+@pytest.fixture(scope='session')
+def client() -> dict:
+    return make_client(0)
+
+
+@pytest.fixture(scope='session')
+def documents(rng: random.Random, client: dict) -> list:
+    """
+    2,000 documents spread over five years
+    """
+    return [make_document(rng, client, number) for number in range(2000)]
+
+
+@pytest.fixture(scope='session')
+def props(rng: random.Random, documents: list) -> list:
+    """
+    Extended properties for 200 documents, each statement with 50 transactions
+    """
+    return [make_props(rng, doc, 50) for doc in documents[:200]]
+
+
+@pytest.fixture(scope='session')
+def tables(rng: random.Random, documents: list) -> dict:
+    """
+    Five 500-row transaction tables, as stored in extendedprops.tables
+    """
+    return {f'table_{number}': make_transactions(rng, documents[number], 500) for number in range(5)}
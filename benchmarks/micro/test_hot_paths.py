@@ -0,0 +1,66 @@
+"""
+test_hot_paths.py - Micro-benchmarks for pure functions on hot request paths
+"""
+from datetime import datetime, timedelta
+import pytest
+from models.childsupport import ChildSupportGridRequest, ChildSupportRequest
+from util.childsupport import TxChildSupportCalculator, calculate_normalized
+
+
+def test_make_csv_tables(benchmark, tables):
+    from routers.documents import make_csv_tables
+    result = benchmark(make_csv_tables, tables)
+    assert len(result) == len(tables)
+
+
+def test_assemble_compliance_matrix(benchmark, documents):
+    from database.trackers_table import assemble_compliance_matrix
+    from util.compliance import get_compliance_config
+    rule = get_compliance_config().rules['Bank Statement']
+    docs = sorted(
+        (doc for doc in documents if doc['classification'] == 'Bank Statement'),
+        key=lambda doc: doc['document_date']
+    )
+    benchmark(assemble_compliance_matrix, docs, rule)
+
+
+@pytest.mark.parametrize('self_employed', [False, True])
+def test_child_support_calculate(benchmark, self_employed):
+    calculator = TxChildSupportCalculator()
+    request = ChildSupportRequest(
+        number_of_children=2, other_children=1, wage_income=2500.00, wage_income_frequency='biweekly',
+        nonwage_income=500.00, nonwage_income_frequency='monthly', self_employed=self_employed,
+        union_dues=40.00, health_insurance=350.00, mininum_wage=False,
+    )
+
+    def uncached():
+        calculate_normalized.cache_clear()
+        return (request,), {}
+
+    result = benchmark.pedantic(calculator.calculate, setup=uncached, rounds=2000)
+    assert result['child_support'] > 0
+
+
+def test_child_support_grid(benchmark):
+    calculator = TxChildSupportCalculator()
+    scenario = ChildSupportRequest(
+        number_of_children=1, other_children=0, wage_income=0.00, wage_income_frequency='monthly',
+        nonwage_income=0.00, nonwage_income_frequency='monthly', self_employed=False,
+        union_dues=0.00, health_insurance=350.00, mininum_wage=False,
+    )
+    request = ChildSupportGridRequest(
+        scenario=scenario, wage_income_min=0.00, wage_income_max=25000.00, wage_income_points=2500, children=[1, 2, 3, 4],
+    )
+    result = benchmark(calculator.calculate_grid, request)
+    assert result['count'] == 10000
+
+
+def test_decode_jwt(benchmark):
+    from jose import jwt
+    from auth.handler import JWT_ALGORITHM, JWT_SECRET_KEY, decode_jwt
+    token = jwt.encode(
+        {'sub': 'bench_user@bench.test', 'exp': datetime.utcnow() + timedelta(hours=1), 'is_admin': False},
+        JWT_SECRET_KEY, algorithm=JWT_ALGORITHM
+    )
+    result = benchmark(decode_jwt, token)
+    assert result['sub'] == 'bench_user@bench.test'
@@ -0,0 +1,42 @@
+"""
+test_model_parsing.py - Micro-benchmarks for parsing database records into models
+"""
+from typing import List
+from pydantic import TypeAdapter
+from models.document import Document, ExtendedDocumentProperties, PutExtendedDocumentProperties
+from models.tracker import Tracker
+
+
+def test_parse_documents(benchmark, documents):
+    adapter = TypeAdapter(List[Document])
+    result = benchmark(adapter.validate_python, documents)
+    assert len(result) == len(documents)
+
+
+def test_parse_tracker_with_10k_documents(benchmark, client):
+    record = {
+        'id': 'tracker-1',
+        'name': 'Benchmark Tracker',
+        'client_reference': client['billing_number'],
+        'client_id': client['id'],
+        'bates_pattern': None,
+        'documents': [f'doc-{number:05d}' for number in range(10000)],
+        'auth_usernames': ['bench_user@bench.test'],
+    }
+    result = benchmark(Tracker, **record)
+    assert len(result.documents) == 10000
+
+
+def test_parse_extended_properties(benchmark, props):
+    # ExtendedDocumentProperties' root_validator runs on every record
+    records = [{**prop, 'dict_tables': prop['tables']} for prop in props]
+    adapter = TypeAdapter(List[ExtendedDocumentProperties])
+    result = benchmark(adapter.validate_python, records)
+    assert len(result) == len(props)
+
+
+def test_parse_put_extended_properties(benchmark, props):
+    # PutExtendedDocumentProperties carries the tables, so this includes validating them
+    adapter = TypeAdapter(List[PutExtendedDocumentProperties])
+    result = benchmark(adapter.validate_python, props)
+    assert len(result) == len(props)
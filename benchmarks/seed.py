@@ -0,0 +1,310 @@
+"""
+seed.py - Fill a MongoDB database with synthetic case data for load benchmarks
+
+Creates a benchmark user, clients, trackers holding thousands of documents,
+extended properties with bank transaction tables, and discovery files with
+their requests. Everything is written straight to MongoDB with insert_many().
+
+The data goes in its own database (BENCH_DATABASE_NAME, default 'falcon_bench'),
+which is dropped first, so a real database is never touched.
+
+Usage:
+    python -m benchmarks.seed [--clients 3] [--documents 10000] [--transactions 25]
+"""
+import argparse
+from datetime import datetime, timedelta
+import os
+import random
+from typing import Iterator, List
+from uuid import uuid4
+from pymongo import MongoClient
+import settings  # NOQA
+
+
+BENCH_DATABASE_NAME = os.getenv('BENCH_DATABASE_NAME', 'falcon_bench')
+BENCH_USERNAME = 'bench_user@bench.test'
+INSERT_BATCH_SIZE = 1000
+
+INSTITUTIONS = ['Bank of America', 'Chase', 'Wells Fargo', 'Frost Bank', 'Fidelity', 'Charles Schwab']
+CLASSIFICATIONS = ['Bank Statement', 'Credit Card Statement', 'Brokerage Statement', 'Pay Stub', 'Tax Return']
+CATEGORIES = ['Deposit', 'Withdrawal', 'Purchase', 'Check', 'Transfer', 'Fee']
+DISCOVERY_TYPES = ['Request for Production', 'Interrogatories', 'Request for Admissions']
+
+
+def make_user() -> dict:
+    """
+    The user that the load benchmark signs in as
+    """
+    return {
+        'id': str(uuid4()),
+        'username': BENCH_USERNAME,
+        'email': BENCH_USERNAME,
+        'full_name': 'Benchmark User',
+        'disabled': False,
+        'admin': False,
+        'version': str(uuid4()),
+    }
+
+
+def make_client(number: int) -> dict:
+    """
+    A client the benchmark user is authorized for
+    """
+    return {
+        'id': str(uuid4()),
+        'name': f'Client {number:04d}',
+        'billing_number': f'BENCH{number:04d}',
+        'created_by': BENCH_USERNAME,
+        'authorized_users': [BENCH_USERNAME],
+        'enabled': True,
+        'version': str(uuid4()),
+        'us_state': 'TX',
+        'county': 'Collin',
+        'matter_type': 'DIVC',
+    }
+
+
+def make_document(rng: random.Random, client: dict, number: int) -> dict:
+    """
+    A produced document, shaped like the records in the documents collection
+    """
+    start = datetime(2019, 1, 1)
+    document_date = start + timedelta(days=30 * (number % 60) + rng.randint(0, 27))
+    classification = rng.choice(CLASSIFICATIONS)
+    pages = rng.randint(1, 12)
+    return {
+        'id': str(uuid4()),
+        'path': f"x:\\shared\\plano\\open\\{client['billing_number']}\\discovery\\production\\{number:06d}.pdf",
+        'filename': f'{number:06d}.pdf',
+        'type': 'application/pdf',
+        'title': f'{classification} {document_date:%Y.%m.%d}',
+        'create_date': f'{document_date:%Y-%m-%d}',
+        'document_date': f'{document_date:%Y-%m-%d}',
+        'beginning_bates': f"{client['billing_number']}{number * 12:07d}",
+        'ending_bates': f"{client['billing_number']}{number * 12 + pages - 1:07d}",
+        'page_count': pages,
+        'client_reference': client['billing_number'],
+        'added_username': BENCH_USERNAME,
+        'added_date': start + timedelta(minutes=number),
+        'updated_username': BENCH_USERNAME,
+        'updated_date': start + timedelta(minutes=number),
+        'version': str(uuid4()),
+        'classification': classification,
+        'sub_classification': {
+            'institution': rng.choice(INSTITUTIONS),
+            'account': f'{rng.randint(0, 5):04d}',
+        },
+        'page_max': pages,
+        'missing_pages': '',
+        'produced_date': '2024-02-01',
+    }
+
+
+def make_transactions(rng: random.Random, document: dict, count: int) -> List[dict]:
+    """
+    A bank statement's transaction table
+    """
+    rows = []
+    for number in range(count):
+        category = rng.choice(CATEGORIES)
+        rows.append({
+            'Date': document['document_date'],
+            'Description': f'{category} {number}',
+            'Amount': f'{rng.uniform(1, 5000):.2f}',
+            'Category': category,
+            'Cash Back': f'{rng.choice([20, 40, 60]):.2f}' if category == 'Purchase' and rng.random() < 0.1 else '',
+            'Transfer from': rng.choice(INSTITUTIONS) if category == 'Transfer' else '',
+            'Transfer to': rng.choice(INSTITUTIONS) if category == 'Transfer' else '',
+        })
+    return rows
+
+
+def make_props(rng: random.Random, document: dict, transactions: int) -> dict:
+    """
+    Extended properties for a document, with its text and tables
+    """
+    tables = {}
+    if document['classification'] in ('Bank Statement', 'Credit Card Statement'):
+        tables['transactions'] = make_transactions(rng, document, transactions)
+    return {
+        'id': document['id'],
+        'text': f"{document['title']} " * 200,
+        'clean_text': f"{document['title']} " * 150,
+        'props': {'institution': document['sub_classification']['institution']},
+        'version': str(uuid4()),
+        'extraction_type': 'textract',
+        'job_status': 'SUCCEEDED',
+        'pages': document['page_count'],
+        'tables': tables,
+        'has_tables': bool(tables),
+    }
+
+
+def make_tracker(client: dict, document_ids: List[str], number: int) -> dict:
+    """
+    A tracker holding a client's documents
+    """
+    now = datetime(2024, 1, 1)
+    return {
+        'id': str(uuid4()),
+        'name': f"{client['name']} - Production {number}",
+        'client_reference': client['billing_number'],
+        'client_id': client['id'],
+        'bates_pattern': f"{client['billing_number']}\\d{{7}}",
+        'documents': document_ids,
+        'added_username': BENCH_USERNAME,
+        'added_date': now,
+        'updated_username': BENCH_USERNAME,
+        'updated_date': now,
+        'auth_usernames': [BENCH_USERNAME],
+        'version': str(uuid4()),
+    }
+
+
+def make_discovery_file(client: dict, number: int) -> dict:
+    """
+    A set of discovery requests served on the client
+    """
+    return {
+        'id': str(uuid4()),
+        'client_id': client['id'],
+        'discovery_type': DISCOVERY_TYPES[number % len(DISCOVERY_TYPES)],
+        'service_date': '2024-01-15',
+        'due_date': '2024-02-14',
+        'party_name': 'Respondent',
+        'created_by': BENCH_USERNAME,
+        'create_date': '2024-01-16',
+        'version': str(uuid4()),
+    }
+
+
+def make_discovery_request(file: dict, number: int) -> dict:
+    """
+    One numbered request in a discovery file
+    """
+    return {
+        'id': str(uuid4()),
+        'file_id': file['id'],
+        'request_number': number,
+        'request_text': f'Produce all statements for every account held by you from 2019 to present. ({number})',
+        'lookback_date': '2019-01-01',
+        'interpretations': [],
+        'privileges': [],
+        'objections': [],
+        'responsive_classifications': ['Bank Statement'],
+        'created_by': BENCH_USERNAME,
+        'create_date': '2024-01-16',
+        'version': str(uuid4()),
+    }
+
+
+def batched(records: Iterator[dict], size: int = INSERT_BATCH_SIZE) -> Iterator[List[dict]]:
+    """
+    Group records for insert_many()
+    """
+    batch = []
+    for record in records:
+        batch.append(record)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def seed(
+    db_url: str,
+    database_name: str = BENCH_DATABASE_NAME,
+    clients: int = 3,
+    trackers_per_client: int = 1,
+    documents: int = 10000,
+    transactions: int = 25,
+    discovery_files: int = 4,
+    requests_per_file: int = 60,
+    random_seed: int = 1,
+) -> dict:
+    """
+    Drop the benchmark database and fill it with synthetic data
+
+    Args:
+        db_url (str): MongoDB connection string
+        database_name (str): Database to fill. It is dropped first.
+        clients (int): Number of clients
+        trackers_per_client (int): Trackers for each client
+        documents (int): Documents in each tracker
+        transactions (int): Rows in each statement's transaction table
+        discovery_files (int): Discovery files for each client
+        requests_per_file (int): Requests in each discovery file
+        random_seed (int): Seed, so that runs are repeatable
+
+    Returns:
+        dict: The ids the load benchmark needs, and the number of records written
+    """
+    rng = random.Random(random_seed)
+    conn = MongoClient(db_url)
+    conn.drop_database(database_name)
+    db = conn[database_name]
+
+    user = make_user()
+    db['users'].insert_one(user)
+    manifest = {'database': database_name, 'username': BENCH_USERNAME, 'clients': [], 'counts': {}}
+    counts = {'clients': 0, 'trackers': 0, 'documents': 0, 'extendedprops': 0, 'discovery_files': 0, 'discovery_requests': 0}
+
+    for client_number in range(clients):
+        client = make_client(client_number)
+        db['clients'].insert_one(client)
+        counts['clients'] += 1
+        client_entry = {'id': client['id'], 'billing_number': client['billing_number'], 'trackers': [], 'documents': [], 'discovery_files': []}
+
+        for tracker_number in range(trackers_per_client):
+            first = (client_number * trackers_per_client + tracker_number) * documents
+            docs = [make_document(rng, client, first + number) for number in range(documents)]
+            for batch in batched(iter(docs)):
+                db['documents'].insert_many(batch, ordered=False)
+            for batch in batched(make_props(rng, doc, transactions) for doc in docs):
+                db['extendedprops'].insert_many(batch, ordered=False)
+            tracker = make_tracker(client, [doc['id'] for doc in docs], tracker_number)
+            db['trackers'].insert_one(tracker)
+            counts['trackers'] += 1
+            counts['documents'] += len(docs)
+            counts['extendedprops'] += len(docs)
+            client_entry['trackers'].append(tracker['id'])
+            client_entry['documents'].extend(doc['id'] for doc in rng.sample(docs, min(200, len(docs))))
+
+        for file_number in range(discovery_files):
+            file = make_discovery_file(client, file_number)
+            db['discovery_files'].insert_one(file)
+            db['discovery_requests'].insert_many(
+                [make_discovery_request(file, number + 1) for number in range(requests_per_file)], ordered=False
+            )
+            counts['discovery_files'] += 1
+            counts['discovery_requests'] += requests_per_file
+            client_entry['discovery_files'].append(file['id'])
+        manifest['clients'].append(client_entry)
+
+    manifest['counts'] = counts
+    return manifest
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--db-url', default=os.getenv('DB_URL', 'mongodb://localhost:27017'))
+    parser.add_argument('--database', default=BENCH_DATABASE_NAME)
+    parser.add_argument('--clients', type=int, default=3)
+    parser.add_argument('--trackers-per-client', type=int, default=1)
+    parser.add_argument('--documents', type=int, default=10000, help='Documents per tracker')
+    parser.add_argument('--transactions', type=int, default=25, help='Transaction rows per statement')
+    parser.add_argument('--discovery-files', type=int, default=4, help='Discovery files per client')
+    parser.add_argument('--requests-per-file', type=int, default=60)
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    manifest = seed(
+        args.db_url, args.database, args.clients, args.trackers_per_client, args.documents,
+        args.transactions, args.discovery_files, args.requests_per_file, args.seed,
+    )
+    print(f"Seeded {args.database}: {manifest['counts']}")
+
+
+if __name__ == '__main__':
+    main()
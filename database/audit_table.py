@@ -1,11 +1,31 @@
 """
 audit_table.py - Audit Table
 """
-from database.db import Database
+from datetime import datetime
+import os
+import queue
+from threading import Event, Lock, Thread
+from time import monotonic
+from typing import List
+from pymongo import ASCENDING, DESCENDING
+from pymongo.errors import OperationFailure
+from database.db import Database, validated_models
 from models.audit import Audit
+from util.log_util import get_logger
 
 
 COLLECTION = 'auditlog'
+LOGGER = get_logger('falconapi/audit_table.py')
+
+AUDIT_BATCH_SIZE = int(os.getenv('AUDIT_BATCH_SIZE', '100'))
+AUDIT_FLUSH_INTERVAL = float(os.getenv('AUDIT_FLUSH_INTERVAL', '2.0'))          # seconds
+AUDIT_QUEUE_SIZE = int(os.getenv('AUDIT_QUEUE_SIZE', '10000'))
+AUDIT_RETENTION_DAYS = int(os.getenv('AUDIT_RETENTION_DAYS', '365'))            # 0 keeps audit events forever
+AUDIT_ROLLUP_MAX_KEYS = int(os.getenv('AUDIT_ROLLUP_MAX_KEYS', '10000'))       # flush rollups early past this many counters
+MAX_AUDIT_QUERY_LIMIT = 1000
+
+TTL_INDEX = 'event_date_ttl'
+INDEX_OPTIONS_CONFLICT = 85
 
 
 class AuditTable(Database):
@@ -25,3 +45,285 @@ class AuditTable(Database):
         """
         r = self.collection.insert_one(audit_event.dict())
         return r
+
+    def create_events(self, audit_events: List[dict]) -> dict:
+        """
+        Create many audit documents in the database with one statement
+
+        Args:
+            audit_events (List[dict]): Audit records, already converted to dicts
+
+        Returns:
+            dict: The result of the insert operation
+        """
+        return self.collection.insert_many(audit_events, ordered=False)
+
+    def ensure_indexes(self, retention_days: int = AUDIT_RETENTION_DAYS) -> None:
+        """
+        Create the audit log's indexes and apply the retention period
+
+        MongoDB's TTL monitor deletes events once they are older than
+        retention_days. Changing AUDIT_RETENTION_DAYS updates the existing
+        TTL index in place.
+
+        Args:
+            retention_days (int): Days to keep audit events. 0 keeps them forever.
+        """
+        self.collection.create_index([('record_id', ASCENDING), ('event_date', DESCENDING)], name='record_id_event_date')
+        self.collection.create_index([('username', ASCENDING), ('event_date', DESCENDING)], name='username_event_date')
+
+        if retention_days <= 0:
+            if TTL_INDEX in self.collection.index_information():
+                self.collection.drop_index(TTL_INDEX)
+            self.collection.create_index([('event_date', DESCENDING)], name='event_date')
+            return
+
+        expire_after = retention_days * 24 * 60 * 60
+        try:
+            self.collection.create_index([('event_date', ASCENDING)], name=TTL_INDEX, expireAfterSeconds=expire_after)
+        except OperationFailure as e:
+            if e.code != INDEX_OPTIONS_CONFLICT:
+                raise
+            self.conn[self.database].command(
+                'collMod', COLLECTION,
+                index={'name': TTL_INDEX, 'expireAfterSeconds': expire_after}
+            )
+
+    def query(
+        self,
+        record_id: str = None,
+        username: str = None,
+        start_date: datetime = None,
+        end_date: datetime = None,
+        limit: int = 100,
+        skip: int = 0,
+    ) -> List[Audit]:
+        """
+        Find audit events, newest first
+
+        Args:
+            record_id (str): Only events for this record
+            username (str): Only events by this user
+            start_date (datetime): Only events on or after this date
+            end_date (datetime): Only events before this date
+            limit (int): Maximum number of events to return
+            skip (int): Number of events to skip, for paging
+
+        Returns:
+            List[Audit]: The events
+        """
+        query = {}
+        if record_id is not None:
+            query['record_id'] = record_id
+        if username is not None:
+            query['username'] = username
+        if start_date or end_date:
+            query['event_date'] = {}
+            if start_date:
+                query['event_date']['$gte'] = start_date
+            if end_date:
+                query['event_date']['$lt'] = end_date
+        limit = max(1, min(limit, MAX_AUDIT_QUERY_LIMIT))
+        cursor = self.collection.find(query, {'_id': 0}) \
+            .sort('event_date', DESCENDING) \
+            .skip(max(0, skip)) \
+            .limit(limit)
+        return validated_models(Audit, cursor)
+
+
+class AuditWriter():
+    """
+    Background audit sink
+
+    Requests put audit events on a bounded in-memory queue and return right away.
+    A background thread writes them with insert_many() whenever batch_size events
+    are waiting or flush_interval seconds have passed, whichever comes first.
+
+    If the database falls behind and the queue fills up, write() drops the event
+    and counts it rather than make the request wait.
+
+    Successful reads go through rollup() instead of write(). They are counted in
+    memory per (user, record, event, minute) and each counter is written as one
+    rollup event, with a count, after its minute has ended.
+
+    Call close() on shutdown to write whatever is still queued.
+    """
+    STOP = object()
+
+    def __init__(
+        self,
+        table: AuditTable = None,
+        batch_size: int = AUDIT_BATCH_SIZE,
+        flush_interval: float = AUDIT_FLUSH_INTERVAL,
+        max_queue_size: int = AUDIT_QUEUE_SIZE,
+        max_rollup_keys: int = AUDIT_ROLLUP_MAX_KEYS,
+    ) -> None:
+        self.table = table or AuditTable()
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_rollup_keys = max_rollup_keys
+        self.rollups = {}  # (table, record_id, username, admin_user, description, old_data, message, minute) -> count
+        self.queue = queue.Queue(maxsize=max_queue_size)
+        self.lock = Lock()
+        self.thread = None
+        self.closed = Event()
+        self.stats = {'enqueued': 0, 'written': 0, 'dropped': 0, 'failed': 0, 'flushes': 0, 'rolled_up': 0}
+
+    def start(self) -> None:
+        """
+        Start the background thread if it is not running
+        """
+        with self.lock:
+            if self.thread is None or not self.thread.is_alive():
+                self.closed.clear()
+                self.thread = Thread(target=self.run, name='audit-writer', daemon=True)
+                self.thread.start()
+
+    def write(self, audit_event: Audit) -> bool:
+        """
+        Queue an audit event to be written
+
+        Args:
+            audit_event (Audit): The event
+
+        Returns:
+            bool: True if the event was queued, False if it was dropped
+        """
+        if self.closed.is_set():
+            self.count('dropped')
+            return False
+        if self.thread is None:
+            self.start()
+        try:
+            self.queue.put_nowait(audit_event.model_dump())
+        except queue.Full:
+            self.count('dropped')
+            LOGGER.debug("Audit queue is full, dropped event: %s %s", audit_event.description, audit_event.record_id)
+            return False
+        self.count('enqueued')
+        return True
+
+    def rollup(self, audit_event: Audit) -> None:
+        """
+        Count a read event toward its per-minute rollup
+
+        Args:
+            audit_event (Audit): The event
+        """
+        if self.closed.is_set():
+            self.count('dropped')
+            return
+        if self.thread is None:
+            self.start()
+        minute = audit_event.event_date.replace(second=0, microsecond=0)
+        key = (
+            audit_event.table, audit_event.record_id, audit_event.username, audit_event.admin_user,
+            audit_event.description, audit_event.old_data, audit_event.message, minute
+        )
+        with self.lock:
+            self.rollups[key] = self.rollups.get(key, 0) + 1
+            self.stats['rolled_up'] += 1
+
+    def take_rollups(self, everything: bool = False) -> List[dict]:
+        """
+        Remove finished rollup counters and turn them into audit records
+
+        Args:
+            everything (bool): Also take the counters for the current minute
+
+        Returns:
+            List[dict]: Audit records with a count
+        """
+        with self.lock:
+            if not self.rollups:
+                return []
+            everything = everything or len(self.rollups) >= self.max_rollup_keys
+            current_minute = datetime.now().replace(second=0, microsecond=0)
+            keys = [key for key in self.rollups if everything or key[-1] < current_minute]
+            counts = [(key, self.rollups.pop(key)) for key in keys]
+        records = []
+        for (table, record_id, username, admin_user, description, old_data, message, minute), count in counts:
+            records.append(Audit(
+                description=description,
+                table=table,
+                record_id=record_id,
+                username=username,
+                admin_user=admin_user,
+                event_date=minute,
+                success=True,
+                message=message,
+                old_data=old_data,
+                count=count
+            ).model_dump())
+        return records
+
+    def run(self) -> None:
+        """
+        Background thread: collect events into batches and write them
+        """
+        try:
+            self.table.ensure_indexes()
+        except Exception as e:
+            LOGGER.error("Error creating audit log indexes: %s", e)
+        batch = []
+        deadline = monotonic() + self.flush_interval
+        while True:
+            try:
+                item = self.queue.get(timeout=max(0.0, deadline - monotonic()))
+            except queue.Empty:
+                item = None
+            if item is AuditWriter.STOP:
+                self.flush(batch + self.take_rollups(everything=True))
+                return
+            if item is not None:
+                batch.append(item)
+            if len(batch) >= self.batch_size or monotonic() >= deadline:
+                self.flush(batch + self.take_rollups())
+                batch = []
+                deadline = monotonic() + self.flush_interval
+
+    def flush(self, batch: List[dict]) -> None:
+        """
+        Write a batch of events
+        """
+        if not batch:
+            return
+        try:
+            self.table.create_events(batch)
+            self.count('written', len(batch))
+        except Exception as e:
+            self.count('failed', len(batch))
+            LOGGER.error("Error writing %d audit events: %s", len(batch), e)
+        self.count('flushes')
+
+    def close(self, timeout: float = 10.0) -> None:
+        """
+        Write everything that is queued and stop the background thread
+
+        Args:
+            timeout (float): Seconds to wait for the queue to drain
+        """
+        self.closed.set()
+        thread = self.thread
+        if thread is None or not thread.is_alive():
+            return
+        try:
+            self.queue.put(AuditWriter.STOP, timeout=timeout)
+        except queue.Full:
+            LOGGER.error("Audit queue did not drain before shutdown; %d events lost", self.queue.qsize())
+            return
+        thread.join(timeout)
+
+    def count(self, name: str, amount: int = 1) -> None:
+        """
+        Increment one of the counters
+        """
+        with self.lock:
+            self.stats[name] += amount
+
+    def snapshot(self) -> dict:
+        """
+        Return the counters and the current queue depth
+        """
+        with self.lock:
+            return {**self.stats, 'queued': self.queue.qsize(), 'rollup_keys': len(self.rollups)}
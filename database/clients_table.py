@@ -3,7 +3,7 @@ users_table.py - Users Table
 """
 from typing import List
 from uuid import uuid4
-from database.db import Database
+from database.db import Database, validated_models
 from models.client import Client
 from pymongo.results import InsertOneResult, UpdateResult  # NOQA
 
@@ -46,6 +46,32 @@ class ClientsTable(Database):
         Returns:
             List[Client]: The Client object if the client exists, empty list otherwise.
         """
+        client_docs = self.collection.find(self.client_query(client_id, billing_number, username))
+        return validated_models(Client, client_docs)
+
+    def get_client_versions(self, client_id: str = None, billing_number: str = None, username: str = None) -> List[dict]:
+        """
+        Get the id and version of the clients that get_clients() would return.
+
+        Args:
+            client_id (str): The client's ID. Use '*' to get all clients.
+            billing_number (str): The client's billing number.
+            username (str): The user's username.
+
+        Returns:
+            List[dict]: [{'id', 'version'}, ...]
+        """
+        query = self.client_query(client_id, billing_number, username)
+        return list(self.collection.find(query, {'_id': 0, 'id': 1, 'version': 1}))
+
+    def client_query(self, client_id: str = None, billing_number: str = None, username: str = None) -> dict:
+        """
+        Build the query used by get_clients() and get_client_versions()
+
+        Raises:
+            MissingSearchParamException: If neither client_id nor billing_number is given.
+            MissingUsernameException: If username is not given.
+        """
         if not client_id and not billing_number:
             raise MissingSearchParamException()
         if not username:
@@ -56,8 +82,7 @@ class ClientsTable(Database):
         if billing_number and not client_id:
             query['billing_number'] = billing_number
         query['$or'] = [{'created_by': username}, {'authorized_users': username.lower()}]
-        client_docs = self.collection.find(query)
-        return [Client(**client_doc) for client_doc in client_docs]
+        return query
     
     def get_authorized_clients(self, username: str) -> List[dict]:
         """
@@ -1,10 +1,313 @@
 """
 db.py - Database Access
 """
+from datetime import datetime
+from functools import lru_cache
+from hashlib import sha1
 import os
-from pymongo import MongoClient
+import queue
+import sys
+from threading import Lock, Thread
+from time import monotonic
+from typing import Iterable, List, Optional, Type, TypeVar
+from pydantic import BaseModel, TypeAdapter
+from pymongo import ASCENDING, MongoClient, monitoring
 import settings  # NOQA
 from util.log_util import get_logger
+from util.metrics import METRICS_ENABLED, MongoMetricsListener, MongoPoolMetricsListener
+from util.tracing import MongoTracingListener, TRACING_ENABLED
+
+LOGGER = get_logger('falconapi/db.py')
+
+# Records were validated when they were written, so trusted_model() and
+# trusted_models() build models from them without validating again.
+# Set VALIDATE_DB_READS=true to validate every read, e.g. while debugging a migration.
+#
+# model_construct() runs in Python, so it only beats pydantic's compiled validator
+# for records that carry large lists, like a tracker's documents. Flat records
+# are cheaper to read in bulk with validated_models().
+VALIDATE_DB_READS = os.getenv('VALIDATE_DB_READS', 'False').lower() == 'true'
+
+ModelType = TypeVar('ModelType', bound=BaseModel)
+
+# Commands slower than SLOW_QUERY_MS are logged, and saved to the slow_queries
+# collection with the caller and a redacted filter. Slow find and aggregate
+# commands also get their explain() plan, at most once per query shape every
+# SLOW_QUERY_EXPLAIN_INTERVAL seconds. Set SLOW_QUERY_MS=0 to turn this off.
+SLOW_QUERY_MS = float(os.getenv('SLOW_QUERY_MS', '200'))
+SLOW_QUERY_EXPLAIN = os.getenv('SLOW_QUERY_EXPLAIN', 'True').lower() == 'true'
+SLOW_QUERY_EXPLAIN_INTERVAL = float(os.getenv('SLOW_QUERY_EXPLAIN_INTERVAL', '300'))    # seconds
+SLOW_QUERY_RETENTION_DAYS = int(os.getenv('SLOW_QUERY_RETENTION_DAYS', '30'))
+SLOW_QUERY_COLLECTION = 'slow_queries'
+SLOW_QUERY_QUEUE_SIZE = 1000
+
+# Commands we time, and the part of each that holds the filter or pipeline
+SLOW_QUERY_COMMANDS = {
+    'find': 'filter',
+    'aggregate': 'pipeline',
+    'count': 'query',
+    'distinct': 'query',
+    'findAndModify': 'query',
+    'update': 'updates',
+    'delete': 'deletes',
+}
+EXPLAINABLE_COMMANDS = {'find', 'aggregate'}
+# Session and cluster fields that pymongo adds to a command; explain() rejects them
+COMMAND_ENVELOPE_FIELDS = {'$db', 'lsid', '$clusterTime', '$readPreference', 'txnNumber', 'autocommit', 'startTransaction'}
+
+
+@lru_cache(maxsize=None)
+def list_adapter(model: Type[BaseModel]) -> TypeAdapter:
+    """
+    Compiled validator for a list of models, built once per model class
+    """
+    return TypeAdapter(List[model])
+
+
+def validated_models(model: Type[ModelType], records: Iterable[dict]) -> List[ModelType]:
+    """
+    Validate a batch of database records in one call to the compiled validator
+
+    Args:
+        model (Type[BaseModel]): The model class the records were written from
+        records (Iterable[dict]): The records or a cursor over them
+
+    Returns:
+        List[BaseModel]: The models
+    """
+    return list_adapter(model).validate_python(list(records))
+
+
+def trusted_model(model: Type[ModelType], record: dict) -> ModelType:
+    """
+    Build a model from a database record without re-validating it
+
+    Args:
+        model (Type[BaseModel]): The model class the record was written from
+        record (dict): The record read from the database
+
+    Returns:
+        BaseModel: The model, or None if there is no record
+    """
+    if record is None:
+        return None
+    if VALIDATE_DB_READS:
+        return model(**record)
+    return model.model_construct(**record)
+
+
+def trusted_models(model: Type[ModelType], records: Iterable[dict]) -> List[ModelType]:
+    """
+    Build a list of models from database records without re-validating them
+
+    Args:
+        model (Type[BaseModel]): The model class the records were written from
+        records (Iterable[dict]): The records or a cursor over them
+
+    Returns:
+        List[BaseModel]: The models
+    """
+    if VALIDATE_DB_READS:
+        return validated_models(model, records)
+    construct = model.model_construct
+    return [construct(**record) for record in records]
+
+
+def query_shape(value):
+    """
+    Redact a filter or pipeline down to its shape
+
+    Field names and operators are kept; values are replaced with their type
+    name, so client data never reaches the slow query log.
+
+    Args:
+        value: A filter, pipeline, or any part of one
+
+    Returns:
+        The same structure with every value replaced
+    """
+    if isinstance(value, dict):
+        return {key: query_shape(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        if value and all(isinstance(item, (dict, list, tuple)) for item in value):
+            return [query_shape(item) for item in value]
+        return [type(value[0]).__name__] if value else []
+    if value is None:
+        return None
+    return type(value).__name__
+
+
+def documents_returned(command_name: str, reply: dict) -> Optional[int]:
+    """
+    Number of documents a command returned or touched, from its reply
+    """
+    cursor = reply.get('cursor')
+    if isinstance(cursor, dict):
+        return len(cursor.get('firstBatch', []))
+    if command_name == 'distinct':
+        return len(reply.get('values', []))
+    if 'n' in reply:
+        return reply['n']
+    return None
+
+
+def calling_table_method() -> str:
+    """
+    Find the table method that issued the current database command
+
+    pymongo publishes command events on the calling thread, so the caller is
+    still on the stack: it is the innermost frame in database/ outside db.py.
+
+    Returns:
+        str: 'ClassName.method', or 'unknown'
+    """
+    database_dir = os.path.dirname(os.path.abspath(__file__))
+    this_file = os.path.abspath(__file__)
+    frame = sys._getframe(1)
+    while frame is not None:
+        filename = os.path.abspath(frame.f_code.co_filename)
+        if filename != this_file and os.path.dirname(filename) == database_dir:
+            owner = frame.f_locals.get('self')
+            if owner is not None:
+                return f"{type(owner).__name__}.{frame.f_code.co_name}"
+            return f"{os.path.basename(filename)}:{frame.f_code.co_name}"
+        frame = frame.f_back
+    return 'unknown'
+
+
+class SlowQueryListener(monitoring.CommandListener):
+    """
+    pymongo command listener that records commands slower than a threshold
+
+    Timing happens on the calling thread and costs one dict operation per
+    command. Only slow commands are examined further. Saving them and running
+    explain() happens on a background thread.
+    """
+    def __init__(self, threshold_ms: float = SLOW_QUERY_MS, explain: bool = SLOW_QUERY_EXPLAIN) -> None:
+        self.threshold_micros = threshold_ms * 1000
+        self.explain = explain
+        self.lock = Lock()
+        self.commands = {}          # (connection_id, request_id) -> command
+        self.last_explained = {}    # query shape hash -> monotonic() of the last explain
+        self.queue = queue.Queue(maxsize=SLOW_QUERY_QUEUE_SIZE)
+        self.thread = None
+
+    def started(self, event: monitoring.CommandStartedEvent) -> None:
+        if event.command_name not in SLOW_QUERY_COMMANDS or event.command.get(event.command_name) == SLOW_QUERY_COLLECTION:
+            return
+        with self.lock:
+            self.commands[(event.connection_id, event.request_id)] = event.command
+
+    def succeeded(self, event: monitoring.CommandSucceededEvent) -> None:
+        self.finish(event, event.reply)
+
+    def failed(self, event: monitoring.CommandFailedEvent) -> None:
+        self.finish(event, {})
+
+    def finish(self, event, reply: dict) -> None:
+        """
+        Record the command if it was slow
+        """
+        if event.command_name not in SLOW_QUERY_COMMANDS:
+            return
+        with self.lock:
+            command = self.commands.pop((event.connection_id, event.request_id), None)
+        if command is None or event.duration_micros < self.threshold_micros:
+            return
+
+        collection = command.get(event.command_name)
+        shape = query_shape(command.get(SLOW_QUERY_COMMANDS[event.command_name]))
+        record = {
+            'event_date': datetime.utcnow(),
+            'database': event.database_name,
+            'collection': collection,
+            'command': event.command_name,
+            'duration_ms': round(event.duration_micros / 1000, 3),
+            'documents_returned': documents_returned(event.command_name, reply),
+            'caller': calling_table_method(),
+            'filter_shape': shape,
+            'shape_hash': sha1(repr((collection, event.command_name, shape)).encode('utf-8')).hexdigest(),
+            'success': isinstance(event, monitoring.CommandSucceededEvent),
+        }
+        LOGGER.warning(
+            "Slow query: %s %s.%s took %.1f ms (%s documents) from %s",
+            event.command_name, event.database_name, collection, record['duration_ms'],
+            record['documents_returned'], record['caller']
+        )
+        explain_command = None
+        if self.explain and event.command_name in EXPLAINABLE_COMMANDS and self.should_explain(record['shape_hash']):
+            explain_command = {key: value for key, value in command.items() if key not in COMMAND_ENVELOPE_FIELDS}
+        self.start()
+        try:
+            self.queue.put_nowait((record, explain_command))
+        except queue.Full:
+            LOGGER.debug("Slow query queue is full, not saving %s on %s", event.command_name, collection)
+
+    def should_explain(self, shape_hash: str) -> bool:
+        """
+        Explain each query shape at most once per SLOW_QUERY_EXPLAIN_INTERVAL
+        """
+        now = monotonic()
+        with self.lock:
+            last = self.last_explained.get(shape_hash)
+            if last is not None and now - last < SLOW_QUERY_EXPLAIN_INTERVAL:
+                return False
+            self.last_explained[shape_hash] = now
+            return True
+
+    def start(self) -> None:
+        """
+        Start the background thread if it is not running
+        """
+        with self.lock:
+            if self.thread is None or not self.thread.is_alive():
+                self.thread = Thread(target=self.run, name='slow-query-log', daemon=True)
+                self.thread.start()
+
+    def run(self) -> None:
+        """
+        Background thread: run explain() for slow queries and save them
+        """
+        collection = Database.conn[Database.database][SLOW_QUERY_COLLECTION]
+        try:
+            if SLOW_QUERY_RETENTION_DAYS > 0:
+                collection.create_index(
+                    [('event_date', ASCENDING)], name='event_date_ttl',
+                    expireAfterSeconds=SLOW_QUERY_RETENTION_DAYS * 24 * 60 * 60
+                )
+        except Exception as e:
+            LOGGER.error("Error creating slow query indexes: %s", e)
+        while True:
+            record, explain_command = self.queue.get()
+            if explain_command is not None:
+                try:
+                    plan = Database.conn[record['database']].command(
+                        {'explain': explain_command, 'verbosity': 'queryPlanner'}
+                    )
+                    record['explain'] = plan.get('queryPlanner', plan)
+                except Exception as e:
+                    record['explain_error'] = str(e)
+            try:
+                collection.insert_one(record)
+            except Exception as e:
+                LOGGER.error("Error saving slow query: %s", e)
+
+
+def command_listeners() -> list:
+    """
+    pymongo command listeners to attach to our MongoClient
+
+    Returns:
+        list: The listeners that are turned on
+    """
+    listeners = []
+    if TRACING_ENABLED:
+        listeners.append(MongoTracingListener())
+    if METRICS_ENABLED:
+        listeners.extend([MongoMetricsListener(), MongoPoolMetricsListener()])
+    if SLOW_QUERY_MS > 0:
+        listeners.append(SlowQueryListener())
+    return listeners
 
 
 class Database():
@@ -18,9 +321,28 @@ class Database():
         logger = get_logger('falconapi/db.py')
         db_url = os.getenv('DB_URL', 'mongodb://localhost:27017')
         if not Database.conn:
-            Database.conn = MongoClient(db_url)
-            logger.info("Connected to database at {}".format(db_url))
+            # connect=False: no connection is opened until the first command, so
+            # importing a module that creates a table does not touch the network.
+            Database.conn = MongoClient(db_url, connect=False, event_listeners=command_listeners())
+            logger.info("Created database client for {}".format(db_url))
         self.fail_silent = fail_silent
+
+    @classmethod
+    def ping(cls) -> None:
+        """
+        Open the connection pool and check that the server answers
+        """
+        if cls.conn is None:
+            Database()
+        cls.conn.admin.command('ping')
+
+    @classmethod
+    def close(cls) -> None:
+        """
+        Close the connection pool at shutdown. The client cannot be used afterwards.
+        """
+        if cls.conn is not None:
+            cls.conn.close()
     
     def insert_one_result(self, inserted_id: str = None) -> dict:
         """
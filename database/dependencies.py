@@ -0,0 +1,84 @@
+"""
+dependencies.py - Shared database tables, provided to routes with Depends
+
+Each table is created on first use, or by open_tables() when the app starts,
+not when a router module is imported. A route asks for the tables it needs:
+
+    async def get_tracker(tracker_id: str, tracker_db: TrackersTable = Depends(get_trackers_table)):
+
+and a test can swap one with app.dependency_overrides.
+"""
+from functools import lru_cache
+from database.audit_table import AuditTable, AuditWriter
+from database.clients_table import ClientsTable
+from database.documents_table import DocumentsDict
+from database.extendedprops_table import ExtendedPropertiesDict
+from database.trackers_table import TrackersTable
+from database.users_table import UsersTable
+
+
+@lru_cache(maxsize=1)
+def get_audit_table() -> AuditTable:
+    """
+    Dependency that returns the shared audit table
+    """
+    return AuditTable()
+
+
+@lru_cache(maxsize=1)
+def get_audit_writer() -> AuditWriter:
+    """
+    The shared background audit writer. The app's lifespan starts and closes it.
+    """
+    return AuditWriter(get_audit_table())
+
+
+@lru_cache(maxsize=1)
+def get_clients_table() -> ClientsTable:
+    """
+    Dependency that returns the shared clients table
+    """
+    return ClientsTable()
+
+
+@lru_cache(maxsize=1)
+def get_documents_table() -> DocumentsDict:
+    """
+    Dependency that returns the shared documents table
+    """
+    return DocumentsDict()
+
+
+@lru_cache(maxsize=1)
+def get_extended_properties() -> ExtendedPropertiesDict:
+    """
+    Dependency that returns the shared extended document properties table
+    """
+    return ExtendedPropertiesDict()
+
+
+@lru_cache(maxsize=1)
+def get_trackers_table() -> TrackersTable:
+    """
+    Dependency that returns the shared trackers table
+    """
+    return TrackersTable()
+
+
+@lru_cache(maxsize=1)
+def get_users_table() -> UsersTable:
+    """
+    Dependency that returns the shared users table
+    """
+    return UsersTable()
+
+
+def open_tables() -> None:
+    """
+    Create every shared table, so the first requests don't pay for it
+    """
+    for provider in (
+        get_audit_table, get_audit_writer, get_clients_table, get_documents_table,
+        get_extended_properties, get_trackers_table, get_users_table,
+    ):
+        provider()
@@ -4,11 +4,10 @@ discovery_files_table.py - DiscoveryFiles Table
 from datetime import datetime
 from typing import List
 from uuid import uuid4
-from database.db import Database
+from database.db import Database, validated_models
 from models.discovery_requests import DiscoveryFile, DiscoveryFileSummary
 from database.clients_table import ClientsTable
 
-from falconlogger.flogger import FalconLogger
 
 COLLECTION = 'discovery_files'
 
@@ -82,6 +81,24 @@ class DiscoveryFileTable(Database):
             return None
         return DiscoveryFile(**discovery_file)
     
+    def get_version(self, discovery_file_id: str, username: str) -> str:
+        """
+        Get a discovery file's version without reading the rest of it
+
+        Args:
+            discovery_file_id (str): The discovery file's ID.
+            username (str): The user's username.
+
+        Returns:
+            str: The version if the discovery file exists and the user may see it, None otherwise.
+        """
+        discovery_file = self.collection.find_one({'id': discovery_file_id}, {'_id': 0, 'client_id': 1, 'version': 1})
+        if not discovery_file:
+            return None
+        if not self.is_authorized(username, discovery_file.get('client_id')):
+            return None
+        return discovery_file.get('version')
+
     def get_all(self, client_id: str, username: str) -> List[DiscoveryFile]:
         """
         Get all discovery files from the database
@@ -126,7 +143,7 @@ class DiscoveryFileTable(Database):
 
         # Convert the result to a list
         # result_list = list(result)
-        return [DiscoveryFileSummary(**discovery_file) for discovery_file in discovery_files]
+        return validated_models(DiscoveryFileSummary, discovery_files)
     
     def update(self, discovery_file: DiscoveryFile, username: str) -> dict:
         """
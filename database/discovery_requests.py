@@ -5,11 +5,10 @@ from datetime import datetime
 from functools import lru_cache
 from typing import List
 from uuid import uuid4
-from database.db import Database
+from database.db import Database, validated_models
 from models.discovery_requests import DiscoveryRequest
 from database.clients_table import ClientsTable
 
-from falconlogger.flogger import FalconLogger
 
 COLLECTION = 'discovery_requests'
 
@@ -56,6 +55,39 @@ class DiscoveryRequestsTable(Database):
             return None
         return DiscoveryRequest(**request)
     
+    def get_version(self, request_id: str, username: str) -> str:
+        """
+        Get a discovery request's version without reading the rest of it.
+
+        Args:
+            request_id (str): The request ID.
+            username (str): The user's username.
+
+        Returns:
+            str: The version if the request exists and the user may see it, None otherwise.
+        """
+        request = self.collection.find_one({'id': request_id}, {'_id': 0, 'file_id': 1, 'version': 1})
+        if not request:
+            return None
+        if not self.is_authorized(username, client_id=self.client_id(request.get('file_id'))):
+            return None
+        return request.get('version')
+
+    def get_versions(self, file_id: str, username: str) -> List[dict]:
+        """
+        Get the id and version of every discovery request for a discovery file.
+
+        Args:
+            file_id (str): The discovery file's ID.
+            username (str): The user's username.
+
+        Returns:
+            List[dict]: [{'id', 'version'}, ...] for the requests get_all() returns.
+        """
+        if not self.is_authorized(username, self.client_id(file_id)):
+            return []
+        return list(self.collection.find({'file_id': file_id}, {'_id': 0, 'id': 1, 'version': 1}))
+
     def get_all(self, file_id: str, username: str) -> List[DiscoveryRequest]:
         """
         Get a list of all discovery requests for the specified discovery file.
@@ -71,7 +103,7 @@ class DiscoveryRequestsTable(Database):
         if not self.is_authorized(username, client_id):
             return []
         requests = self.collection.find({'file_id': file_id})
-        return [DiscoveryRequest(**request) for request in requests]
+        return validated_models(DiscoveryRequest, requests)
 
     def add(self, request: DiscoveryRequest, username: str) -> dict:
         """
@@ -5,8 +5,8 @@ from typing import List
 from database.db import Database
 from models.document import Document
 from models.tracker import Tracker
-
-from falconlogger.flogger import FalconLogger
+from util.log_util import get_logger
+from util.responses import model_projection, with_model_defaults
 
 COLLECTION = 'documents'
 
@@ -17,7 +17,7 @@ class DocumentsDict(dict):
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
         self.documents = DocumentsTable()
-        self.logger = FalconLogger('falconapi/DocumentsDict')
+        self.logger = get_logger('falconapi/DocumentsDict')
 
     def __getitem__(self, key):
         return self.documents.get_document(key)
@@ -61,6 +61,36 @@ class DocumentsDict(dict):
     def get(self, key, default=None):
         return self.documents.get_document(key) or default
     
+    def get_version_info(self, key: str, field: str = 'id') -> dict:
+        """
+        Get just a document's version and owner
+        """
+        return self.documents.get_version_info(key, field)
+
+    def get_versions(self, ids: List[str], username: str = None) -> dict:
+        """
+        Get the versions of many documents
+        """
+        return self.documents.get_versions(ids, username)
+
+    def get_many(self, ids: List[str], username: str = None) -> List[dict]:
+        """
+        Get many documents
+        """
+        return self.documents.get_documents(ids, username)
+
+    def get_owners(self, ids: List[str]) -> dict:
+        """
+        Get the user who added each of many documents
+        """
+        return self.documents.get_owners(ids)
+
+    def delete_many(self, ids: List[str]) -> int:
+        """
+        Delete many documents
+        """
+        return self.documents.delete_documents(ids)
+
     def get_by_path(self, path: str) -> Document:
         """
         Get document by path
@@ -72,6 +102,12 @@ class DocumentsDict(dict):
         Get all documents for a tracker
         """
         return self.documents.get_documents_for_tracker(tracker)
+
+    def get_ids_for_tracker(self, tracker: Tracker, missing_field: str = None) -> List[str]:
+        """
+        Get the ids of a tracker's documents, optionally only those without a value in missing_field
+        """
+        return self.documents.get_document_ids_for_tracker(tracker, missing_field)
     
     def get_categories_for_tracker(self, tracker) -> List[str]:
         """
@@ -97,7 +133,7 @@ class DocumentsTable(Database):
         super().__init__()
         self.collection = self.conn[self.database][COLLECTION]
         self.xprops = self.conn[self.database]['extendedprops']
-        self.logger = FalconLogger('falconapi/DocumentsTable')
+        self.logger = get_logger('falconapi/DocumentsTable')
 
     def get_document(self, id: str) -> Document:
         """
@@ -106,6 +142,66 @@ class DocumentsTable(Database):
         document_doc = self.collection.find_one({'id': id})
         return Document(**document_doc) if document_doc else None
 
+    def get_version_info(self, key: str, field: str = 'id') -> dict:
+        """
+        Get a document's id, version and owner without reading the rest of it
+
+        Args:
+            key (str): The value to look for
+            field (str): The field to look in, 'id' or 'path'
+
+        Returns:
+            dict: {'id', 'version', 'added_username'} or None if there is no such document
+        """
+        return self.collection.find_one({field: key}, {'_id': 0, 'id': 1, 'version': 1, 'added_username': 1})
+
+    def get_versions(self, ids: List[str], username: str = None) -> dict:
+        """
+        Get the versions of many documents with one projected query
+
+        Args:
+            ids (List[str]): The document ids
+            username (str): Only include documents added by this user. None for all documents.
+
+        Returns:
+            dict: document id -> version for each document found
+        """
+        query = {'id': {'$in': ids}}
+        if username:
+            query['added_username'] = username
+        return {doc['id']: doc.get('version') for doc in self.collection.find(query, {'_id': 0, 'id': 1, 'version': 1})}
+
+    def get_owners(self, ids: List[str]) -> dict:
+        """
+        Get the user who added each of many documents with one projected query
+
+        Args:
+            ids (List[str]): The document ids
+
+        Returns:
+            dict: document id -> added_username for each document found
+        """
+        return {doc['id']: doc.get('added_username') for doc in self.collection.find({'id': {'$in': ids}}, {'_id': 0, 'id': 1, 'added_username': 1})}
+
+    def get_documents(self, ids: List[str], username: str = None) -> List[dict]:
+        """
+        Get many documents with one query
+
+        The documents are returned as dicts with exactly the fields of the Document
+        model so that they can be returned without re-validation.
+
+        Args:
+            ids (List[str]): The document ids
+            username (str): Only include documents added by this user. None for all documents.
+
+        Returns:
+            List[dict]: The documents that were found
+        """
+        query = {'id': {'$in': ids}}
+        if username:
+            query['added_username'] = username
+        return with_model_defaults(Document, self.collection.find(query, model_projection(Document)))
+
     def create_document(self, document: Document) -> dict:
         """
         Create a document in the database
@@ -151,6 +247,18 @@ class DocumentsTable(Database):
         """
         return self.collection.delete_one({'id': id})
 
+    def delete_documents(self, ids: List[str]) -> int:
+        """
+        Delete many documents from the database with one statement
+
+        Args:
+            ids (List[str]): The ids of the documents to delete
+
+        Returns:
+            int: The number of documents deleted
+        """
+        return self.collection.delete_many({'id': {'$in': ids}}).deleted_count
+
     def get_all_documents(self) -> list:
         """
         Get all documents from the database
@@ -173,9 +281,30 @@ class DocumentsTable(Database):
     def get_documents_for_tracker(self, tracker: Tracker) -> List[Document]:
         """
         Get all documents for a tracker
+
+        The documents are returned as dicts with exactly the fields of the Document
+        model so that they can be returned without re-validation.
+        """
+        docs = self.collection.find({'id':{'$in': tracker.documents}}, model_projection(Document))
+        return with_model_defaults(Document, docs)
+
+    def get_document_ids_for_tracker(self, tracker: Tracker, missing_field: str = None) -> List[str]:
         """
-        docs = list(self.collection.find({'id':{'$in': tracker.documents}}))
-        return docs
+        Get the ids of a tracker's documents
+
+        Args:
+            tracker (Tracker): The tracker
+            missing_field (str): If given, only documents where this field is missing or null,
+                e.g. 'classification' for documents that have not been classified
+
+        Returns:
+            List[str]: Document ids, in the tracker's order
+        """
+        query = {'id': {'$in': tracker.documents}}
+        if missing_field:
+            query[missing_field] = None
+        found = {doc['id'] for doc in self.collection.find(query, {'_id': 0, 'id': 1})}
+        return [doc_id for doc_id in dict.fromkeys(tracker.documents) if doc_id in found]
 
     def get_count(self) -> int:
         """
@@ -3,7 +3,7 @@ extendedprops_table.py - Extended Properties Table
 """
 
 from database.documents_table import COLLECTION
-from database.db import Database
+from database.db import Database, trusted_model
 from models.document import ExtendedDocumentProperties
 
 
@@ -59,6 +59,30 @@ class ExtendedPropertiesDict(dict):
     def get(self, key, default=None):
         return self.extendedprops.get(key) or default
 
+    def delete_many(self, keys) -> int:
+        """
+        Delete the extended properties of many documents
+        """
+        return self.extendedprops.delete_many(keys)
+
+    def get_props(self, key) -> ExtendedDocumentProperties:
+        """
+        Get the extended properties for a document, without its tables
+        """
+        return self.extendedprops.get_props(key)
+
+    def get_version(self, key) -> str:
+        """
+        Get just the version of a document's extended properties
+        """
+        return self.extendedprops.get_version(key)
+
+    def get_tables(self, key, table_id: str = None) -> dict:
+        """
+        Get just the tables (or a single table) for a document
+        """
+        return self.extendedprops.get_tables(key, table_id)
+
 class ExtendedPropertiesTable(Database):
     """
     Extended Properties Table
@@ -73,6 +97,65 @@ class ExtendedPropertiesTable(Database):
         """
         return self.collection.find_one({'id': id})
 
+    def get_props(self, id) -> ExtendedDocumentProperties:
+        """
+        Get extended properties by id for retrieval, without validating them again.
+
+        The tables are never returned by ExtendedDocumentProperties, so they are not
+        read. The database works out has_tables the same way the model's root validator
+        does, so the legacy dict_tables field does not have to be read either.
+
+        Args:
+            id (str): The id of the associated document
+
+        Returns:
+            ExtendedDocumentProperties: The properties or None if there are none
+        """
+        pipeline = [
+            {'$match': {'id': id}},
+            {'$limit': 1},
+            {'$addFields': {
+                'has_dict_tables': {'$not': [{'$in': [{'$type': '$dict_tables'}, ['missing', 'null']]}]}
+            }},
+            {'$project': {'_id': 0, 'tables': 0, 'dict_tables': 0}},
+        ]
+        record = next(self.collection.aggregate(pipeline), None)
+        if record is None:
+            return None
+        has_dict_tables = record.pop('has_dict_tables', False)
+        if not record.get('has_tables'):
+            record['has_tables'] = has_dict_tables
+        return trusted_model(ExtendedDocumentProperties, record)
+
+    def get_version(self, id) -> str:
+        """
+        Get the version of a document's extended properties without reading them
+
+        Args:
+            id (str): The id of the associated document
+
+        Returns:
+            str: The version, '*unversioned*' if there is none, or None if there are no extended properties
+        """
+        record = self.collection.find_one({'id': id}, {'_id': 0, 'version': 1})
+        if record is None:
+            return None
+        return record.get('version', '*unversioned*')
+
+    def get_tables(self, id, table_id: str = None):
+        """
+        Get the tables for a document without loading the text, images, or props.
+
+        Args:
+            id (str): The id of the associated document
+            table_id (str): Only return this table. Default is all tables.
+
+        Returns:
+            dict: {'id', 'version', 'tables'} or None if the document has no extended properties
+        """
+        tables_field = f'tables.{table_id}' if table_id else 'tables'
+        return self.collection.find_one({'id': id}, {'_id': 0, 'id': 1, 'version': 1, tables_field: 1})
+
     def get_all(self):
         """
         Get all extended properties
@@ -104,3 +187,12 @@ class ExtendedPropertiesTable(Database):
         Delete extended properties
         """
         return self.collection.delete_one({'id': id})
+
+    def delete_many(self, ids) -> int:
+        """
+        Delete the extended properties of many documents with one statement
+
+        Returns:
+            int: The number of records deleted
+        """
+        return self.collection.delete_many({'id': {'$in': list(ids)}}).deleted_count
@@ -0,0 +1,78 @@
+"""
+property_cache_table.py - Cache of ATTOM property data
+"""
+from datetime import datetime, timedelta
+from typing import Optional
+from pymongo import ASCENDING
+from database.db import Database
+
+
+COLLECTION = 'property_cache'
+TTL_INDEX = 'expires_at_ttl'
+
+
+class PropertyCacheTable(Database):
+    """
+    ATTOM responses, one record per endpoint and normalized address
+
+    Each record carries its own expires_at. MongoDB's TTL monitor deletes
+    expired records, and get() ignores records that have expired but not yet
+    been deleted.
+    """
+    def __init__(self) -> None:
+        super().__init__()
+        self.collection = self.conn[self.database][COLLECTION]
+        self.indexed = False
+
+    def ensure_indexes(self) -> None:
+        """
+        Create the TTL index that removes expired records
+        """
+        if not self.indexed:
+            self.collection.create_index([('expires_at', ASCENDING)], name=TTL_INDEX, expireAfterSeconds=0)
+            self.indexed = True
+
+    def get(self, endpoint: str, address_key: str) -> Optional[dict]:
+        """
+        Get an unexpired cached response
+
+        Args:
+            endpoint (str): ATTOM endpoint, e.g. '/property/basicprofile'
+            address_key (str): Normalized address
+
+        Returns:
+            dict: The record, with 'data' and 'expires_at', or None
+        """
+        return self.collection.find_one(
+            {'_id': f'{endpoint}|{address_key}', 'expires_at': {'$gt': datetime.utcnow()}},
+            {'_id': 0, 'data': 1, 'expires_at': 1},
+        )
+
+    def put(self, endpoint: str, address_key: str, data: dict, ttl: timedelta) -> datetime:
+        """
+        Save a response, replacing any earlier one
+
+        Args:
+            endpoint (str): ATTOM endpoint
+            address_key (str): Normalized address
+            data (dict): The response
+            ttl (timedelta): How long to keep it
+
+        Returns:
+            datetime: When the record expires
+        """
+        self.ensure_indexes()
+        fetched_at = datetime.utcnow()
+        expires_at = fetched_at + ttl
+        self.collection.replace_one(
+            {'_id': f'{endpoint}|{address_key}'},
+            {
+                'endpoint': endpoint,
+                'address_key': address_key,
+                'data': data,
+                'fetched_at': fetched_at,
+                'expires_at': expires_at,
+            },
+            upsert=True,
+        )
+        return expires_at
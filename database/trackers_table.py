@@ -4,20 +4,70 @@ trackers_table.py - Trackers Table
 from collections import defaultdict
 import calendar
 from datetime import datetime
-from typing import List
+from typing import Iterable, List
 from uuid import uuid4
 
-from database.db import Database
+from database.db import Database, trusted_model, trusted_models
 from models.tracker import Tracker
 from models.document import Document
 from database.documents_table import DocumentsDict
 from models.tracker import TrackerDatasetResponse
 from database.clients_table import ClientsTable
-from doc_classifier.openai_prompt_data import PromptData
+from util.compliance import ComplianceRule, get_compliance_config
 
 COLLECTION = 'trackers'
 CLIENTS_DB = ClientsTable()
 
+
+def assemble_compliance_matrix(docs: Iterable[dict], rule: ComplianceRule) -> dict:
+    """
+    Arrange one classification's documents into a compliance matrix
+
+    Args:
+        docs (Iterable[dict]): Documents of this classification, sorted by document_date
+        rule (ComplianceRule): The classification's key fields and key builder
+
+    Returns:
+        dict: compliance key -> year -> month name -> document, plus a 'metadata' entry per key
+    """
+    data = defaultdict(lambda: defaultdict(lambda: {calendar.month_name[m]: None for m in range(1, 13)}))
+    keys = {}  # A statement's account repeats every month, so build each key once
+
+    for doc in docs:
+        date = doc.get('document_date', '')
+        subclass = doc.get('sub_classification', {})
+        try:
+            year, month, _ = map(int, date.split('-'))
+        except ValueError:
+            continue  # skip document with invalid date string
+        month_name = calendar.month_name[month]
+
+        # key = f"{fi} - {acc}"
+        try:
+            subclass_id = tuple(sorted(subclass.items()))
+            if subclass_id not in keys:
+                keys[subclass_id] = rule.make_key(subclass)
+            key = keys[subclass_id]
+        except (AttributeError, TypeError):
+            key = rule.make_key(subclass)  # Not a flat dict; don't memoize
+        if key:
+            data[key][year][month_name] = {
+                'bates': doc.get('beginning_bates', "X"),
+                'path': doc.get('path', ""),
+                'id': doc.get('id', ""),
+                'date': doc.get('produced_date', ""),
+            }
+            if 'metadata' not in data[key]:
+                data[key]['metadata'] = {
+                    "key_fields": list(rule.key_fields),
+                    "doc_ids": []
+                }
+            data[key]['metadata']['doc_ids'].append(doc['id'])
+
+    # Convert defaultdict to regular dict for Jinja compatibility
+    return {k: dict(v) for k, v in data.items()}
+
+
 class TrackersDict(dict):
     """
     Dictionary of trackers
@@ -157,7 +207,7 @@ class TrackersTable(Database):
             UnauthorizedUserError: If the user is not authorized to access the tracker.
         """
         tracker_doc = self.collection.find_one({'id': tracker_id})
-        tracker = Tracker(**tracker_doc) if tracker_doc else None
+        tracker = trusted_model(Tracker, tracker_doc)
         if not tracker:
             return None
 
@@ -168,6 +218,50 @@ class TrackersTable(Database):
 
         return tracker
 
+    def get_version(self, tracker_id: str, username: str) -> str:
+        """
+        Get a tracker's version without reading the rest of it
+
+        Args:
+            tracker_id (str): The tracker's ID.
+            username (str): The user's username.
+
+        Returns:
+            str: The tracker's version if the tracker exists, None otherwise.
+
+        Raises:
+            UnauthorizedUserError: If the user is not authorized to access the tracker.
+        """
+        tracker_doc = self.collection.find_one({'id': tracker_id}, {'_id': 0, 'client_id': 1, 'version': 1})
+        if not tracker_doc:
+            return None
+        if not CLIENTS_DB.is_authorized(tracker_doc.get('client_id'), username):
+            raise UnauthorizedUserError(username, tracker_doc.get('client_id'))
+        return tracker_doc.get('version')
+
+    def get_document_versions(self, tracker_id: str, username: str) -> list:
+        """
+        Get the id and version of a tracker and of every document linked to it
+
+        Args:
+            tracker_id (str): The tracker's ID.
+            username (str): The user's username.
+
+        Returns:
+            list: [{'id', 'version'}, ...] for the tracker and its documents, or None if the tracker does not exist.
+
+        Raises:
+            UnauthorizedUserError: If the user is not authorized to access the tracker.
+        """
+        tracker_doc = self.collection.find_one({'id': tracker_id}, {'_id': 0, 'id': 1, 'client_id': 1, 'version': 1, 'documents': 1})
+        if not tracker_doc:
+            return None
+        if not CLIENTS_DB.is_authorized(tracker_doc.get('client_id'), username):
+            raise UnauthorizedUserError(username, tracker_doc.get('client_id'))
+        versions = [{'id': tracker_doc.get('id'), 'version': tracker_doc.get('version')}]
+        versions.extend(self.documents.find({'id': {'$in': tracker_doc.get('documents') or []}}, {'_id': 0, 'id': 1, 'version': 1}))
+        return versions
+
     def create(self, tracker: Tracker, username: str) -> dict:
         """
         Create a tracker in the database
@@ -292,9 +386,40 @@ class TrackersTable(Database):
         all_trackers = []
         for client in clients:
             trackers = self.collection.find({'client_id': client.id})
-            all_trackers.extend([Tracker(**tracker) for tracker in trackers])
+            all_trackers.extend(trusted_models(Tracker, trackers))
         return all_trackers
     
+    def get_versions_by_username(self, username: str) -> list:
+        """
+        Get the id and version of every tracker for a username
+
+        Args:
+            username (str): The user's username.
+
+        Returns:
+            list: [{'id', 'version'}, ...] for the trackers get_trackers_by_username() returns.
+        """
+        client_ids = [client['id'] for client in CLIENTS_DB.get_authorized_clients(username)]
+        return list(self.collection.find({'client_id': {'$in': client_ids}}, {'_id': 0, 'id': 1, 'version': 1}))
+
+    def get_versions_by_client_id(self, client_id: str, username: str) -> list:
+        """
+        Get the id and version of every tracker for a client ID
+
+        Args:
+            client_id (str): The client's ID.
+            username (str): The user's username.
+
+        Returns:
+            list: [{'id', 'version'}, ...] for the trackers get_trackers_by_client_id() returns.
+
+        Raises:
+            UnauthorizedUserError: If the user is not authorized to access the trackers.
+        """
+        if not CLIENTS_DB.is_authorized(client_id, username):
+            raise UnauthorizedUserError(username, client_id)
+        return list(self.collection.find({'client_id': client_id}, {'_id': 0, 'id': 1, 'version': 1}))
+
     def get_trackers_by_client_id(self, client_id: str, username: str) -> List[Tracker]:
         """
         Get all trackers for a client ID
@@ -313,7 +438,7 @@ class TrackersTable(Database):
         if not CLIENTS_DB.is_authorized(client_id, username):
             raise UnauthorizedUserError(username, client_id)
         trackers = self.collection.find({'client_id': client_id})
-        return [Tracker(**tracker) for tracker in trackers]
+        return trusted_models(Tracker, trackers)
 
     # See if a document is in a tracker
     def is_in_tracker(self, tracker_id: str, document_id: str) -> bool:
@@ -338,26 +463,70 @@ class TrackersTable(Database):
             doc_id (str): The document's ID.
 
         Returns:
-            list: A list of all trackers linked to the document.
+            list: The id and name of each tracker linked to the document.
         """
-        return list(self.collection.find({'documents': doc_id}))
-    
-    def delete_document_from_trackers(self, doc_id: str) -> None:
+        return list(self.collection.find({'documents': doc_id}, {'_id': 0, 'id': 1, 'name': 1}))
+
+    def get_linked_document_ids(self, doc_ids: List[str]) -> set:
+        """
+        Find which of the given documents are linked to at least one tracker
+
+        Args:
+            doc_ids (List[str]): The documents' IDs.
+
+        Returns:
+            set: The IDs of the documents that are in a tracker.
         """
-        Delete a document from all trackers
+        pipeline = [
+            {'$match': {'documents': {'$in': doc_ids}}},
+            {'$project': {'_id': 0, 'linked': {'$setIntersection': ['$documents', doc_ids]}}},
+            {'$unwind': '$linked'},
+            {'$group': {'_id': None, 'linked': {'$addToSet': '$linked'}}},
+        ]
+        result = next(self.collection.aggregate(pipeline), None)
+        return set(result['linked']) if result else set()
+
+    def delete_document_from_trackers(self, doc_id: str, username: str) -> dict:
+        """
+        Delete a document from the trackers the user may update
 
         Args:
             doc_id (str): The document's ID.
+            username (str): The user's username.
 
         Returns:
-            dict: The result of the delete operation.
+            dict: See delete_documents_from_trackers().
         """
-        trackers = self.get_trackers_linked_to_doc(doc_id)
+        return self.delete_documents_from_trackers([doc_id], username)
 
-        for tracker in trackers:
-            self.unlink_doc(Tracker(**tracker), doc_id)
-        
-        return {'trackers': len(trackers)}
+    def delete_documents_from_trackers(self, doc_ids: List[str], username: str) -> dict:
+        """
+        Delete many documents from the trackers the user may update, with a single update.
+
+        Only trackers of clients the user is authorized for are changed. Trackers of other
+        clients that contain the documents are left alone and reported.
+
+        Every tracker that is changed gets a new version. The trackers changed by one
+        call share that version, which is enough for the version checks on update.
+
+        Args:
+            doc_ids (List[str]): The documents' IDs.
+            username (str): The user's username, recorded as the trackers' updated_username.
+
+        Returns:
+            dict: 'trackers', the number of trackers that were updated, and 'unauthorized_trackers',
+                the IDs of trackers that contain the documents but were not updated.
+        """
+        client_ids = [client['id'] for client in CLIENTS_DB.get_authorized_clients(username)]
+        unauthorized = self.collection.find(
+            {'documents': {'$in': doc_ids}, 'client_id': {'$nin': client_ids}}, {'_id': 0, 'id': 1}
+        )
+        set_clause = {'updated_date': datetime.now(), 'updated_username': username, 'version': str(uuid4())}
+        result = self.collection.update_many(
+            {'documents': {'$in': doc_ids}, 'client_id': {'$in': client_ids}},
+            {'$pull': {'documents': {'$in': doc_ids}}, '$set': set_clause}
+        )
+        return {'trackers': result.modified_count, 'unauthorized_trackers': [tracker['id'] for tracker in unauthorized]}
 
     def link_doc(self, tracker: Tracker, document: Document, username: str) -> bool:
         """
@@ -443,12 +612,10 @@ class TrackersTable(Database):
         if not CLIENTS_DB.is_authorized(tracker.client_id, username):
             raise UnauthorizedUserError(username, tracker.client_id)
 
-        prompt_data = PromptData()
-        classifications = prompt_data.compliance_classifications()
+        config = get_compliance_config()
         class_matrix = {}
-        sorted_classifications = sorted(classifications)
 
-        for classification in sorted_classifications:
+        for classification in config.classifications:
             # Fetch and organize documents
             selection = {
                 'id': {'$in': tracker.documents},
@@ -471,39 +638,7 @@ class TrackersTable(Database):
                 'path': 1
             }
             cursor = self.documents.find(selection, projection).sort('document_date', 1)
-            data = defaultdict(lambda: defaultdict(lambda: {calendar.month_name[m]: None for m in range(1, 13)}))
-            metadata = {
-                "key_fields": prompt_data.compliance_key_fields(classification),
-                "doc_ids": []
-            }
-            
-            for doc in cursor:
-                date = doc.get('document_date', '')
-                subclass = doc.get('sub_classification', {})
-                try:
-                    year, month, _ = map(int, date.split('-'))
-                except ValueError:
-                    continue  # skip document with invalid date string
-                month_name = calendar.month_name[month]
-                
-                # key = f"{fi} - {acc}"
-                key = prompt_data.make_compliance_key(classification, subclass)
-                if key:
-                    data[key][year][month_name] = {
-                        'bates': doc.get('beginning_bates', "X"),
-                        'path': doc.get('path', ""),
-                        'id': doc.get('id', ""),
-                        'date': doc.get('produced_date', ""),
-                    }
-                    if 'metadata' not in data[key]:
-                        data[key]['metadata'] = {
-                            "key_fields": prompt_data.compliance_key_fields(classification),
-                            "doc_ids": []
-                        }
-                    data[key]['metadata']['doc_ids'].append(doc['id'])
-            
-            # Convert defaultdict to regular dict for Jinja compatibility
-            final_data = {k: dict(v) for k, v in data.items()}
+            final_data = assemble_compliance_matrix(cursor, config.rules[classification])
             if final_data:
                 class_matrix[classification] = final_data
         return class_matrix
@@ -1,14 +1,17 @@
 """
 falconapi.py - Falcon API
 
-TODO: Set up opentelemetry
-TODO: Set up an OpenTelemetry exporter for this API
-https://grafana.com/blog/2022/05/10/how-to-collect-prometheus-metrics-with-the-opentelemetry-collector-and-grafana/
+Tracing is configured with OTEL_* environment variables; see util/tracing.py.
+Prometheus metrics are served at /metrics; see util/metrics.py.
 """
+from contextlib import asynccontextmanager
+import os
 from sys import prefix
 from fastapi import FastAPI, status
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
 from routers.api_version import APIVersion
+from routers.audit import router as audit
 from routers.documents import router as documents
 from routers.childsupport import router as childsupport
 from routers.clients import router as clients
@@ -16,11 +19,24 @@ from routers.discovery_files import router as discovery_files
 from routers.discovery_requests import router as discovery_requests
 from routers.discovery_trackers import router as discovery_trackers
 from routers.users import router as users
-from routers.utility import router as utility
+from routers.utility import router as utility, close_job_status, get_job_status, get_work_queue
+from database.db import Database
+from database.dependencies import get_audit_writer, open_tables
 from models.response import Response
+from util.attom import ATTOM
+from util.childsupport import calculation_cache_stats
+from util.log_util import get_logger
+from util.compression import COMPRESSION_STATS, CompressionMiddleware, DEFAULT_CONTENT_TYPES, DEFAULT_ENCODINGS
+from util.metrics import MetricsMiddleware, metrics_response, register_stats
+from util.responses import FastJSONResponse
+from util.tracing import TracingMiddleware, setup_tracing
 
 import settings  # NOQA
 
+LOGGER = get_logger('falconapi')
+
+setup_tracing()
+
 api_version = APIVersion(1, 0)
 API_VERSION = api_version.to_str()
 API_VERSION_PREFIX = f'/api/{API_VERSION}'
@@ -36,12 +52,40 @@ SERVERS = [
     }
 ]
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """
+    Create the shared tables and connect to MongoDB and Redis at startup, and release them at shutdown
+
+    Nothing connects when the modules are imported, so a failure here is
+    logged instead of stopping the app; each dependency retries on first use.
+    """
+    try:
+        await run_in_threadpool(Database.ping)
+    except Exception as e:
+        LOGGER.error("MongoDB is not reachable at startup: %s", e)
+    await run_in_threadpool(open_tables)
+    get_audit_writer().start()
+    try:
+        await run_in_threadpool(get_work_queue)
+        await get_job_status().redis.ping()
+    except Exception as e:
+        LOGGER.error("Work queue is not available at startup: %s", e)
+    yield
+    # Write any audit events that are still queued
+    get_audit_writer().close()
+    await ATTOM.aclose()
+    await close_job_status()
+    Database.close()
+
 app = FastAPI(
     title="Falcon API",
     description=COPYRIGHT,
     version=API_VERSION,
     prefix=API_VERSION_PREFIX,
     servers=SERVERS,
+    default_response_class=FastJSONResponse,
+    lifespan=lifespan,
 )
 
 app.add_middleware(
@@ -52,6 +96,24 @@ app.add_middleware(
     allow_headers=['*'],
 )
 
+# Compress large responses. Counters, including bytes saved, are kept in util.compression.COMPRESSION_STATS.
+app.add_middleware(
+    CompressionMiddleware,
+    minimum_size=int(os.getenv('COMPRESSION_MINIMUM_SIZE', '1024')),
+    content_types=os.getenv('COMPRESSION_CONTENT_TYPES', ','.join(DEFAULT_CONTENT_TYPES)).split(','),
+    encodings=os.getenv('COMPRESSION_ENCODINGS', ','.join(DEFAULT_ENCODINGS)).split(','),
+    level=int(os.getenv('COMPRESSION_LEVEL', '6')),
+)
+
+app.add_middleware(MetricsMiddleware)
+
+# Added last so it is the outermost middleware and its spans cover the whole request
+app.add_middleware(TracingMiddleware)
+
+register_stats('compression', COMPRESSION_STATS.snapshot, label='encoding')
+register_stats('audit', lambda: get_audit_writer().snapshot())
+register_stats('child_support_cache', calculation_cache_stats)
+
 app.include_router(discovery_trackers, prefix=API_VERSION_PREFIX)
 app.include_router(users, prefix=API_VERSION_PREFIX)
 app.include_router(utility, prefix=API_VERSION_PREFIX)
@@ -60,6 +122,7 @@ app.include_router(childsupport, prefix=API_VERSION_PREFIX)
 app.include_router(clients, prefix=API_VERSION_PREFIX)
 app.include_router(discovery_requests, prefix=API_VERSION_PREFIX)
 app.include_router(discovery_files, prefix=API_VERSION_PREFIX)
+app.include_router(audit, prefix=API_VERSION_PREFIX)
 
 @app.get(
     '/',
@@ -71,6 +134,10 @@ app.include_router(discovery_files, prefix=API_VERSION_PREFIX)
 async def root():
     return {"message": COPYRIGHT}
 
+@app.get('/metrics', include_in_schema=False)
+def metrics():
+    return metrics_response()
+
 @app.get(
     '/privacy',
     status_code=status.HTTP_200_OK,
@@ -10,7 +10,7 @@ class Audit(BaseModel):
     """
     Audit Record Model
     """
-    id: Optional[str] = str(uuid4())
+    id: Optional[str] = Field(default_factory=lambda: str(uuid4()))
     description: str
     username: str
     admin_user: bool
@@ -18,9 +18,11 @@ class Audit(BaseModel):
     record_id: str
     old_data: Optional[str] = None
     new_data: Optional[str] = None
+    changes: Optional[dict] = None  # Field-level differences; see util.diff.field_diff()
     event_date: datetime = Field(default_factory=datetime.utcnow)
     success: bool
     message: Optional[str] = None
+    count: Optional[int] = None  # Number of reads in a per-minute rollup; None for a single event
 
     class Config:
         from_attributes = True
@@ -34,4 +36,4 @@ class Audit(BaseModel):
                 "record_id": "tracker-1",
                 "new_data": "{\"name\": \"Client 20304 - Our Production\"}"
             }
-        }
\ No newline at end of file
+        }
@@ -1,10 +1,12 @@
 """
 childsupport.py - Models for a child support calcualtion request and response
 """
-
+from typing import List, Optional
 from pydantic import BaseModel, Field, validator
 
 
+MAX_BATCH_SCENARIOS = 10000
+MAX_GRID_POINTS = 100000
 INCOME_FREQUENCY = ['weekly', 'biweekly', 'semimonthly', 'monthly', 'annually', 'yearly']
 INCOME_FREQUENCY_CHOICES = ', '.join(INCOME_FREQUENCY[:-1]) + ', or ' + INCOME_FREQUENCY[-1]
 
@@ -20,6 +22,7 @@ class ChildSupportRequest(BaseModel):
 	union_dues: float = Field(..., example=0.00)
 	health_insurance: float = Field(..., example=0.00)
 	mininum_wage: bool = Field(..., example=False)
+	tax_year: Optional[int] = Field(None, example=2024, description="Tax year of the tax and guideline tables. Defaults to 2023.")
 
 	# validators
 	@validator('number_of_children')
@@ -93,3 +96,58 @@ class ChildSupportResponse(BaseModel):
 	social_security_tax: float = Field(..., example=0.00)
 	medicare_tax: float = Field(..., example=0.00)
 	federal_income_tax: float = Field(..., example=0.00)
+
+class ChildSupportBatchRequest(BaseModel):
+	scenarios: List[ChildSupportRequest] = Field(..., min_length=1, max_length=MAX_BATCH_SCENARIOS)
+
+class ChildSupportGridRequest(BaseModel):
+	scenario: ChildSupportRequest = Field(..., description="Base scenario. Its wage income and number of children are replaced by the swept values.")
+	wage_income_min: float = Field(..., ge=0, example=500.00)
+	wage_income_max: float = Field(..., ge=0, example=5000.00)
+	wage_income_points: int = Field(100, ge=1, example=100)
+	children: List[int] = Field([1, 2, 3], min_length=1, example=[1, 2, 3])
+
+	# validators
+	@validator('wage_income_max')
+	def wage_income_max_must_not_be_below_min(cls, v, values):
+		if 'wage_income_min' in values and v < values['wage_income_min']:
+			raise ValueError('Maximum wage income must not be less than minimum wage income')
+		return v
+
+	@validator('children')
+	def children_must_be_gt_zero(cls, v):
+		if any(children < 1 for children in v):
+			raise ValueError('Number of children must greater than zero')
+		return v
+
+	@validator('scenario')
+	def scenario_must_not_use_minimum_wage(cls, v):
+		if v.mininum_wage:
+			raise ValueError('Minimum wage cannot be used with a wage income range')
+		return v
+
+	@validator('children')
+	def grid_must_not_be_too_large(cls, v, values):
+		if 'wage_income_points' in values and values['wage_income_points'] * len(v) > MAX_GRID_POINTS:
+			raise ValueError(f'A grid can have at most {MAX_GRID_POINTS} points')
+		return v
+
+class ChildSupportColumns(BaseModel):
+	count: int = Field(..., example=2)
+	net_monthly_resources: List[float]
+	child_support: List[float]
+	capped_flag: List[bool]
+	child_support_factor: List[float]
+	monthly_wage_income: List[float]
+	monthly_nonwage_income: List[float]
+	social_security_tax: List[float]
+	medicare_tax: List[float]
+	federal_income_tax: List[float]
+
+class ChildSupportBatchResponse(ChildSupportColumns):
+	tax_table_version: List[str] = Field(..., example=["2023.2", "2024.1"])
+
+class ChildSupportGridResponse(ChildSupportColumns):
+	tax_table_version: str = Field(..., example="2024.1")
+	wage_income: List[float]
+	number_of_children: List[int]
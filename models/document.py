@@ -5,7 +5,10 @@ from datetime import datetime
 from optparse import Option
 from typing import Optional, List, Union
 from uuid import uuid4
-from pydantic import BaseModel, Field, root_validator
+from pydantic import BaseModel, Field, root_validator, validator
+
+
+MAX_DOCUMENT_BATCH_SIZE = 1000
 
 
 class Document(BaseModel):
@@ -177,6 +180,51 @@ class DocumentObjTables(BaseModel):
             }
         }
 
+class DocumentBatchRequest(BaseModel):
+    """
+    A list of document ids for the batch endpoints
+    """
+    ids: List[str]
+
+    class Config:
+        json_schema_extra = {
+            "example": {
+                "ids": ["doc-1", "doc-2", "doc-3"]
+            }
+        }
+
+    # validators
+    @validator('ids')
+    def ids_must_fit_in_a_batch(cls, v):
+        if len(v) > MAX_DOCUMENT_BATCH_SIZE:
+            raise ValueError(f'A batch may contain at most {MAX_DOCUMENT_BATCH_SIZE} document ids')
+        return v
+
+class DocumentBatchDeleteResponse(BaseModel):
+    """
+    Result of deleting a batch of documents
+    """
+    message: str
+    deleted: List[str] = []
+    not_found: List[str] = []
+    unauthorized: List[str] = []
+    in_trackers: List[str] = []  # Not deleted because they are in trackers and cascade was false
+    trackers_updated: int = 0
+    trackers_not_updated: List[str] = []  # Trackers that contain deleted documents but belong to clients the user is not authorized for
+
+    class Config:
+        json_schema_extra = {
+            "example": {
+                "message": "2 documents deleted",
+                "deleted": ["doc-1", "doc-2"],
+                "not_found": ["doc-3"],
+                "unauthorized": [],
+                "in_trackers": [],
+                "trackers_updated": 1,
+                "trackers_not_updated": []
+            }
+        }
+
 class CategorySubcategoryResponse(BaseModel):
     """
     Response for a category/subcategory pair
@@ -2,13 +2,15 @@
 queue_request.py - Pydantic model for QueueRequest
 """
 
-from typing import Optional, Dict
+from typing import Literal, Optional, Dict, List
 from uuid import uuid4
 from pydantic import BaseModel, Field, validator
 
+MAX_QUEUE_BATCH_SIZE = 5000
+
 
 class QueueRequest(BaseModel):
-    request_id: Optional[str] = str(uuid4())
+    request_id: Optional[str] = Field(default_factory=lambda: str(uuid4()))  # A new id for each request
     task: str
     payload: Dict
     username: str
@@ -63,3 +65,30 @@ class QueueRequest(BaseModel):
         if v > 10:
             raise ValueError('TTL must be less than 10')
         return v
+
+
+class JobStatusUpdate(BaseModel):
+    request_id: str
+    status: Literal['queued', 'running', 'completed', 'failed']
+    detail: Optional[str] = Field(None, example="Classified 12 pages")
+
+
+class QueueBatchRequest(BaseModel):
+    requests: List[QueueRequest] = Field(..., min_length=1, max_length=MAX_QUEUE_BATCH_SIZE)
+
+
+class QueueBatchResponse(BaseModel):
+    message: str = Field(..., example="3000 tasks queued")
+    batch_id: Optional[str] = Field(None, example="5b0f4c1e-8f7a-4e55-9a43-2b1d6c1f0e77")
+    count: int = Field(..., example=3000)  # Newly queued
+    coalesced: int = Field(0, example=12)  # Already queued or running, so not queued again
+    ids: List[str]  # One request id per unit of work, including the coalesced jobs
+
+
+class QueueBatchStatus(BaseModel):
+    id: str
+    tasks: str = Field(..., example="classify")
+    total: int = Field(..., example=3000)
+    created_at: str
+    counts: Dict[str, int] = Field(..., example={"completed": 2400, "running": 8, "queued": 592})
+    finished: bool
@@ -3,7 +3,10 @@ realproperty.py - Models for a real property information request and response
 """
 
 from pydantic import BaseModel, Field
-from typing import Optional
+from typing import List, Optional
+
+
+MAX_BATCH_ADDRESSES = 100
 
 
 class RealPropertyInfoRequest(BaseModel):
@@ -29,3 +32,18 @@ class RealPropertyInfoResponse(BaseModel):
 	approximate_value_high: Optional[int] = Field(..., example=521067)
 	approximate_value_low: Optional[int] = Field(..., example=510748)
 	equity_amount: Optional[int] = Field(..., example=445790)
+
+class RealPropertyBatchRequest(BaseModel):
+	addresses: List[RealPropertyInfoRequest] = Field(..., min_length=1, max_length=MAX_BATCH_ADDRESSES)
+	force_refresh: bool = Field(False, description="Fetch fresh data from ATTOM instead of the cache")
+
+class RealPropertyBatchItem(BaseModel):
+	address: RealPropertyInfoRequest
+	status_code: int = Field(..., example=200)
+	property: Optional[RealPropertyInfoResponse] = None
+	detail: Optional[str] = Field(None, example="Property not found")
+
+class RealPropertyBatchResponse(BaseModel):
+	results: List[RealPropertyBatchItem]
+	found: int = Field(..., example=12)
+	failed: int = Field(..., example=1)
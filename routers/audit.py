@@ -0,0 +1,65 @@
+"""
+audit.py - Falcon API Routers for the Audit Log
+"""
+from datetime import datetime
+from typing import List, Optional
+from fastapi import APIRouter, Depends, HTTPException, Query, status
+from auth.handler import get_current_active_user
+from database.audit_table import AuditTable, MAX_AUDIT_QUERY_LIMIT
+from database.dependencies import get_audit_table
+from models.audit import Audit
+from models.user import User
+from routers.api_version import APIVersion
+from util.log_util import get_logger
+from util.responses import trusted_response
+
+
+API_VERSION = APIVersion(1, 0).to_str()
+ROUTE_PREFIX = '/audit'
+LOGGER = get_logger(f'falconapi{ROUTE_PREFIX}')
+
+router = APIRouter(
+    tags=["Audit"],
+    prefix=ROUTE_PREFIX,
+    responses={404: {"description": "Not found"}}
+)
+
+
+@router.get('/', status_code=status.HTTP_200_OK, response_model=List[Audit], summary='Find audit events by record, user and date range')
+async def get_audit_events(
+    record_id: Optional[str] = None,
+    username: Optional[str] = None,
+    start_date: Optional[datetime] = None,
+    end_date: Optional[datetime] = None,
+    limit: int = Query(100, ge=1, le=MAX_AUDIT_QUERY_LIMIT),
+    skip: int = Query(0, ge=0),
+    user: User = Depends(get_current_active_user),
+    audit_table: AuditTable = Depends(get_audit_table),
+):
+    """
+    Return audit events, newest first.
+
+    Admins can search all events. Other users only see their own events.
+
+    Args:
+        record_id (str): Only events for this record, e.g. a tracker id
+        username (str): Only events by this user
+        start_date (datetime): Only events on or after this date
+        end_date (datetime): Only events before this date
+        limit (int): Maximum number of events to return
+        skip (int): Number of events to skip, for paging
+        user (User): The current user
+
+    Returns:
+        List[Audit]: The audit events
+    """
+    if not user.admin:
+        if username is not None and username != user.username:
+            raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Only admins can view other users' audit events")
+        username = user.username
+    try:
+        events = audit_table.query(record_id, username, start_date, end_date, limit, skip)
+    except Exception as e:
+        LOGGER.error("Error querying audit log: %s", e)
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=f"Error querying audit log: {e}")
+    return trusted_response(events)
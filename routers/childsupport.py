@@ -3,10 +3,15 @@ documents.py - Falcon API Routers for Documents
 """
 from datetime import datetime
 import logging
+from typing import List
 from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException, status
-from models.childsupport import ChildSupportRequest, ChildSupportResponse
+from models.childsupport import (
+    ChildSupportBatchRequest, ChildSupportBatchResponse, ChildSupportGridRequest, ChildSupportGridResponse,
+    ChildSupportRequest, ChildSupportResponse,
+)
 from routers.api_version import APIVersion
-from util.childsupport import TxChildSupportCalculator
+from util.childsupport import TAX_TABLES, TxChildSupportCalculator, UnknownTaxYearError
+from util.responses import trusted_response
 
 
 API_VERSION = APIVersion(1, 0).to_str()
@@ -24,4 +29,28 @@ router = APIRouter(
 # Add a document
 @router.post('/calculate', status_code=status.HTTP_201_CREATED, response_model=ChildSupportResponse, summary='Calculate Child Support')
 async def add_document(parms: ChildSupportRequest):
-    return CALCULATOR.calculate(parms)
+    try:
+        return CALCULATOR.calculate(parms)
+    except UnknownTaxYearError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=e.message)
+
+# Many scenarios at once. Results come back as one list per field, in the order of the scenarios.
+@router.post('/calculate/batch', status_code=status.HTTP_201_CREATED, response_model=ChildSupportBatchResponse, summary='Calculate Child Support for Many Scenarios')
+async def calculate_batch(parms: ChildSupportBatchRequest):
+    try:
+        return trusted_response(CALCULATOR.calculate_batch(parms.scenarios), status_code=status.HTTP_201_CREATED)
+    except UnknownTaxYearError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=e.message)
+
+# Sweep wage income and number of children around a base scenario
+@router.post('/calculate/grid', status_code=status.HTTP_201_CREATED, response_model=ChildSupportGridResponse, summary='Calculate Child Support over a Range of Incomes and Children')
+async def calculate_grid(parms: ChildSupportGridRequest):
+    try:
+        return trusted_response(CALCULATOR.calculate_grid(parms), status_code=status.HTTP_201_CREATED)
+    except UnknownTaxYearError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=e.message)
+
+# Tax years we have tables for
+@router.get('/tax_years', status_code=status.HTTP_200_OK, response_model=List[int], summary='List the Available Tax Years')
+async def tax_years():
+    return TAX_TABLES.years
@@ -3,18 +3,19 @@ users.py - Users Routes
 """
 from typing import Optional, List
 from pymongo.results import UpdateResult
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Request, Response, status
 from pydantic import BaseModel
 from models.client import Client
 from models.user import User
 from models.tracker import TrackerDatasetResponse
 from routers.api_version import APIVersion
 from database.clients_table import ClientsTable
+from database.dependencies import get_clients_table
 from auth.handler import get_current_active_user
+from util.etag import etag_matches, not_modified, records_etag
 
 
 API_VERSION = APIVersion(1, 0).to_str()
-CLIENTS_TABLE = ClientsTable()
 ROUTE_PREFIX = '/clients'
 
 router = APIRouter(
@@ -29,7 +30,7 @@ class InsertException(BaseModel):
     detail: Optional[str] = "Client already exists"
 
 @router.get("/", response_model=List[Client], tags=["Clients"], summary="Get all by id, set id to '*' to get all")
-async def get_clients(search_field: str, search_value: str, current_user: User = Depends(get_current_active_user)) -> TrackerDatasetResponse:
+async def get_clients(search_field: str, search_value: str, request: Request, response: Response, current_user: User = Depends(get_current_active_user), clients_table: ClientsTable = Depends(get_clients_table)) -> TrackerDatasetResponse:
     """
     Return client's information.
 
@@ -48,7 +49,11 @@ async def get_clients(search_field: str, search_value: str, current_user: User =
         search_field: search_value,
         'username': current_user.email
     }
-    data: List[Client] = CLIENTS_TABLE.get_clients(**args)
+    etag = records_etag(clients_table.get_client_versions(**args))
+    if etag_matches(request, etag):
+        return not_modified(etag)
+    data: List[Client] = clients_table.get_clients(**args)
+    response.headers['ETag'] = records_etag(client.model_dump(include={'id', 'version'}) for client in data)
     return data
 
 @router.post(
@@ -59,7 +64,7 @@ async def get_clients(search_field: str, search_value: str, current_user: User =
     responses={400: {"model": InsertException, "description": "Client already exists"}},
     summary="Register a new client"
 )
-async def register_client(client: Client, current_user: User = Depends(get_current_active_user)) -> Client:
+async def register_client(client: Client, current_user: User = Depends(get_current_active_user), clients_table: ClientsTable = Depends(get_clients_table)) -> Client:
     """
     Register a new client
 
@@ -73,7 +78,7 @@ async def register_client(client: Client, current_user: User = Depends(get_curre
             HTTPException: If the client already exists.
     """
     user_email = current_user.email
-    xclient: List[Client] = CLIENTS_TABLE.get_clients(billing_number=client.billing_number, username=user_email)
+    xclient: List[Client] = clients_table.get_clients(billing_number=client.billing_number, username=user_email)
     if xclient:
         raise HTTPException(status_code=400, detail=f"Client already exists (billing number {client.billing_number})")
 
@@ -81,7 +86,7 @@ async def register_client(client: Client, current_user: User = Depends(get_curre
     new_client.created_by = user_email
     new_client.authorized_users = [user_email] + client.authorized_users
     new_client.enabled = True
-    result = CLIENTS_TABLE.create_client(new_client)
+    result = clients_table.create_client(new_client)
     return {
         'id': new_client.id,
         'name': client.name,
@@ -99,7 +104,7 @@ async def register_client(client: Client, current_user: User = Depends(get_curre
     tags=["Clients"],
     summary="Update a client"
 )
-async def update_client(client: Client, current_user: User = Depends(get_current_active_user)) -> Client:
+async def update_client(client: Client, current_user: User = Depends(get_current_active_user), clients_table: ClientsTable = Depends(get_clients_table)) -> Client:
     """
     Update a client
 
@@ -109,7 +114,7 @@ async def update_client(client: Client, current_user: User = Depends(get_current
     Returns:
         Client: The updated client record.
     """
-    result: UpdateResult = CLIENTS_TABLE.update_client(client, current_user.email)
+    result: UpdateResult = clients_table.update_client(client, current_user.email)
     if result.modified_count == 0:
         raise HTTPException(status_code=400, detail=f"Client {client.id} not updated")
     return client
@@ -119,7 +124,7 @@ async def update_client(client: Client, current_user: User = Depends(get_current
     status_code=status.HTTP_200_OK,
     summary="Delete a client"
 )
-async def delete_client(id: str, current_user: User = Depends(get_current_active_user)) -> dict:
+async def delete_client(id: str, current_user: User = Depends(get_current_active_user), clients_table: ClientsTable = Depends(get_clients_table)) -> dict:
     """
     Delete a client
 
@@ -129,7 +134,7 @@ async def delete_client(id: str, current_user: User = Depends(get_current_active
     Returns:
         dict: A message indicating the client was deleted.
     """
-    result: UpdateResult = CLIENTS_TABLE.delete_client(id, current_user.email)
+    result: UpdateResult = clients_table.delete_client(id, current_user.email)
     if result.modified_count == 0:  # We don't delete, we just update the enabled flag
         return {"message": "Client not deleted", "success": False}
     return {"message": "Client deleted successfully", "success": True}
@@ -139,7 +144,7 @@ async def delete_client(id: str, current_user: User = Depends(get_current_active
     status_code=status.HTTP_200_OK,
     summary="Add an authorized user to a client"
 ) 
-async def add_authorized_user(id: str, authorized_user: str, current_user: User = Depends(get_current_active_user)) -> dict:
+async def add_authorized_user(id: str, authorized_user: str, current_user: User = Depends(get_current_active_user), clients_table: ClientsTable = Depends(get_clients_table)) -> dict:
     """
     Add an authorized user to a client
 
@@ -150,7 +155,7 @@ async def add_authorized_user(id: str, authorized_user: str, current_user: User
     Returns:
         dict: A message indicating the user was added.
     """
-    result: UpdateResult = CLIENTS_TABLE.add_authorized_user(id, current_user.email, authorized_user)
+    result: UpdateResult = clients_table.add_authorized_user(id, current_user.email, authorized_user)
     if result.modified_count == 0:
         return {"message": f"User {authorized_user} not added to client {id}", "success": False}
     return {"message": f"User {authorized_user} added to client {id}", "success": True}
@@ -160,7 +165,7 @@ async def add_authorized_user(id: str, authorized_user: str, current_user: User
     status_code=status.HTTP_200_OK,
     summary="Remove an authorized user from a client"
 )
-async def remove_authorized_user(id: str, authorized_user: str, current_user: User = Depends(get_current_active_user)) -> dict:
+async def remove_authorized_user(id: str, authorized_user: str, current_user: User = Depends(get_current_active_user), clients_table: ClientsTable = Depends(get_clients_table)) -> dict:
     """
     Remove an authorized user from a client
 
@@ -171,7 +176,7 @@ async def remove_authorized_user(id: str, authorized_user: str, current_user: Us
     Returns:
         dict: A message indicating the user was removed.
     """
-    result: UpdateResult = CLIENTS_TABLE.remove_authorized_user(id, current_user.email, authorized_user)
+    result: UpdateResult = clients_table.remove_authorized_user(id, current_user.email, authorized_user)
     if result.modified_count == 0:
         return {"message": f"User {authorized_user} not removed from client {id}", "success": False}
     return {"message": f"User {authorized_user} removed from client {id}", "success": True}
@@ -3,12 +3,13 @@ discovery_files.py - DiscoveryFile Routes
 """
 from datetime import datetime
 from typing import List
-from fastapi import APIRouter, Depends, status
+from fastapi import APIRouter, Depends, Request, Response, status
 from models.user import User
 from models.discovery_requests import DiscoveryFile, DiscoveryFileSummary
 from routers.api_version import APIVersion
 from database.discovery_files import DiscoveryFileTable
 from auth.handler import get_current_active_user
+from util.etag import etag_matches, make_etag, not_modified
 
 
 API_VERSION = APIVersion(1, 0).to_str()
@@ -23,7 +24,7 @@ router = APIRouter(
 
 
 @router.get("/{file_id}", response_model=DiscoveryFile, tags=["Discovery Files"], summary="Get a discovery file")
-async def get_discovery_file(file_id: str, current_user: User = Depends(get_current_active_user)):
+async def get_discovery_file(file_id: str, request: Request, response: Response, current_user: User = Depends(get_current_active_user)):
     """
     Return information about a discovery file or all files.
 
@@ -34,7 +35,12 @@ async def get_discovery_file(file_id: str, current_user: User = Depends(get_curr
     Returns:
         One or more DiscoveryFile objects.
     """
+    etag = make_etag(DISCOVERY_FILES_TABLE.get_version(file_id, current_user.email))
+    if etag_matches(request, etag):
+        return not_modified(etag)
     data = DISCOVERY_FILES_TABLE.get(file_id, current_user.email)
+    if data and data.version:
+        response.headers['ETag'] = make_etag(data.version)
     return data
 
 @router.get("/client/{client_id}", response_model=List[DiscoveryFileSummary], tags=["Discovery Files"], summary="Get all discovery files for a client")
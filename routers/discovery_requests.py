@@ -3,12 +3,13 @@ discovery_requests.py - DiscoveryRequests Routes
 """
 from typing import List
 from pymongo.results import UpdateResult, InsertOneResult, DeleteResult
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Request, Response, status
 from models.user import User
 from models.discovery_requests import DiscoveryRequest
 from routers.api_version import APIVersion
 from database.discovery_requests import DiscoveryRequestsTable
 from auth.handler import get_current_active_user
+from util.etag import etag_matches, make_etag, not_modified, records_etag
 
 
 API_VERSION = APIVersion(1, 0).to_str()
@@ -23,7 +24,7 @@ router = APIRouter(
 
 
 @router.get("/file/{file_id}", response_model=List[DiscoveryRequest], tags=["Discovery Requests"], summary="Get all requests for a file")
-async def get_requests(file_id: str, current_user: User = Depends(get_current_active_user)) -> List[DiscoveryRequest]:
+async def get_requests(file_id: str, request: Request, response: Response, current_user: User = Depends(get_current_active_user)) -> List[DiscoveryRequest]:
     """
     Return discovery requests for the specified file.
 
@@ -34,11 +35,15 @@ async def get_requests(file_id: str, current_user: User = Depends(get_current_ac
     Returns:
         ServedRequests: A list of served requests.
     """
+    etag = records_etag(DISCOVERY_REQUESTS_TABLE.get_versions(file_id, current_user.email))
+    if etag_matches(request, etag):
+        return not_modified(etag)
     data: List[DiscoveryRequest] = DISCOVERY_REQUESTS_TABLE.get_all(file_id, current_user.email)
+    response.headers['ETag'] = records_etag(discovery_request.model_dump(include={'id', 'version'}) for discovery_request in data)
     return data
 
 @router.get("/{request_id}", response_model=DiscoveryRequest, tags=["Discovery Requests"], summary="Get a discovery request")
-async def get_request(request_id: str, current_user: User = Depends(get_current_active_user)) -> DiscoveryRequest:
+async def get_request(request_id: str, request: Request, response: Response, current_user: User = Depends(get_current_active_user)) -> DiscoveryRequest:
     """
     Return information about all served requests.
 
@@ -49,7 +54,12 @@ async def get_request(request_id: str, current_user: User = Depends(get_current_
     Returns:
         DiscoveryRequest: A single request from a file
     """
+    etag = make_etag(DISCOVERY_REQUESTS_TABLE.get_version(request_id, current_user.email))
+    if etag_matches(request, etag):
+        return not_modified(etag)
     data: DiscoveryRequest = DISCOVERY_REQUESTS_TABLE.get(request_id, current_user.email)
+    if data and data.version:
+        response.headers['ETag'] = make_etag(data.version)
     return data
 
 @router.post(
@@ -3,22 +3,28 @@ discovery_trackers.py - Falcon API Routers for Discovery Trackers
 """
 from datetime import datetime
 from uuid import uuid4
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, Header, HTTPException, Request, Response as HTTPResponse, status
 from fastapi.security import OAuth2PasswordBearer
 from pydantic import BaseModel
-from typing import List
+from typing import List, Optional
 import os
 from auth.handler import get_current_active_user
 from models.audit import Audit
 from models.document import Document, CategorySubcategoryResponse
+from models.queue_request import QueueBatchResponse, QueueRequest
 from models.response import Response, ResponseAndId
 from models.tracker import Tracker, TrackerUpdate, TrackerDatasetResponse
 from models.user import User
-from database.audit_table import AuditTable
 from database.trackers_table import TrackersTable
+from database.dependencies import get_audit_writer, get_documents_table, get_trackers_table
 from database.documents_table import DocumentsDict
 from routers.api_version import APIVersion
+from routers.utility import get_job_submitter
+from util.diff import field_diff
+from util.etag import etag_matches, make_etag, not_modified, records_etag
+from util.job_queue import JobSubmitter
 from util.log_util import get_logger
+from util.responses import trusted_response
 import settings  # NOQA
 
 
@@ -34,24 +40,21 @@ router = APIRouter(
     responses={404: {"description": "Not found"}}
 )
 
-audittable = AuditTable()
-tracker_db = TrackersTable()
-documents = DocumentsDict()
 
 AUDIT_LOGGING_ENABLED = os.getenv('AUDIT_LOGGING_ENABLED', 'False').lower() == 'true'
 LOGGER.info("AUDIT_LOGGING_ENABLED: %s", AUDIT_LOGGING_ENABLED)
+AUDIT_ROLLUP_READS = os.getenv('AUDIT_ROLLUP_READS', 'True').lower() == 'true'
+AUDIT_IGNORED_FIELDS = {'updated_date'}  # Changes on every update; the event_date already records it
+# The document field each task fills in. Documents where it is still empty have not been processed.
+TASK_RESULT_FIELDS = {'classify': 'classification', 'extract_bates': 'beginning_bates', 'page_audit': 'page_max'}
 
 # Log an audit event
-def log_audit_event(event: str, doc_id: str, user: User, old_data: BaseModel = None, new_data: BaseModel = None, success: bool = True, message: str = None) -> None:
+# When both old_data and new_data are models, only the fields that changed are stored.
+def log_audit_event(event: str, doc_id: str, user: User, old_data: BaseModel = None, new_data: BaseModel = None, success: bool = True, message: str = None, changes: dict = None) -> None:
     if AUDIT_LOGGING_ENABLED:
-        if old_data and isinstance(old_data, BaseModel):
-            str_old_data = old_data.json(exclude_none=True, exclude_unset=True)
-        else:
-            str_old_data = old_data
-        if new_data and isinstance(new_data, BaseModel):
-            str_new_data = new_data.json(exclude_none=True, exclude_unset=True)
-        else:
-            str_new_data = new_data
+        if isinstance(old_data, BaseModel) or isinstance(new_data, BaseModel):
+            changes = field_diff(old_data, new_data, ignore=AUDIT_IGNORED_FIELDS)
+            old_data = new_data = None
         audit = Audit(
             description=event,
             table='trackers',
@@ -61,16 +64,38 @@ def log_audit_event(event: str, doc_id: str, user: User, old_data: BaseModel = N
             event_date=datetime.now(),
             success = success,
             message = message,
-            old_data=str_old_data if old_data else None,
-            new_data=str_new_data if new_data else None
+            old_data=old_data if old_data else None,
+            new_data=new_data if new_data else None,
+            changes=changes or None
         )
-        audittable.create_event(audit)
+        get_audit_writer().write(audit)
     else:
         LOGGER.debug("AUDIT_LOGGING_ENABLED is False, so not logging audit event: %s - %s", event, message if message else "(no message provided)")
 
+# Log a successful read. Reads are counted per user, record, event and minute
+# and written as rollups, so the busiest endpoints do not write one row per call.
+def log_read_event(event: str, doc_id: str, user: User, detail: str = None, message: str = None) -> None:
+    if not AUDIT_LOGGING_ENABLED:
+        return
+    if not AUDIT_ROLLUP_READS:
+        log_audit_event(event, doc_id, user, detail, message=message)
+        return
+    audit = Audit(
+        description=event,
+        table='trackers',
+        record_id=doc_id,
+        username=user.username,
+        admin_user=user.admin,
+        event_date=datetime.now(),
+        success=True,
+        message=message,
+        old_data=detail
+    )
+    get_audit_writer().rollup(audit)
+
 # Add a tracker
 @router.post('/', status_code=status.HTTP_201_CREATED, response_model=ResponseAndId, summary='Create a tracker')
-async def create_tracker(tracker: Tracker, user: User = Depends(get_current_active_user)):
+async def create_tracker(tracker: Tracker, user: User = Depends(get_current_active_user), tracker_db: TrackersTable = Depends(get_trackers_table)):
 
     tracker.added_username = user.username
     tracker.added_date = datetime.now()
@@ -88,8 +113,12 @@ async def create_tracker(tracker: Tracker, user: User = Depends(get_current_acti
 
 # Get a tracker by Tracker ID
 @router.get('/', status_code=status.HTTP_200_OK, response_model=Tracker, summary='Get a tracker by Tracker ID')
-async def get_tracker(tracker_id: str, user: User = Depends(get_current_active_user)):
+async def get_tracker(tracker_id: str, request: Request, response: HTTPResponse, user: User = Depends(get_current_active_user), tracker_db: TrackersTable = Depends(get_trackers_table)):
     try:
+        etag = make_etag(tracker_db.get_version(tracker_id, user.username))
+        if etag_matches(request, etag):
+            log_read_event('get_tracker', tracker_id, user, message="Not modified")
+            return not_modified(etag)
         tracker = tracker_db.get(tracker_id, user.username)
     except Exception as e:
         LOGGER.error("Error getting tracker: %s", e)
@@ -100,41 +129,51 @@ async def get_tracker(tracker_id: str, user: User = Depends(get_current_active_u
         log_audit_event('get_tracker', tracker_id, user, success=False, message=f"Tracker {tracker_id} not found")
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"Tracker not found: {tracker_id}")
 
-    log_audit_event('get_tracker', tracker_id, user)
+    log_read_event('get_tracker', tracker_id, user)
+    if tracker.version:
+        response.headers['ETag'] = make_etag(tracker.version)
     return tracker
 
 # Get all trackers for a user
 @router.get('/user', status_code=status.HTTP_200_OK, response_model=List[Tracker], summary='Get all trackers for a user')
-async def get_trackers_for_user(username: str = None, user: User = Depends(get_current_active_user)):
+async def get_trackers_for_user(request: Request, username: str = None, user: User = Depends(get_current_active_user), tracker_db: TrackersTable = Depends(get_trackers_table)):
     # TODO: Remove the username argument and just use the user object.
     message = f"get_trackers_for_user: username={user.username} by user={user.username}. Requesting user is admin={user.admin}"
     LOGGER.info(message)
     try:
+        etag = records_etag(tracker_db.get_versions_by_username(user.username))
+        if etag_matches(request, etag):
+            log_read_event(f'get_trackers_for_user::{username}', '', user, message="Not modified")
+            return not_modified(etag)
         trackers = tracker_db.get_trackers_by_username(user.username)
     except Exception as e:
         LOGGER.error("Error getting trackers for user: %s", e)
         log_audit_event('get_trackers_for_user', '', user, success=False, message=f"Error getting trackers for user: {e}")
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=f"Error getting trackers for user: {e}")
 
-    log_audit_event(f'get_trackers_for_user::{username}', '', user, success=True, message=message)
-    return trackers
+    log_read_event(f'get_trackers_for_user::{username}', '', user)
+    return trusted_response(trackers, headers={'ETag': records_etag(tracker.model_dump(include={'id', 'version'}) for tracker in trackers)})
 
 # Get all trackers for a client
 @router.get('/client', status_code=status.HTTP_200_OK, response_model=List[Tracker], summary='Get all trackers for a client')
-async def get_trackers_for_client(client_id: str, user: User = Depends(get_current_active_user)):
+async def get_trackers_for_client(client_id: str, request: Request, user: User = Depends(get_current_active_user), tracker_db: TrackersTable = Depends(get_trackers_table)):
     try:
+        etag = records_etag(tracker_db.get_versions_by_client_id(client_id, user.username))
+        if etag_matches(request, etag):
+            log_read_event('get_trackers_for_client', client_id, user, message="Not modified")
+            return not_modified(etag)
         trackers = tracker_db.get_trackers_by_client_id(client_id, user.username)
     except Exception as e:
         LOGGER.error("Error getting trackers for client: %s", e)
         log_audit_event('get_trackers_for_client', client_id, user, success=False, message=f"Error getting trackers for client: {e}")
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=f"Error getting trackers for client: {e}")
 
-    log_audit_event('get_trackers_for_client', client_id, user)
-    return trackers
+    log_read_event('get_trackers_for_client', client_id, user)
+    return trusted_response(trackers, headers={'ETag': records_etag(tracker.model_dump(include={'id', 'version'}) for tracker in trackers)})
 
 # Update a tracker by Tracker ID
 @router.put('/', status_code=status.HTTP_200_OK, response_model=ResponseAndId, summary='Update a tracker')
-async def update_tracker(tracker: TrackerUpdate, user: User = Depends(get_current_active_user)):
+async def update_tracker(tracker: TrackerUpdate, user: User = Depends(get_current_active_user), tracker_db: TrackersTable = Depends(get_trackers_table)):
     existing_tracker: Tracker = tracker_db.get(tracker.id, user.username)
     if not existing_tracker:
         log_audit_event('update_tracker', tracker.id, user, success=False, message=f"Tracker {tracker.id} not found")
@@ -142,6 +181,7 @@ async def update_tracker(tracker: TrackerUpdate, user: User = Depends(get_curren
     if existing_tracker.version != tracker.version:
         log_audit_event('update_tracker', tracker.id, user, success=False, message=f"Tracker {tracker.id} version mismatch")
         raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=f"Tracker version conflict: {existing_tracker.id}")
+    old_tracker = existing_tracker.model_copy()
     existing_tracker.updated_username = user.username
     existing_tracker.updated_date = datetime.now()
     existing_tracker.version = str(uuid4())
@@ -154,12 +194,12 @@ async def update_tracker(tracker: TrackerUpdate, user: User = Depends(get_curren
         LOGGER.error("Error updating tracker: %s", e)
         log_audit_event('update_tracker', tracker.id, user, success=False, message=f"Error updating tracker: {e}")
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=f"Error updating tracker: {e}")
-    log_audit_event('update_tracker', tracker.id, user, old_data=existing_tracker, new_data=tracker)
+    log_audit_event('update_tracker', tracker.id, user, old_data=old_tracker, new_data=existing_tracker)
     return {'message': "Tracker updated", 'id': tracker.id, 'success': True, 'version': existing_tracker.version}
 
 # Delete a tracker
 @router.delete('/', status_code=status.HTTP_200_OK, response_model=ResponseAndId, summary='Delete a tracker')
-async def delete_tracker(tracker_id: str, user: User = Depends(get_current_active_user)):
+async def delete_tracker(tracker_id: str, user: User = Depends(get_current_active_user), tracker_db: TrackersTable = Depends(get_trackers_table)):
     tracker = tracker_db.get(tracker_id, user.username)
     if not tracker:
         log_audit_event('delete_tracker', tracker_id, user, success=False, message=f"Tracker {tracker_id} not found")
@@ -176,7 +216,7 @@ async def delete_tracker(tracker_id: str, user: User = Depends(get_current_activ
 
 # Link a document.id to the tracker document list
 @router.patch('/{tracker_id}/documents/link/{document_id}', status_code=status.HTTP_202_ACCEPTED, response_model=ResponseAndId, summary='Link a document to a tracker')
-async def link_document(tracker_id: str, document_id: str, user: User = Depends(get_current_active_user)):
+async def link_document(tracker_id: str, document_id: str, user: User = Depends(get_current_active_user), tracker_db: TrackersTable = Depends(get_trackers_table), documents: DocumentsDict = Depends(get_documents_table)):
     tracker = tracker_db.get(tracker_id, user.username)
     if not tracker:
         log_audit_event('link_document', tracker_id, user, success=False, message=f"Tracker {tracker_id} not found")
@@ -195,73 +235,134 @@ async def link_document(tracker_id: str, document_id: str, user: User = Depends(
         LOGGER.error("Error linking document to tracker: %s", e)
         log_audit_event('link_document', tracker_id, user, success=False, message=f"Error linking document to tracker: {e}")
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=f"Error linking document to tracker: {e}")
-    log_audit_event('link_document', tracker_id, user, new_data="{'document_id': document_id}")
+    log_audit_event('link_document', tracker_id, user, changes={'documents': {'added': [document_id]}})
     return {'message': "Document linked to tracker", 'id': document_id, 'version': tracker.version}
 
 # Unlink a document from a tracker
 @router.patch('/{tracker_id}/documents/unlink/{document_id}', status_code=status.HTTP_200_OK, response_model=ResponseAndId, summary='Delete a document from a tracker')
-async def unlink_document(tracker_id: str, document_id: str, user: User = Depends(get_current_active_user)):
+async def unlink_document(tracker_id: str, document_id: str, user: User = Depends(get_current_active_user), tracker_db: TrackersTable = Depends(get_trackers_table)):
     tracker = tracker_db.get(tracker_id, user.username)
     if tracker is None:
         log_audit_event('unlink_document', tracker_id, user, success=False, message=f"Tracker {tracker_id} not found")
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"Tracker not found: {tracker_id}")
     tracker_db.unlink_doc(tracker, document_id, user.username)
-    log_audit_event('unlink_document', tracker_id, user, old_data="{'document_id': document_id}")
+    log_audit_event('unlink_document', tracker_id, user, changes={'documents': {'removed': [document_id]}})
     return {'message': "Document unlinked from tracker", 'id': document_id, 'version': tracker.version}
 
 # Get all documents from a tracker
 @router.get('/{tracker_id}/documents', status_code=status.HTTP_200_OK, response_model=List[Document], summary='Get all documents from a tracker')
-async def get_documents(tracker_id: str, user: User = Depends(get_current_active_user)):
+async def get_documents(tracker_id: str, request: Request, user: User = Depends(get_current_active_user), tracker_db: TrackersTable = Depends(get_trackers_table), documents: DocumentsDict = Depends(get_documents_table)):
+    versions = tracker_db.get_document_versions(tracker_id, user.username)
+    if versions is None:
+        log_audit_event('get_documents', tracker_id, user, success=False, message=f"Tracker {tracker_id} not found")
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"Tracker not found: {tracker_id}")
+    etag = records_etag(versions)
+    log_read_event('get_documents', tracker_id, user)
+    if etag_matches(request, etag):
+        return not_modified(etag)
     tracker = tracker_db.get(tracker_id, user.username)
     if tracker is None:
-        log_audit_event('get_documents', tracker_id, user, success=False, message=f"Tracker {tracker_id} not found")
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"Tracker not found: {tracker_id}")
-    log_audit_event('get_documents', tracker_id, user)
 
     # TODO: Add username parameter to documents.get_for_tracker
-    return documents.get_for_tracker(tracker)
+    docs = documents.get_for_tracker(tracker)
+    tracker_version = {'id': tracker.id, 'version': tracker.version}
+    return trusted_response(docs, headers={'ETag': records_etag([tracker_version] + docs)})
 
 # Get list of unique categories from a tracker
 @router.get('/{tracker_id}/categories', status_code=status.HTTP_200_OK, response_model=List[str], summary='Get all categories of documents from a tracker')
-async def get_categories(tracker_id: str, user: User = Depends(get_current_active_user)):
+async def get_categories(tracker_id: str, user: User = Depends(get_current_active_user), tracker_db: TrackersTable = Depends(get_trackers_table), documents: DocumentsDict = Depends(get_documents_table)):
     tracker = tracker_db.get(tracker_id, user.username)
     if tracker is None:
         log_audit_event('get_categories', tracker_id, user, success=False, message=f"Tracker {tracker_id} not found")
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"Tracker not found: {tracker_id}")
-    log_audit_event('get_categories', tracker_id, user)
+    log_read_event('get_categories', tracker_id, user)
 
     # TODO: Add username parameter to documents.get_categories_for_tracker
     return documents.get_categories_for_tracker(tracker)
 
 # Get a list of unique category+subcategory pairs from a tracker
 @router.get('/{tracker_id}/category_subcategory_pairs', status_code=status.HTTP_200_OK, response_model=List[CategorySubcategoryResponse], summary='Get all category+subcategory pairs from a tracker')
-async def get_category_subcategory_pairs(tracker_id: str, user: User = Depends(get_current_active_user)):
+async def get_category_subcategory_pairs(tracker_id: str, user: User = Depends(get_current_active_user), tracker_db: TrackersTable = Depends(get_trackers_table), documents: DocumentsDict = Depends(get_documents_table)):
     tracker = tracker_db.get(tracker_id, user.username)
     if tracker is None:
         log_audit_event('get_category_subcategory_pairs', tracker_id, user, success=False, message=f"Tracker {tracker_id} not found")
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"Tracker not found: {tracker_id}")
-    log_audit_event('get_category_subcategory_pairs', tracker_id, user)
+    log_read_event('get_category_subcategory_pairs', tracker_id, user)
 
     # TODO: Add username parameter to documents.get_category_subcategory_pairs_for_tracker
     return documents.get_category_subcategory_pairs_for_tracker(tracker)
 
 # Get datasets for a tracker
 @router.get('/{tracker_id}/datasets/{dataset_name}', status_code=status.HTTP_200_OK, response_model=TrackerDatasetResponse, summary='Get datasets for a tracker')
-async def get_datasets(tracker_id: str, dataset_name: str, user: User = Depends(get_current_active_user)):
+async def get_datasets(tracker_id: str, dataset_name: str, user: User = Depends(get_current_active_user), tracker_db: TrackersTable = Depends(get_trackers_table)):
     tracker = tracker_db.get(tracker_id, user.username)
     if tracker is None:
         log_audit_event('get_datasets', tracker_id, user, success=False, message=f"Tracker {tracker_id} not found")
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"Tracker not found: {tracker_id}")
-    log_audit_event('get_datasets', tracker_id, user, dataset_name)
+    log_read_event('get_datasets', tracker_id, user, dataset_name)
     result = tracker_db.get_dataset(tracker, dataset_name, user.username)
-    return result
+    return trusted_response(result)
 
 # Get compliance matrix for a tracker
 @router.get('/{tracker_id}/compliance_matrix/{classification}', status_code=status.HTTP_200_OK, summary='Get compliance matrix for a tracker')
-async def get_compliance_matrix(tracker_id: str, classification: str, user: User = Depends(get_current_active_user)):
+async def get_compliance_matrix(tracker_id: str, classification: str, user: User = Depends(get_current_active_user), tracker_db: TrackersTable = Depends(get_trackers_table)):
     tracker = tracker_db.get(tracker_id, user.username)
     if tracker is None:
         log_audit_event('get_compliance_matrix', tracker_id, user, success=False, message=f"Tracker {tracker_id} not found")
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"Tracker not found: {tracker_id}")
-    log_audit_event('get_compliance_matrix', tracker_id, user, classification)
-    return tracker_db.get_compliance_matrix(tracker, classification, user.username)
+    log_read_event('get_compliance_matrix', tracker_id, user, classification)
+    return trusted_response(tracker_db.get_compliance_matrix(tracker, classification, user.username))
+
+# Queue a task for every document in a tracker
+@router.post('/{tracker_id}/enqueue/{task}', status_code=status.HTTP_201_CREATED, response_model=QueueBatchResponse, summary="Queue a task for a tracker's documents")
+async def enqueue_tracker_task(
+    tracker_id: str,
+    task: str,
+    model: str = 'default',
+    unprocessed_only: bool = True,
+    force: bool = False,
+    idempotency_key: Optional[str] = Header(None),
+    user: User = Depends(get_current_active_user),
+    submitter: JobSubmitter = Depends(get_job_submitter),
+    tracker_db: TrackersTable = Depends(get_trackers_table),
+    documents: DocumentsDict = Depends(get_documents_table),
+):
+    """
+    Queue a task for each of a tracker's documents, as one batch
+
+    Documents whose task is already queued or running are not queued again
+    unless force is set.
+
+    Args:
+        tracker_id (str): The tracker
+        task (str): The task, e.g. 'classify'
+        model (str): The model the task should use
+        unprocessed_only (bool): Skip documents the task has already processed. Only
+            applies to tasks that record their result on the document (see TASK_RESULT_FIELDS).
+        force (bool): Queue the task even for documents where it is already queued or running
+        idempotency_key (str): Optional Idempotency-Key header, so that a client can safely retry
+
+    Returns:
+        QueueBatchResponse: The batch id and one request id per queued document
+    """
+    if task == 'stop':
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="The stop task cannot be queued for a tracker")
+    try:
+        # Check the task, model and username once, before reading any documents
+        QueueRequest(task=task, payload={'doc_id': '', 'model': model}, username=user.username)
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    tracker = tracker_db.get(tracker_id, user.username)
+    if tracker is None:
+        log_audit_event('enqueue_tracker_task', tracker_id, user, success=False, message=f"Tracker {tracker_id} not found")
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"Tracker not found: {tracker_id}")
+
+    doc_ids = documents.get_ids_for_tracker(tracker, TASK_RESULT_FIELDS.get(task) if unprocessed_only else None)
+    requests = [
+        QueueRequest(task=task, payload={'doc_id': doc_id, 'model': model}, username=user.username)
+        for doc_id in doc_ids
+    ]
+    result = await submitter.submit_batch(requests, user.username, idempotency_key, force)
+    log_audit_event('enqueue_tracker_task', tracker_id, user, message=f"Batch {result['batch_id']}: {result['count']} {task} tasks")
+    return result
@@ -1,24 +1,33 @@
 """
 documents.py - Falcon API Routers for Documents
 """
+import csv
 from datetime import datetime
+import io
 import logging
+from typing import Dict, List, Optional
 from uuid import uuid4
-from fastapi import APIRouter, Depends, HTTPException, status
+import zipfile
+from fastapi import APIRouter, Depends, HTTPException, Request, Response, status
+from fastapi.responses import StreamingResponse
 from fastapi.security import OAuth2PasswordBearer
 from auth.handler import get_current_active_user
-from models.document import Document, PutExtendedDocumentProperties, ExtendedDocumentProperties, DocumentCsvTables, DocumentObjTables, DocumentClassificationStatus
+from models.document import Document, PutExtendedDocumentProperties, ExtendedDocumentProperties, DocumentCsvTables, DocumentObjTables, DocumentClassificationStatus, DocumentBatchRequest, DocumentBatchDeleteResponse
 from models.response import ResponseAndId, ResponseAndVersion
 from models.user import User
 from database.documents_table import DocumentsDict
 from database.extendedprops_table import ExtendedPropertiesDict
 from database.classification_tasks import ClassificationTasksTable, ClassificationStatus
+from database.dependencies import get_documents_table, get_extended_properties, get_trackers_table
 from database.trackers_table import TrackersTable
 from routers.api_version import APIVersion
+from util.etag import etag_matches, make_etag, not_modified
+from util.responses import trusted_response
 
 
 API_VERSION = APIVersion(1, 0).to_str()
 ROUTE_PREFIX = '/documents'
+CSV_STREAM_CHUNK_ROWS = 500  # Number of CSV rows to buffer before sending them to the client
 LOGGER = logging.getLogger(f'falconapi{ROUTE_PREFIX}')
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl=f'api/{API_VERSION}{ROUTE_PREFIX}/token')
 
@@ -28,13 +37,10 @@ router = APIRouter(
     responses={404: {"description": "Not found"}}
 )
 
-documents = DocumentsDict()
-extendedprops = ExtendedPropertiesDict()
-trackers = TrackersTable()
 
 # Add a document
 @router.post('/', status_code=status.HTTP_201_CREATED, response_model=ResponseAndId, summary='Add a document')
-async def add_document(doc: Document, user: User = Depends(get_current_active_user)):
+async def add_document(doc: Document, user: User = Depends(get_current_active_user), documents: DocumentsDict = Depends(get_documents_table)):
     if doc.id in documents:
         raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=f"Document already exists: {doc.id}")
     if documents.get_by_path(doc.path):
@@ -50,7 +56,9 @@ async def add_document(doc: Document, user: User = Depends(get_current_active_us
 @router.post('/props', status_code=status.HTTP_201_CREATED, response_model=ResponseAndId, summary="Add extended document properties")
 # pylint: disable=unused-argument
 async def add_document_props(
-    props: PutExtendedDocumentProperties, user: User = Depends(get_current_active_user)
+    props: PutExtendedDocumentProperties, user: User = Depends(get_current_active_user),
+    documents: DocumentsDict = Depends(get_documents_table),
+    extendedprops: ExtendedPropertiesDict = Depends(get_extended_properties),
 ):
     document_id = props.id  # Link to document for these props
 
@@ -73,37 +81,47 @@ async def add_document_props(
 
 # Get a document by ID or path
 @router.get('/', status_code=status.HTTP_200_OK, response_model=Document, summary='Get a document by ID or path')
-async def get_document(doc_id: str = '', path: str = '', user: User = Depends(get_current_active_user)):
-    if doc_id:
-        doc = documents.get(doc_id)
-        if not doc:
-            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"Document not found: {doc_id}")
-        if doc.added_username != user.username and not user.admin:
-            raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Unauthorized")
-        return doc
-
-    if path:
-        doc = documents.get_by_path(path)
-        if not doc:
-            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"Document not found: {path}")
-        if doc.added_username != user.username and not user.admin:
-            raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Unauthorized")
-        return doc
-
-    raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Must provide either doc_id or path")
+async def get_document(request: Request, response: Response, doc_id: str = '', path: str = '', user: User = Depends(get_current_active_user), documents: DocumentsDict = Depends(get_documents_table)):
+    if not doc_id and not path:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Must provide either doc_id or path")
+
+    # Check the version first so that an unchanged document costs one small read
+    key, field = (doc_id, 'id') if doc_id else (path, 'path')
+    info = documents.get_version_info(key, field)
+    if not info:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"Document not found: {key}")
+    if info.get('added_username') != user.username and not user.admin:
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Unauthorized")
+    etag = make_etag(info.get('version'))
+    if etag_matches(request, etag):
+        return not_modified(etag)
+
+    doc = documents.get(doc_id) if doc_id else documents.get_by_path(path)
+    if not doc:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"Document not found: {key}")
+    if doc.version:
+        response.headers['ETag'] = make_etag(doc.version)
+    return doc
 
 # Get extended document properties
 @router.get('/props', status_code=status.HTTP_200_OK, response_model=ExtendedDocumentProperties, summary='Get extended document properties')
-async def get_document_props(doc_id: str, user: User = Depends(get_current_active_user)):
-    if doc_id not in extendedprops:
+async def get_document_props(doc_id: str, request: Request, user: User = Depends(get_current_active_user), documents: DocumentsDict = Depends(get_documents_table), extendedprops: ExtendedPropertiesDict = Depends(get_extended_properties)):
+    etag = make_etag(extendedprops.get_version(doc_id))
+    if not etag:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"Extended properties not found for document: {doc_id}")
-    if documents[doc_id].added_username != user.username and not user.admin:
+    info = documents.get_version_info(doc_id) or {}
+    if info.get('added_username') != user.username and not user.admin:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Unauthorized")
-    return extendedprops[doc_id]
+    if etag_matches(request, etag):
+        return not_modified(etag)
+    props = extendedprops.get_props(doc_id)
+    if not props:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"Extended properties not found for document: {doc_id}")
+    return trusted_response(props, headers={'ETag': make_etag(props.version)})
 
 # Get a document's Tables - CSV or JSON Formats
 @router.get('/tables/csv', status_code=status.HTTP_200_OK, response_model=DocumentCsvTables, summary='Get a document\'s Tables in CSV format')
-async def get_document_tables_csv(doc_id: str, user: User = Depends(get_current_active_user)):
+async def get_document_tables_csv(doc_id: str, user: User = Depends(get_current_active_user), documents: DocumentsDict = Depends(get_documents_table), extendedprops: ExtendedPropertiesDict = Depends(get_extended_properties)):
     if doc_id not in extendedprops:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"Extended properties not found for document: {doc_id}")
     if documents[doc_id].added_username != user.username and not user.admin:
@@ -132,33 +150,158 @@ def make_csv_tables(tables: dict):
         csv_tables[table_id] = {'headers': table_rows, 'data': data_rows}
     return csv_tables
 
+def csv_rows(table: list):
+    """
+    Generate the rows of a table for a CSV writer, starting with the header row
+
+    Args:
+        table (list): A stored table, i.e. a list of dicts that all share the first row's keys
+
+    Yields:
+        list: The header row followed by each data row
+    """
+    headers = list(table[0].keys())
+    yield headers
+    for row in table:
+        yield [row.get(header, '') for header in headers]
+
+def iter_csv_table(table: list, chunk_rows: int = CSV_STREAM_CHUNK_ROWS):
+    """
+    Stream a table as CSV, a chunk of rows at a time
+
+    Args:
+        table (list): A stored table
+        chunk_rows (int): Number of rows to buffer before yielding
+
+    Yields:
+        bytes: UTF-8 encoded CSV text
+    """
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for row_count, row in enumerate(csv_rows(table), start=1):
+        writer.writerow(row)
+        if row_count % chunk_rows == 0:
+            yield buffer.getvalue().encode('utf-8')
+            buffer.seek(0)
+            buffer.truncate(0)
+    if buffer.tell():
+        yield buffer.getvalue().encode('utf-8')
+
+class ZipStreamBuffer():
+    """
+    Write-only, non-seekable file object for ZipFile that hands back whatever
+    has been written since it was last drained.
+    """
+    def __init__(self):
+        self.chunks = []
+
+    def write(self, data: bytes) -> int:
+        self.chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self) -> bytes:
+        data = b''.join(self.chunks)
+        self.chunks = []
+        return data
+
+def iter_csv_zip(tables: dict, chunk_rows: int = CSV_STREAM_CHUNK_ROWS):
+    """
+    Stream several tables as a zip archive containing one CSV file per table
+
+    Args:
+        tables (dict): Stored tables keyed by table_id
+        chunk_rows (int): Number of rows to buffer before yielding
+
+    Yields:
+        bytes: Zip archive content
+    """
+    buffer = ZipStreamBuffer()
+    with zipfile.ZipFile(buffer, mode='w', compression=zipfile.ZIP_DEFLATED) as archive:
+        for table_id, table in tables.items():
+            with archive.open(f'{table_id}.csv', mode='w') as entry:
+                text_entry = io.TextIOWrapper(entry, encoding='utf-8', newline='')
+                writer = csv.writer(text_entry)
+                for row_count, row in enumerate(csv_rows(table), start=1):
+                    writer.writerow(row)
+                    if row_count % chunk_rows == 0:
+                        text_entry.flush()
+                        yield buffer.drain()
+                text_entry.flush()
+                text_entry.detach()
+            yield buffer.drain()
+    yield buffer.drain()
+
+# Download a document's tables as a CSV file (one table) or a zip of CSV files (several tables)
+@router.get('/tables/csv/download', status_code=status.HTTP_200_OK, response_class=StreamingResponse, summary='Download a document\'s Tables as CSV (one table) or a zip of CSV files')
+async def download_document_tables_csv(doc_id: str, table_id: str = None, user: User = Depends(get_current_active_user), documents: DocumentsDict = Depends(get_documents_table), extendedprops: ExtendedPropertiesDict = Depends(get_extended_properties)):
+    doc = documents.get(doc_id)
+    if not doc:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"Document not found: {doc_id}")
+    if doc.added_username != user.username and not user.admin:
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Unauthorized")
+    xprops = extendedprops.get_tables(doc_id, table_id)
+    if not xprops:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"Extended properties not found for document: {doc_id}")
+    tables = {
+        tid: table for tid, table in (xprops.get('tables') or {}).items()
+        if isinstance(table, list) and table
+    }
+    if table_id and table_id not in tables:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"Table not found: {table_id}")
+    if not tables:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"Document does not have tables: {doc_id}")
+
+    if len(tables) == 1:
+        only_table_id, table = next(iter(tables.items()))
+        headers = {'Content-Disposition': f'attachment; filename="{doc_id}-{only_table_id}.csv"'}
+        return StreamingResponse(iter_csv_table(table), media_type='text/csv', headers=headers)
+    headers = {'Content-Disposition': f'attachment; filename="{doc_id}-tables.zip"'}
+    return StreamingResponse(iter_csv_zip(tables), media_type='application/zip', headers=headers)
+
 @router.get('/tables/json', status_code=status.HTTP_200_OK, response_model=DocumentObjTables, summary='Get a document\'s Tables in JSON format')
-async def get_document_tables_json(doc_id: str, user: User = Depends(get_current_active_user)):
-    if doc_id not in extendedprops:
+async def get_document_tables_json(doc_id: str, request: Request, user: User = Depends(get_current_active_user), documents: DocumentsDict = Depends(get_documents_table), extendedprops: ExtendedPropertiesDict = Depends(get_extended_properties)):
+    etag = make_etag(extendedprops.get_version(doc_id))
+    if not etag:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"Extended properties not found for document: {doc_id}")
-    if documents[doc_id].added_username != user.username and not user.admin:
-        LOGGER.error("Username mismatch:", documents[doc_id].added_username, "vs.", user.username)
+    info = documents.get_version_info(doc_id) or {}
+    if info.get('added_username') != user.username and not user.admin:
+        LOGGER.error("Username mismatch: %s vs. %s", info.get('added_username'), user.username)
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Unauthorized")
-    xprops = extendedprops.get(doc_id) or {}
-    return {'id': doc_id, 'tables': xprops.get('tables', {}) or {}, 'version': xprops.get('version', '*unversioned*')}
+    if etag_matches(request, etag):
+        return not_modified(etag)
+    xprops = extendedprops.get_tables(doc_id) or {}
+    version = xprops.get('version', '*unversioned*')
+    return trusted_response({'id': doc_id, 'tables': xprops.get('tables', {}) or {}, 'version': version}, headers={'ETag': make_etag(version)})
 
 # Get the document's version
 @router.get('/version', status_code=status.HTTP_200_OK, response_model=ResponseAndVersion, summary='Get a document\'s version. Can also be used to check if a document exists.')
-async def get_document_version(doc_id: str, user: User = Depends(get_current_active_user)):
+async def get_document_version(doc_id: str, user: User = Depends(get_current_active_user), documents: DocumentsDict = Depends(get_documents_table)):
     LOGGER.info(f"VERSION: Checking version for document: %s", doc_id)
-    if doc_id not in documents:
+    info = documents.get_version_info(doc_id)
+    if not info:
         LOGGER.error(f"VERSION: Document not found: %s", doc_id)
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"Document not found: {doc_id}")
-    if documents[doc_id].added_username != user.username and not user.admin:
-        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail=f"Unauthorized - username mismatch. Added by {documents[doc_id].added_username} but requested by {user.username}")
-    doc = documents.get(doc_id)
-    if doc:
-        return {'message': "Document version", 'id': doc_id, 'version': doc.version}
-    return {'message': "Document not found", 'id': doc_id, 'version': None}
+    if info.get('added_username') != user.username and not user.admin:
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail=f"Unauthorized - username mismatch. Added by {info.get('added_username')} but requested by {user.username}")
+    return {'message': "Document version", 'id': doc_id, 'version': info.get('version')}
+
+# Get the versions of many documents
+@router.post('/versions', status_code=status.HTTP_200_OK, response_model=Dict[str, Optional[str]], summary='Get the versions of many documents. Documents that do not exist, or that you may not see, have a version of null.')
+async def get_document_versions(batch: DocumentBatchRequest, user: User = Depends(get_current_active_user), documents: DocumentsDict = Depends(get_documents_table)):
+    versions = documents.get_versions(batch.ids, None if user.admin else user.username)
+    return trusted_response({doc_id: versions.get(doc_id) for doc_id in batch.ids})
+
+# Get many documents at once
+@router.post('/batch', status_code=status.HTTP_200_OK, response_model=List[Document], summary='Get many documents by ID. Documents that do not exist, or that you may not see, are left out.')
+async def get_documents_batch(batch: DocumentBatchRequest, user: User = Depends(get_current_active_user), documents: DocumentsDict = Depends(get_documents_table)):
+    return trusted_response(documents.get_many(batch.ids, None if user.admin else user.username))
 
 # Delete a table from a document given the table_id and the document_id
 @router.delete('/tables', status_code=status.HTTP_200_OK, response_model=ResponseAndId, summary='Delete a table from a document')
-async def delete_document_table(doc_id: str, table_id: str, user: User = Depends(get_current_active_user)):
+async def delete_document_table(doc_id: str, table_id: str, user: User = Depends(get_current_active_user), documents: DocumentsDict = Depends(get_documents_table), extendedprops: ExtendedPropertiesDict = Depends(get_extended_properties)):
     if doc_id not in extendedprops:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"Extended properties not found for document: {doc_id}")
     if documents[doc_id].added_username != user.username and not user.admin:
@@ -187,7 +330,7 @@ async def delete_document_table(doc_id: str, table_id: str, user: User = Depends
 
 # Update a document
 @router.put('/', status_code=status.HTTP_200_OK, response_model=ResponseAndId, summary='Update a document')
-async def update_document(doc: Document, user: User = Depends(get_current_active_user)):
+async def update_document(doc: Document, user: User = Depends(get_current_active_user), documents: DocumentsDict = Depends(get_documents_table)):
     if not doc.id in documents:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"Document not found: {doc.id}")
     if doc.version != documents[doc.id].version:
@@ -222,7 +365,9 @@ async def update_document(doc: Document, user: User = Depends(get_current_active
 # Update extended document properties
 @router.put('/props', status_code=status.HTTP_200_OK, response_model=ResponseAndId, summary='Update extended document properties')
 async def update_document_props(
-    props: PutExtendedDocumentProperties, user: User = Depends(get_current_active_user)
+    props: PutExtendedDocumentProperties, user: User = Depends(get_current_active_user),
+    documents: DocumentsDict = Depends(get_documents_table),
+    extendedprops: ExtendedPropertiesDict = Depends(get_extended_properties),
 ):
     if props.id not in extendedprops:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"Extended properties not found for document: {props.id}")
@@ -260,12 +405,12 @@ def update_tables(existing_tables: dict, new_tables: dict):
 # TODO: Do not delete a document if it is in other trackers - Switch.
 # TODO: Delete references to the document from trackers
 @router.delete('/', status_code=status.HTTP_200_OK, response_model=ResponseAndId, summary='Delete a document')
-async def delete_document(doc_id: str, cascade: bool = True, user: User = Depends(get_current_active_user)):
-    should_cascade = cascade == 'true'
-    if not doc_id in documents:
+async def delete_document(doc_id: str, cascade: bool = True, user: User = Depends(get_current_active_user), documents: DocumentsDict = Depends(get_documents_table), extendedprops: ExtendedPropertiesDict = Depends(get_extended_properties), trackers: TrackersTable = Depends(get_trackers_table)):
+    should_cascade = cascade
+    doc = documents.get_version_info(doc_id)
+    if not doc:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"Document not found: {doc_id}")
-    doc = documents.get(doc_id)
-    if doc.added_username != user.username and not user.admin:
+    if doc.get('added_username') != user.username and not user.admin:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Unauthorized")
     trackers_linked_to_doc = trackers.get_trackers_linked_to_doc(doc_id)
 
@@ -281,13 +426,48 @@ async def delete_document(doc_id: str, cascade: bool = True, user: User = Depend
 
     # This document is in other trackers and the cascade flag is set to true - we can delete it.
     del documents[doc_id]
-    trackers.delete_document_from_trackers(doc_id)
+    unauthorized_trackers = trackers.delete_document_from_trackers(doc_id, user.username)['unauthorized_trackers']
+    if unauthorized_trackers:
+        LOGGER.warning("Deleted document %s is still in trackers %s, which %s may not update", doc_id, unauthorized_trackers, user.username)
     del extendedprops[doc_id]
-    return {'message': "Document deleted", 'id': doc_id, 'version': doc.version}
+    return {'message': "Document deleted", 'id': doc_id, 'version': doc.get('version')}
+
+# Delete many documents
+@router.post('/batch/delete', status_code=status.HTTP_200_OK, response_model=DocumentBatchDeleteResponse, summary='Delete many documents and their extended properties')
+async def delete_documents_batch(batch: DocumentBatchRequest, cascade: bool = True, user: User = Depends(get_current_active_user), documents: DocumentsDict = Depends(get_documents_table), extendedprops: ExtendedPropertiesDict = Depends(get_extended_properties), trackers: TrackersTable = Depends(get_trackers_table)):
+    doc_ids = list(dict.fromkeys(batch.ids))
+    owners = documents.get_owners(doc_ids)
+    not_found = [doc_id for doc_id in doc_ids if doc_id not in owners]
+    unauthorized = [doc_id for doc_id in doc_ids if doc_id in owners and owners[doc_id] != user.username and not user.admin]
+    candidates = [doc_id for doc_id in doc_ids if doc_id in owners and doc_id not in unauthorized]
+
+    in_trackers = []
+    if candidates and not cascade:
+        linked = trackers.get_linked_document_ids(candidates)
+        in_trackers = [doc_id for doc_id in candidates if doc_id in linked]
+        candidates = [doc_id for doc_id in candidates if doc_id not in linked]
+
+    trackers_updated, trackers_not_updated = 0, []
+    if candidates:
+        documents.delete_many(candidates)
+        if cascade:
+            result = trackers.delete_documents_from_trackers(candidates, user.username)
+            trackers_updated, trackers_not_updated = result['trackers'], result['unauthorized_trackers']
+        extendedprops.delete_many(candidates)
+    LOGGER.info("Batch delete by %s: %d deleted, %d trackers updated", user.username, len(candidates), trackers_updated)
+    return {
+        'message': f"{len(candidates)} documents deleted",
+        'deleted': candidates,
+        'not_found': not_found,
+        'unauthorized': unauthorized,
+        'in_trackers': in_trackers,
+        'trackers_updated': trackers_updated,
+        'trackers_not_updated': trackers_not_updated,
+    }
 
 # Delete extended document properties
 @router.delete('/props', status_code=status.HTTP_200_OK, response_model=ResponseAndId, summary='Delete extended document properties')
-async def delete_document_props(doc_id: str, user: User = Depends(get_current_active_user)):
+async def delete_document_props(doc_id: str, user: User = Depends(get_current_active_user), documents: DocumentsDict = Depends(get_documents_table), extendedprops: ExtendedPropertiesDict = Depends(get_extended_properties)):
     if doc_id not in extendedprops:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"Extended properties not found for document: {doc_id}")
     if documents[doc_id].added_username != user.username and not user.admin:
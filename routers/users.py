@@ -10,12 +10,12 @@ from pydantic import BaseModel
 from passlib.context import CryptContext
 from models.user import User, UserRegistration, RegistrationResponse
 from routers.api_version import APIVersion
+from database.dependencies import get_users_table
 from database.users_table import UsersTable
 from auth.handler import create_access_token, get_current_active_user, Token
 
 
 API_VERSION = APIVersion(1, 0).to_str()
-USERS_TABLE = UsersTable()
 ROUTE_PREFIX = '/users'
 SITE_CODES_FILE = 'site_codes.json'
 
@@ -72,7 +72,7 @@ def authenticate_user(username: str, password: str) -> User:
     Returns:
         User: The user object if the username and password match, None otherwise.
     """
-    user = USERS_TABLE.get_user_by_username(username)
+    user = get_users_table().get_user_by_username(username)
     if not user:
         return None
     if not verify_password(password, user.hashed_password):
@@ -124,7 +124,7 @@ async def read_users_me(current_user: User = Depends(get_current_active_user)) -
     responses={404: {'model': LookupException, 'description': "User ID not found"}},
     summary="Lookup a user by id"
 )
-async def get_user(user_id: str, site_code: str) -> User:
+async def get_user(user_id: str, site_code: str, users_table: UsersTable = Depends(get_users_table)) -> User:
     """
     Lookup a user by user ID.
 
@@ -137,7 +137,7 @@ async def get_user(user_id: str, site_code: str) -> User:
     """
     if not validate_site_code(site_code):
         raise HTTPException(status_code=403, detail="Unauthorized site for user retrieval")
-    user: User = USERS_TABLE.get_user_by_id(user_id)
+    user: User = users_table.get_user_by_id(user_id)
     if not user:
         raise HTTPException(status_code=404, detail=f"User ID {user_id} not found.")
     return user
@@ -149,7 +149,7 @@ async def get_user(user_id: str, site_code: str) -> User:
     responses={400: {"model": InsertException, "description": "User already exists"}},
     summary="Register a new user"
 )
-async def register_user(user_registration: UserRegistration) -> RegistrationResponse:
+async def register_user(user_registration: UserRegistration, users_table: UsersTable = Depends(get_users_table)) -> RegistrationResponse:
     """
     Register a new user
 
@@ -164,7 +164,7 @@ async def register_user(user_registration: UserRegistration) -> RegistrationResp
     """
     if not validate_site_code(user_registration.site_code):
         raise HTTPException(status_code=403, detail="Unauthorized site for user registration")
-    user = USERS_TABLE.get_user_by_username(user_registration.username)
+    user = users_table.get_user_by_username(user_registration.username)
     if user:
         raise HTTPException(status_code=400, detail="User already exists")
     hashed_password = get_password_hash(user_registration.password)
@@ -179,7 +179,7 @@ async def register_user(user_registration: UserRegistration) -> RegistrationResp
         phone_number=user_registration.phone_number.strip(),
         id=user_registration.id
     )
-    result = USERS_TABLE.create_user(user)
+    result = users_table.create_user(user)
     return {
         'username': user.username,
         'message': 'User created successfully',
@@ -192,6 +192,7 @@ async def change_password(
     old_password: str,
     new_password: str,
     current_user: User = Depends(get_current_active_user),
+    users_table: UsersTable = Depends(get_users_table),
 ) -> RegistrationResponse:
     # 1) Verify current_user has permission or matches user_id
     user = authenticate_user(current_user.username, old_password)
@@ -206,7 +207,7 @@ async def change_password(
     hashed_password = get_password_hash(new_password)
 
     # 3) Update the password in the database
-    USERS_TABLE.update_password(current_user.id, hashed_password)
+    users_table.update_password(current_user.id, hashed_password)
 
     return {
         'username': current_user.username,
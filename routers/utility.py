@@ -2,25 +2,29 @@
 utility.py - Falcon API Routers for a collection of utility functions
 """
 from datetime import datetime
+import json
 import logging
 import os
+from typing import List, Optional
 from dotenv import load_dotenv
-from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException, status
+from fastapi import APIRouter, BackgroundTasks, Depends, Header, HTTPException, Query, Request, Response, status
+from fastapi.responses import StreamingResponse
+from database.dependencies import get_documents_table
+from database.documents_table import DocumentsDict
 from routers.api_version import APIVersion
-from util.utility import Utilities
-from models.realproperty import RealPropertyInfoRequest, RealPropertyInfoResponse
-from models.queue_request import QueueRequest
+from util.attom import ATTOM
+from util.job_queue import JobSubmitter
+from util.job_status import FINAL_STATUSES, JobStatusStore
+from models.realproperty import RealPropertyBatchRequest, RealPropertyBatchResponse, RealPropertyInfoRequest, RealPropertyInfoResponse
+from models.queue_request import JobStatusUpdate, QueueBatchRequest, QueueBatchResponse, QueueBatchStatus, QueueRequest
 from models.user import User
-from distributed_work_queue.workqueue import DistributedWorkQueue
-from distributed_work_queue.jobstatus import JobStatus
 from auth.handler import get_current_active_user
+from util.tracing import traced_call
 
 load_dotenv()
 API_VERSION = APIVersion(1, 0).to_str()
 ROUTE_PREFIX = '/util'
 LOGGER = logging.getLogger(f'falconapi{ROUTE_PREFIX}')
-# Global job status object
-JOBSTATUS = JobStatus()
 
 
 router = APIRouter(
@@ -29,54 +33,257 @@ router = APIRouter(
     responses={404: {"description": "Not found in Utility Functions"}},
 )
 
-work_queue = DistributedWorkQueue(
-    os.getenv("WORK_QUEUE_HOST", 'localhost'),
-    int(os.getenv("WORK_QUEUE_PORT", "6379")),
-    int(os.getenv("WORK_QUEUE_DB", "0")),
-    os.getenv("WORK_QUEUE_NAME_CLASSIFY", 'classification_queue'),
-)
+work_queue_name = os.getenv("WORK_QUEUE_NAME_CLASSIFY", 'classification_queue')
+work_queue_host = os.getenv("WORK_QUEUE_HOST", 'localhost')
+work_queue_port = int(os.getenv("WORK_QUEUE_PORT", "6379"))
+work_queue_db = int(os.getenv("WORK_QUEUE_DB", "0"))
+MAX_STREAM_REQUEST_IDS = int(os.getenv("MAX_STREAM_REQUEST_IDS", "100"))
+
+# The Redis-backed work queue and job status objects are created on first use
+# (the app's lifespan hook creates them at startup), not when this module is imported.
+_work_queue = None
+_job_status = None
+
+def get_work_queue():
+    """
+    Dependency that returns the shared work queue, creating it if needed
+    """
+    global _work_queue
+    if _work_queue is None:
+        from distributed_work_queue.workqueue import DistributedWorkQueue
+        _work_queue = DistributedWorkQueue(work_queue_host, work_queue_port, work_queue_db, work_queue_name)
+    return _work_queue
+
+def get_job_status() -> JobStatusStore:
+    """
+    Dependency that returns the shared job status store, creating it if needed
+
+    Job statuses live in the work queue's Redis server, so every worker sees them.
+    """
+    global _job_status
+    if _job_status is None:
+        _job_status = JobStatusStore(work_queue_host, work_queue_port, work_queue_db)
+    return _job_status
+
+async def close_job_status() -> None:
+    """
+    Close the job status store's Redis connections at shutdown
+    """
+    global _job_status
+    if _job_status is not None:
+        await _job_status.aclose()
+        _job_status = None
 
 # Retrieve property description and valuation data from ATTOM Data Solutions
 @router.get('/property', status_code=status.HTTP_200_OK, response_model=RealPropertyInfoResponse, summary='Get Property Details')
 # async def get_property_details(info_request: RealPropertyInfoRequest):
-async def get_property_details(address: str, city: str, state: str, zip_code: str):
+async def get_property_details(address: str, city: str, state: str, zip_code: str, force_refresh: bool = False):
     """
     Retrieve property description and valuation data from ATTOM Data Solutions
 
+    Results are cached; see util/attom.py.
+
     Args:
         address (str): Street address
         city (str): City
         state (str): State
         zip_code (str): Zip code
+        force_refresh (bool): Fetch fresh data from ATTOM instead of the cache
 
     Returns:
         dict: Property details
     """
-    return Utilities.get_property_details(address, city, state, zip_code)
+    return await ATTOM.get_property_details(address, city, state, zip_code, force_refresh)
+
+# Look up many properties in one request
+@router.post('/property/batch', status_code=status.HTTP_200_OK, response_model=RealPropertyBatchResponse, summary='Get Details for Many Properties')
+async def get_property_details_batch(request: RealPropertyBatchRequest):
+    """
+    Retrieve property details for a list of addresses
+
+    Duplicate addresses are looked up once, cached properties come from the
+    cache, and the rest are fetched from ATTOM concurrently. A failed lookup
+    does not fail the request: its result has the error's status_code and detail.
+
+    Args:
+        request (RealPropertyBatchRequest): The addresses
+
+    Returns:
+        RealPropertyBatchResponse: One result per address, in the same order
+    """
+    results = await ATTOM.get_property_details_batch(
+        [address.model_dump() for address in request.addresses], request.force_refresh
+    )
+    found = sum(1 for result in results if result['status_code'] == status.HTTP_200_OK)
+    return {'results': results, 'found': found, 'failed': len(results) - found}
+
 
+def get_job_submitter(
+    work_queue = Depends(get_work_queue),
+    job_status: JobStatusStore = Depends(get_job_status),
+    documents: DocumentsDict = Depends(get_documents_table),
+) -> JobSubmitter:
+    """
+    Dependency that returns a JobSubmitter for the shared work queue
+    """
+    return JobSubmitter(work_queue, job_status, work_queue_name, documents.get_versions)
 
 # Queue a request for processing
 @router.post('/enqueue', status_code=status.HTTP_201_CREATED, summary='Queue a Request')
 async def queue_request(
     request: QueueRequest,
     background_tasks: BackgroundTasks,
+    response: Response,
+    force: bool = False,
+    idempotency_key: Optional[str] = Header(None),
     user: User = Depends(get_current_active_user),
+    submitter: JobSubmitter = Depends(get_job_submitter),
 ):
     """
     Queue a request for processing
 
+    If the same task is already queued or running for the same version of
+    the document with the same model, or a request with the same
+    Idempotency-Key header was already accepted, nothing is queued. The
+    response then has status 200, the existing job's id and "duplicate": true.
+    See util/job_queue.py.
+
     Args:
         request (QueueRequest): Request to be queued
         background_tasks (BackgroundTasks): Background tasks to be executed
+        force (bool): Queue the request even if the same work is already queued or running
+        idempotency_key (str): Optional Idempotency-Key header, so that a client can safely retry
     """
     if request.task == 'stop':
         LOGGER.info(f"Ignoring {request.task} task")
         return {"message": f"{request.task} task ignored, fucko", "id": request.request_id}
-    work_queue.enqueue_work(request.json())
-    JOBSTATUS.add_job(request.request_id)
-    return {"message": f"{request.task} task queued", "id": request.request_id}
+    result = await submitter.submit(request, user.username, idempotency_key, force)
+    if result['duplicate']:
+        response.status_code = status.HTTP_200_OK
+    return result
+
+# Queue many requests at once
+@router.post('/enqueue/batch', status_code=status.HTTP_201_CREATED, response_model=QueueBatchResponse, summary='Queue Many Requests')
+async def queue_requests(
+    request: QueueBatchRequest,
+    force: bool = False,
+    idempotency_key: Optional[str] = Header(None),
+    user: User = Depends(get_current_active_user),
+    submitter: JobSubmitter = Depends(get_job_submitter),
+):
+    """
+    Queue many requests in one call
+
+    The requests are queued together and grouped under a batch id. Follow
+    their progress with /util/status/batch. Work that is already queued or
+    running is not queued again unless force is set (see util/job_queue.py).
+
+    Args:
+        request (QueueBatchRequest): Requests to be queued
+        force (bool): Queue every request even if the same work is already queued or running
+        idempotency_key (str): Optional Idempotency-Key header, so that a client can safely retry
+
+    Returns:
+        QueueBatchResponse: The batch id and the request ids
+    """
+    return await submitter.submit_batch(request.requests, user.username, idempotency_key, force)
 
 # Check the status of a queued request
 @router.get('/status', status_code=status.HTTP_200_OK, summary='Check the Status of a Queued Request')
-async def queue_status(request_id: str, user: User = Depends(get_current_active_user)):
-    return JOBSTATUS.get_status(request_id)
+async def queue_status(request_id: str, user: User = Depends(get_current_active_user), job_status: JobStatusStore = Depends(get_job_status)):
+    with traced_call('redis get_status', **{'db.system': 'redis'}):
+        record = await job_status.get_status(request_id)
+    if record is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"No job with id {request_id}")
+    return record
+
+# Report the status of a queued request. Called by the workers that process the queue.
+@router.put('/status', status_code=status.HTTP_200_OK, summary='Report the Status of a Queued Request')
+async def report_queue_status(update: JobStatusUpdate, user: User = Depends(get_current_active_user), job_status: JobStatusStore = Depends(get_job_status)):
+    """
+    Record a job's new status and publish it to anyone streaming it
+
+    Only admins, i.e. the workers' service account, can report statuses.
+
+    Args:
+        update (JobStatusUpdate): The request id, its new status and an optional detail
+
+    Returns:
+        dict: The status record
+    """
+    if not user.admin:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Only admins can report job statuses")
+    with traced_call('redis set_status', **{'db.system': 'redis'}):
+        return await job_status.set_status(update.request_id, update.status, update.detail)
+
+# Check the progress of a batch of queued requests
+@router.get('/status/batch', status_code=status.HTTP_200_OK, response_model=QueueBatchStatus, summary='Check the Progress of a Batch of Queued Requests')
+async def queue_batch_status(batch_id: str, user: User = Depends(get_current_active_user), job_status: JobStatusStore = Depends(get_job_status)):
+    """
+    Count a batch's jobs by status
+
+    Args:
+        batch_id (str): The id returned when the batch was queued
+
+    Returns:
+        QueueBatchStatus: Job counts by status, and whether every job has finished
+    """
+    with traced_call('redis get_batch_progress', **{'db.system': 'redis'}):
+        progress = await job_status.get_batch_progress(batch_id)
+    if progress is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"No batch with id {batch_id}")
+    return progress
+
+# Stream status changes for queued requests
+@router.get('/status/stream', status_code=status.HTTP_200_OK, summary='Stream the Status of Queued Requests')
+async def queue_status_stream(
+    request: Request,
+    request_id: List[str] = Query(...),
+    user: User = Depends(get_current_active_user),
+    job_status: JobStatusStore = Depends(get_job_status),
+):
+    """
+    Stream status changes for one or more queued requests as Server-Sent Events
+
+    Each job's current status is sent first, then every change. A "status"
+    event carries a status record as JSON. A comment line is sent when
+    nothing has changed for a while, to keep proxies from closing the
+    connection. The stream ends with a "done" event, whose "finished" is true
+    once every job has completed or failed, or false when the stream reached
+    JOB_STATUS_STREAM_SECONDS first.
+
+    Statuses only change when the workers report them (PUT /util/status).
+    Until the distributed_work_queue workers do, jobs stay 'queued' and
+    streams end on the time limit.
+
+    Args:
+        request_id (List[str]): The jobs to watch, e.g. ?request_id=a&request_id=b
+
+    Returns:
+        StreamingResponse: A text/event-stream
+    """
+    request_ids = list(dict.fromkeys(request_id))
+    if len(request_ids) > MAX_STREAM_REQUEST_IDS:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Watch at most {MAX_STREAM_REQUEST_IDS} request ids per stream",
+        )
+
+    async def events():
+        pending = set(request_ids)
+        async for record in job_status.watch(request_ids):
+            if await request.is_disconnected():
+                return
+            if record is None:
+                yield ": keep-alive\n\n"
+                continue
+            if record.get('status') in FINAL_STATUSES:
+                pending.discard(record.get('id'))
+            yield f"event: status\ndata: {json.dumps(record)}\n\n"
+        yield f"event: done\ndata: {json.dumps({'finished': not pending})}\n\n"
+
+    return StreamingResponse(
+        events(),
+        media_type='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'},
+    )
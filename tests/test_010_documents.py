@@ -128,6 +128,19 @@ def test_get_missing_document_auth():
     assert response.text == '{"detail":"Document not found: missing"}'
     assert response.json() == {'detail': "Document not found: missing"}
 
+def test_get_document_versions_auth():
+    response = requests.post(SERVER + PREFIX + '/documents/versions', headers=AUTH_HEADER, json={'ids': [DOC_1['id'], DOC_2['id'], 'missing']})
+    assert response.status_code == 200
+    versions = response.json()
+    assert set(versions.keys()) == {DOC_1['id'], DOC_2['id'], 'missing'}
+    assert versions[DOC_1['id']] is not None
+    assert versions['missing'] is None
+
+def test_get_documents_batch_auth():
+    response = requests.post(SERVER + PREFIX + '/documents/batch', headers=AUTH_HEADER, json={'ids': [DOC_1['id'], DOC_2['id'], 'missing']})
+    assert response.status_code == 200
+    assert sorted(doc['id'] for doc in response.json()) == sorted([DOC_1['id'], DOC_2['id']])
+
 def test_update_document_fail_version_auth():
     new_doc = DOC_1.copy()
     new_doc['title'] = '**New Title'
@@ -0,0 +1,61 @@
+"""
+test_030_childsupport.py - Test the child support calculator endpoints
+"""
+import requests
+import pytest
+
+API_VERSION = '1_0'
+SERVER = 'http://localhost:8000'
+PREFIX = f'/api/v{API_VERSION}'
+
+SCENARIO = {
+    'number_of_children': 2,
+    'other_children': 1,
+    'wage_income': 2500.00,
+    'wage_income_frequency': 'biweekly',
+    'nonwage_income': 500.00,
+    'nonwage_income_frequency': 'monthly',
+    'self_employed': False,
+    'union_dues': 40.00,
+    'health_insurance': 350.00,
+    'mininum_wage': False,
+}
+
+def test_batch_matches_single():
+    scenarios = [SCENARIO, {**SCENARIO, 'self_employed': True}, {**SCENARIO, 'number_of_children': 4, 'wage_income': 9000.00}]
+    response = requests.post(f'{SERVER}{PREFIX}/txchildsupport/calculate/batch', json={'scenarios': scenarios})
+    assert response.status_code == 201
+    batch = response.json()
+    assert batch['count'] == len(scenarios)
+    for index, scenario in enumerate(scenarios):
+        single = requests.post(f'{SERVER}{PREFIX}/txchildsupport/calculate', json=scenario).json()
+        assert batch['child_support_factor'][index] == single['child_support_factor']
+        assert batch['child_support'][index] == pytest.approx(single['child_support'], abs=0.01)
+        assert batch['net_monthly_resources'][index] == pytest.approx(single['net_monthly_resources'], abs=0.01)
+
+def test_grid():
+    grid = {'scenario': SCENARIO, 'wage_income_min': 1000.00, 'wage_income_max': 5000.00, 'wage_income_points': 50, 'children': [1, 2, 3]}
+    response = requests.post(f'{SERVER}{PREFIX}/txchildsupport/calculate/grid', json=grid)
+    assert response.status_code == 201
+    result = response.json()
+    assert result['count'] == 150
+    assert result['number_of_children'][:50] == [1] * 50
+    assert result['wage_income'][0] == 1000.00
+    assert result['wage_income'][49] == 5000.00
+
+def test_grid_too_large():
+    grid = {'scenario': SCENARIO, 'wage_income_min': 0.00, 'wage_income_max': 5000.00, 'wage_income_points': 60000, 'children': [1, 2]}
+    response = requests.post(f'{SERVER}{PREFIX}/txchildsupport/calculate/grid', json=grid)
+    assert response.status_code == 422
+
+def test_tax_years():
+    response = requests.get(f'{SERVER}{PREFIX}/txchildsupport/tax_years')
+    assert response.status_code == 200
+    years = response.json()
+    assert 2023 in years
+    single = requests.post(f'{SERVER}{PREFIX}/txchildsupport/calculate', json={**SCENARIO, 'tax_year': 2023}).json()
+    assert single['tax_table_version'].startswith('2023.')
+    default = requests.post(f'{SERVER}{PREFIX}/txchildsupport/calculate', json=SCENARIO).json()
+    assert default['tax_table_version'] == single['tax_table_version']
+    response = requests.post(f'{SERVER}{PREFIX}/txchildsupport/calculate', json={**SCENARIO, 'tax_year': 1900})
+    assert response.status_code == 400
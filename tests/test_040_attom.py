@@ -0,0 +1,262 @@
+"""
+test_040_attom.py - Test the ATTOM client against a local stub server
+"""
+import asyncio
+from datetime import datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import json
+from threading import Thread
+import time
+from fastapi import HTTPException
+import httpx
+import pytest
+from util.attom import AttomClient, BASIC_PROFILE_ENDPOINT, CircuitBreaker, HOME_EQUITY_ENDPOINT, PropertyCache, RateLimiter, normalize_address
+
+BASIC_PROFILE = {
+    'property': [{
+        'identifier': {'attomId': 50801352, 'apn': 'R-3281-00F-0160-1'},
+        'address': {'oneLine': '123 MAIN STREET, ANYTOWN, TX 75072'},
+        'area': {'countrySecSubd': 'Collin'},
+        'summary': {'absenteeInd': 'OWNER OCCUPIED'},
+        'sale': {'saleAmountData': {'saleRecDate': '1999-12-21', 'saleAmt': 158000}},
+        'assessment': {
+            'assessed': {'assdTtlValue': 498109},
+            'market': {'mktTtlValue': 498109},
+            'tax': {'taxYear': 2022, 'taxAmt': 7016.58},
+            'owner': {'owner1': {'firstNameAndMi': 'THOMAS J', 'lastName': 'DALEY'}},
+        },
+    }]
+}
+HOME_EQUITY = {
+    'property': [{
+        'avm': {'amount': {'value': 515908, 'high': 521067, 'low': 510748}},
+        'homeEquity': {'estimatedAvailableEquity': 445790},
+    }]
+}
+DELAY = 0.3
+
+
+class StubAttom(BaseHTTPRequestHandler):
+    """
+    Answers each endpoint from a queue of (status, body) responses; the last one repeats
+
+    Addresses on Nowhere Lane are never found.
+    """
+    responses = {}
+    calls = {}
+
+    def do_GET(self):
+        endpoint = self.path.split('?')[0]
+        StubAttom.calls[endpoint] = StubAttom.calls.get(endpoint, 0) + 1
+        queue = StubAttom.responses.get(endpoint, [(404, {})])
+        status_code, body = queue.pop(0) if len(queue) > 1 else queue[0]
+        if 'Nowhere' in self.path:
+            status_code, body = 400, {}
+        time.sleep(DELAY)
+        payload = json.dumps(body).encode()
+        self.send_response(status_code)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, *args):
+        pass
+
+
+class StubServer(ThreadingHTTPServer):
+    request_queue_size = 64  # Room for a whole batch of connections at once
+
+
+@pytest.fixture(scope='module')
+def stub_server():
+    server = StubServer(('127.0.0.1', 0), StubAttom)
+    Thread(target=server.serve_forever, daemon=True).start()
+    yield f'http://127.0.0.1:{server.server_address[1]}'
+    server.shutdown()
+
+
+def stub(responses: dict) -> None:
+    StubAttom.responses = {endpoint: list(queue) for endpoint, queue in responses.items()}
+    StubAttom.calls = {}
+
+
+class MemoryCacheTable():
+    """
+    Stands in for PropertyCacheTable, so these tests don't need MongoDB
+    """
+    def __init__(self):
+        self.records = {}
+
+    def get(self, endpoint, address_key):
+        record = self.records.get((endpoint, address_key))
+        return record if record and record['expires_at'] > datetime.utcnow() else None
+
+    def put(self, endpoint, address_key, data, ttl):
+        self.records[(endpoint, address_key)] = {'data': data, 'expires_at': datetime.utcnow() + ttl}
+
+
+async def lookup(client: AttomClient, address: str = '123 Main Street', force_refresh: bool = False) -> dict:
+    try:
+        return await client.get_property_details(address, 'Anytown', 'TX', '75072', force_refresh)
+    finally:
+        await client.aclose()
+
+
+def test_lookup_fetches_both_endpoints_concurrently(stub_server):
+    stub({BASIC_PROFILE_ENDPOINT: [(200, BASIC_PROFILE)], HOME_EQUITY_ENDPOINT: [(200, HOME_EQUITY)]})
+    client = AttomClient(host=stub_server, api_key='test')
+    start = time.perf_counter()
+    result = asyncio.run(lookup(client))
+    elapsed = time.perf_counter() - start
+    assert result['attom_id'] == 50801352
+    assert result['owners'] == 'THOMAS J DALEY'
+    assert result['equity_amount'] == 445790
+    assert elapsed < DELAY * 1.8
+
+
+def test_retries_server_errors(stub_server):
+    stub({BASIC_PROFILE_ENDPOINT: [(503, {}), (200, BASIC_PROFILE)], HOME_EQUITY_ENDPOINT: [(200, HOME_EQUITY)]})
+    client = AttomClient(host=stub_server, api_key='test', backoff_seconds=0.01)
+    result = asyncio.run(lookup(client))
+    assert result['tax_id'] == 'R-3281-00F-0160-1'
+    assert StubAttom.calls[BASIC_PROFILE_ENDPOINT] == 2
+
+
+def test_missing_valuation_is_not_an_error(stub_server):
+    stub({BASIC_PROFILE_ENDPOINT: [(200, BASIC_PROFILE)], HOME_EQUITY_ENDPOINT: [(400, {})]})
+    client = AttomClient(host=stub_server, api_key='test')
+    result = asyncio.run(lookup(client))
+    assert result['approximate_value_midpoint'] == 0
+
+
+def test_unknown_address_is_not_found(stub_server):
+    stub({BASIC_PROFILE_ENDPOINT: [(400, {})], HOME_EQUITY_ENDPOINT: [(400, {})]})
+    client = AttomClient(host=stub_server, api_key='test')
+    with pytest.raises(HTTPException) as e:
+        asyncio.run(lookup(client))
+    assert e.value.status_code == 404
+
+
+def test_circuit_breaker_opens_and_fails_fast(stub_server):
+    stub({BASIC_PROFILE_ENDPOINT: [(500, {})], HOME_EQUITY_ENDPOINT: [(500, {})]})
+    breaker = CircuitBreaker(failure_threshold=2, reset_seconds=60)
+    client = AttomClient(host=stub_server, api_key='test', max_retries=1, backoff_seconds=0.01, breaker=breaker)
+    with pytest.raises(HTTPException) as e:
+        asyncio.run(lookup(client))
+    assert e.value.status_code == 502
+    assert breaker.state == 'open'
+
+    calls = dict(StubAttom.calls)
+    start = time.perf_counter()
+    with pytest.raises(HTTPException) as e:
+        asyncio.run(lookup(client))
+    assert e.value.status_code == 503
+    assert time.perf_counter() - start < DELAY
+    assert StubAttom.calls == calls
+
+
+def test_half_open_breaker_allows_one_whole_lookup(stub_server):
+    stub({BASIC_PROFILE_ENDPOINT: [(200, BASIC_PROFILE)], HOME_EQUITY_ENDPOINT: [(200, HOME_EQUITY)]})
+    breaker = CircuitBreaker(failure_threshold=1, reset_seconds=0.01)
+    breaker.record_failure()
+    time.sleep(0.02)
+    assert breaker.state == 'half_open'
+    client = AttomClient(host=stub_server, api_key='test', breaker=breaker)
+    result = asyncio.run(lookup(client))
+    assert result['attom_id'] == 50801352
+    assert result['equity_amount'] == 445790
+    assert breaker.state == 'closed'
+
+
+@pytest.mark.parametrize('failure', ['undecodable', 'unexpected'])
+def test_failed_trial_lets_the_breaker_try_again(failure):
+    healthy = {'value': False}
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        if healthy['value']:
+            body = BASIC_PROFILE if request.url.path == BASIC_PROFILE_ENDPOINT else HOME_EQUITY
+            return httpx.Response(200, json=body)
+        if failure == 'unexpected':
+            raise RuntimeError('unexpected')
+        return httpx.Response(200, headers={'content-encoding': 'gzip'}, content=b'not gzip')
+
+    breaker = CircuitBreaker(failure_threshold=1, reset_seconds=0.05)
+    breaker.record_failure()
+    time.sleep(0.06)
+    client = AttomClient(host='http://attom.test', api_key='test', max_retries=1, backoff_seconds=0.01, breaker=breaker)
+    client.http = httpx.AsyncClient(base_url='http://attom.test', transport=httpx.MockTransport(handler))
+    with pytest.raises(Exception):
+        asyncio.run(lookup(client))
+    assert breaker.state == 'open'
+    assert not breaker.trial_running
+
+    healthy['value'] = True
+    time.sleep(0.06)
+    client.http = httpx.AsyncClient(base_url='http://attom.test', transport=httpx.MockTransport(handler))
+    assert asyncio.run(lookup(client))['attom_id'] == 50801352
+    assert breaker.state == 'closed'
+
+
+def test_normalize_address():
+    assert normalize_address('123 Main Street', 'Anytown', 'tx', '75072-1234') == '123 MAIN ST|ANYTOWN|TX|75072'
+    assert normalize_address('123  main st.', 'ANYTOWN', 'TX', '75072') == '123 MAIN ST|ANYTOWN|TX|75072'
+
+
+def test_repeated_lookups_are_cached(stub_server):
+    stub({BASIC_PROFILE_ENDPOINT: [(200, BASIC_PROFILE)], HOME_EQUITY_ENDPOINT: [(200, HOME_EQUITY)]})
+    table = MemoryCacheTable()
+    ttls = {BASIC_PROFILE_ENDPOINT: timedelta(days=90), HOME_EQUITY_ENDPOINT: timedelta(days=7)}
+    client = AttomClient(host=stub_server, api_key='test', cache=PropertyCache(table, ttls))
+    first = asyncio.run(lookup(client))
+    assert StubAttom.calls == {BASIC_PROFILE_ENDPOINT: 1, HOME_EQUITY_ENDPOINT: 1}
+
+    start = time.perf_counter()
+    second = asyncio.run(lookup(client, '123 main st.'))
+    assert time.perf_counter() - start < 0.01
+    assert second == first
+    assert StubAttom.calls == {BASIC_PROFILE_ENDPOINT: 1, HOME_EQUITY_ENDPOINT: 1}
+
+    # A new process would only have the persistent cache
+    client = AttomClient(host=stub_server, api_key='test', cache=PropertyCache(table, ttls))
+    assert asyncio.run(lookup(client)) == first
+    assert StubAttom.calls == {BASIC_PROFILE_ENDPOINT: 1, HOME_EQUITY_ENDPOINT: 1}
+
+    asyncio.run(lookup(client, force_refresh=True))
+    assert StubAttom.calls == {BASIC_PROFILE_ENDPOINT: 2, HOME_EQUITY_ENDPOINT: 2}
+
+
+def test_batch_lookup(stub_server):
+    stub({BASIC_PROFILE_ENDPOINT: [(200, BASIC_PROFILE)], HOME_EQUITY_ENDPOINT: [(200, HOME_EQUITY)]})
+    client = AttomClient(host=stub_server, api_key='test', rate_limiter=RateLimiter(rate=0))
+    addresses = [
+        {'address': f'{number} Main Street', 'city': 'Anytown', 'state': 'TX', 'zip_code': '75072'} for number in range(1, 9)
+    ]
+    addresses.append({'address': '1 MAIN ST', 'city': 'Anytown', 'state': 'TX', 'zip_code': '75072'})
+    addresses.append({'address': '1 Nowhere Lane', 'city': 'Anytown', 'state': 'TX', 'zip_code': '75072'})
+
+    async def batch():
+        try:
+            return await client.get_property_details_batch(addresses, concurrency=10)
+        finally:
+            await client.aclose()
+
+    start = time.perf_counter()
+    results = asyncio.run(batch())
+    assert time.perf_counter() - start < DELAY * 2
+    assert [result['status_code'] for result in results] == [200] * 9 + [404]
+    assert results[8]['address'] == addresses[8]
+    assert results[9]['detail'] == 'Property not found'
+    assert StubAttom.calls[BASIC_PROFILE_ENDPOINT] == 9  # The duplicate was looked up once
+
+
+def test_rate_limiter():
+    limiter = RateLimiter(rate=20, burst=2)
+
+    async def acquire(count):
+        for _ in range(count):
+            await limiter.acquire()
+
+    start = time.perf_counter()
+    asyncio.run(acquire(6))
+    assert 0.19 <= time.perf_counter() - start < 0.4  # 2 at once, then 4 more at 20 per second
@@ -0,0 +1,201 @@
+"""
+test_050_job_queue.py - Test job statuses, deduplication and batches against fakeredis
+"""
+import asyncio
+import fakeredis
+import pytest
+from models.queue_request import QueueRequest
+from util.job_queue import JobSubmitter
+from util.job_status import INFLIGHT_KEY_PREFIX, JOB_INFLIGHT_TTL_MINUTES, JobStatusStore
+
+QUEUE_NAME = 'test_queue'
+VERSIONS = {'doc-1': 'v1', 'doc-2': 'v1', 'doc-3': 'v1'}
+
+
+class RecordingWorkQueue():
+    """
+    Stands in for DistributedWorkQueue; records what enqueue_work() was given
+
+    fail_after makes enqueue_work() raise once that many items were queued.
+    """
+    def __init__(self, fail_after: int = None):
+        self.items = []
+        self.fail_after = fail_after
+
+    def enqueue_work(self, item: str) -> None:
+        if self.fail_after is not None and len(self.items) >= self.fail_after:
+            raise ConnectionError('queue is down')
+        self.items.append(item)
+
+
+def run(test):
+    """
+    Run an async test with a new, empty fake Redis server
+    """
+    async def wrapper():
+        store = JobStatusStore(client=fakeredis.FakeAsyncRedis(decode_responses=True))
+        try:
+            return await test(store)
+        finally:
+            await store.aclose()
+    return asyncio.run(wrapper())
+
+
+def classify(doc_id: str, model: str = 'default') -> QueueRequest:
+    return QueueRequest(task='classify', payload={'doc_id': doc_id, 'model': model}, username='test_user@test.com')
+
+
+def submitter(store: JobStatusStore, work_queue: RecordingWorkQueue = None) -> JobSubmitter:
+    return JobSubmitter(work_queue or RecordingWorkQueue(), store, QUEUE_NAME, lambda ids: {i: VERSIONS[i] for i in ids if i in VERSIONS})
+
+
+def test_claim_and_release():
+    async def test(store):
+        assert await store.claim_in_flight({'work': 'a'}) == {}
+        assert await store.claim_in_flight({'work': 'b'}) == {'work': 'a'}
+        assert 0 < await store.redis.ttl(INFLIGHT_KEY_PREFIX + 'work') <= JOB_INFLIGHT_TTL_MINUTES * 60
+
+        # Only the claim's owner can release it
+        await store.release_in_flight({'work': 'b'})
+        assert await store.claim_in_flight({'work': 'b'}) == {'work': 'a'}
+        await store.release_in_flight({'work': 'a'})
+        assert await store.claim_in_flight({'work': 'b'}) == {}
+    run(test)
+
+
+def test_finished_or_forced_work_can_be_claimed_again():
+    async def test(store):
+        await store.claim_in_flight({'work': 'a'})
+        await store.set_status('a', 'running')
+        assert await store.claim_in_flight({'work': 'b'}) == {'work': 'a'}
+        assert await store.claim_in_flight({'work': 'b'}, force=True) == {}
+
+        await store.set_status('b', 'failed', 'worker crashed')
+        assert await store.claim_in_flight({'work': 'c'}) == {}
+    run(test)
+
+
+def test_idempotency_key():
+    async def test(store):
+        assert await store.claim_idempotency_key('user', 'key-1', 'a') is None
+        assert await store.claim_idempotency_key('user', 'key-1', 'b') == 'a'
+        assert await store.claim_idempotency_key('other_user', 'key-1', 'c') is None
+        await store.set_idempotency_key('user', 'key-1', None)
+        assert await store.claim_idempotency_key('user', 'key-1', 'd') is None
+    run(test)
+
+
+def test_duplicate_submissions_are_coalesced():
+    async def test(store):
+        work_queue = RecordingWorkQueue()
+        jobs = submitter(store, work_queue)
+        first = await jobs.submit(classify('doc-1'), 'test_user@test.com')
+        second = await jobs.submit(classify('doc-1'), 'test_user@test.com')
+        other_model = await jobs.submit(classify('doc-1', 'openai'), 'test_user@test.com')
+        assert (first['duplicate'], second['duplicate'], other_model['duplicate']) == (False, True, False)
+        assert second['id'] == first['id']
+        assert len(work_queue.items) == 2
+        assert (await store.get_status(first['id']))['status'] == 'queued'
+
+        forced = await jobs.submit(classify('doc-1'), 'test_user@test.com', force=True)
+        assert not forced['duplicate']
+        assert len(work_queue.items) == 3
+    run(test)
+
+
+def test_retries_with_an_idempotency_key_get_the_first_job():
+    async def test(store):
+        work_queue = RecordingWorkQueue()
+        jobs = submitter(store, work_queue)
+        first = await jobs.submit(classify('doc-1'), 'test_user@test.com', idempotency_key='retry-1')
+        await store.set_status(first['id'], 'completed')
+        retry = await jobs.submit(classify('doc-1'), 'test_user@test.com', idempotency_key='retry-1')
+        assert retry == {'message': 'classify task already queued', 'id': first['id'], 'duplicate': True}
+        assert len(work_queue.items) == 1
+    run(test)
+
+
+def test_batch_coalesces_work_in_flight():
+    async def test(store):
+        work_queue = RecordingWorkQueue()
+        jobs = submitter(store, work_queue)
+        in_flight = await jobs.submit(classify('doc-1'), 'test_user@test.com')
+        requests = [classify('doc-1'), classify('doc-2'), classify('doc-2'), classify('doc-3')]
+        batch = await jobs.submit_batch(requests, 'test_user@test.com', idempotency_key='batch-1')
+        assert (batch['count'], batch['coalesced']) == (2, 2)
+        assert batch['ids'][-1] == in_flight['id']
+        assert len(work_queue.items) == 3
+
+        await store.set_status(in_flight['id'], 'completed')
+        progress = await store.get_batch_progress(batch['batch_id'])
+        assert progress['total'] == 3
+        assert progress['counts'] == {'queued': 2, 'completed': 1}
+        assert not progress['finished']
+
+        retry = await jobs.submit_batch(requests, 'test_user@test.com', idempotency_key='batch-1')
+        assert (retry['batch_id'], retry['ids'], retry['count']) == (batch['batch_id'], batch['ids'], 0)
+        assert len(work_queue.items) == 3
+    run(test)
+
+
+def test_failed_enqueue_releases_claims():
+    async def test(store):
+        jobs = submitter(store, RecordingWorkQueue(fail_after=1))
+        with pytest.raises(ConnectionError):
+            await jobs.submit_batch([classify('doc-1'), classify('doc-2')], 'test_user@test.com', idempotency_key='batch-1')
+
+        # The job that was queued keeps its claim; the other can be submitted again
+        retry = submitter(store)
+        assert (await retry.submit(classify('doc-1'), 'test_user@test.com'))['duplicate']
+        resubmitted = await retry.submit(classify('doc-2'), 'test_user@test.com')
+        assert not resubmitted['duplicate']
+        # Something was queued, so the idempotency key still points at the first batch
+        assert await store.claim_idempotency_key('test_user@test.com', 'batch-1', 'x') is not None
+    run(test)
+
+
+def test_failure_before_queueing_frees_the_idempotency_key():
+    async def test(store):
+        failures = {'left': 1}
+
+        def get_versions(doc_ids):
+            if failures['left']:
+                failures['left'] -= 1
+                raise ConnectionError('mongo is down')
+            return {doc_id: VERSIONS[doc_id] for doc_id in doc_ids}
+
+        work_queue = RecordingWorkQueue()
+        jobs = JobSubmitter(work_queue, store, QUEUE_NAME, get_versions)
+        with pytest.raises(ConnectionError):
+            await jobs.submit(classify('doc-1'), 'test_user@test.com', idempotency_key='retry-1')
+        retry = await jobs.submit(classify('doc-1'), 'test_user@test.com', idempotency_key='retry-1')
+        assert not retry['duplicate']
+        assert (await store.get_status(retry['id']))['status'] == 'queued'
+
+        requests = [classify('doc-2'), classify('doc-3')]
+        failures['left'] = 1
+        with pytest.raises(ConnectionError):
+            await jobs.submit_batch(requests, 'test_user@test.com', idempotency_key='batch-1')
+        batch = await jobs.submit_batch(requests, 'test_user@test.com', idempotency_key='batch-1')
+        assert (batch['count'], len(batch['ids'])) == (2, 2)
+        assert len(work_queue.items) == 3
+    run(test)
+
+
+def test_watch_streams_changes_until_every_job_is_final():
+    async def test(store):
+        await store.add_job('a')
+        await store.set_status('b', 'completed')
+
+        async def worker():
+            await asyncio.sleep(0.1)
+            await store.set_status('a', 'running')
+            await store.set_status('a', 'completed')
+
+        task = asyncio.create_task(worker())
+        records = [record async for record in store.watch(['a', 'b'], heartbeat=0.05, max_seconds=5) if record]
+        await task
+        assert [(record['id'], record['status']) for record in records] == [
+            ('a', 'queued'), ('b', 'completed'), ('a', 'running'), ('a', 'completed'),
+        ]
+    run(test)
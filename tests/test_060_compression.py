@@ -0,0 +1,74 @@
+"""
+test_060_compression.py - Test the response compression middleware
+"""
+from fastapi import FastAPI
+from fastapi.responses import PlainTextResponse
+from fastapi.testclient import TestClient
+import pytest
+from util.compression import CompressionMiddleware
+
+BODY = 'falcon ' * 500
+
+
+def make_client() -> TestClient:
+    app = FastAPI()
+    app.add_middleware(CompressionMiddleware, encodings=['gzip'])
+
+    @app.get('/text')
+    async def text():
+        return PlainTextResponse(BODY, headers={'ETag': '"v1"', 'Vary': 'Authorization'})
+
+    @app.get('/weak')
+    async def weak():
+        return PlainTextResponse(BODY, headers={'ETag': 'W/"v1"'})
+
+    @app.get('/small')
+    async def small():
+        return PlainTextResponse('falcon', headers={'ETag': '"v1"'})
+
+    return TestClient(app)
+
+
+@pytest.mark.parametrize('accept_encoding, expected', [
+    ('gzip', 'gzip'),
+    ('deflate, gzip;q=0.5', 'gzip'),
+    ('*', 'gzip'),
+    ('', None),
+    ('deflate', None),
+    ('gzip;q=0', None),
+    ('gzip;q=0, *', None),
+    ('*, gzip;q=0', None),
+    ('gzip;q=0, *;q=0.1', None),
+    ('br;q=0, *', 'gzip'),
+    ('*;q=0', None),
+    ('gzip;q=junk', None),
+])
+def test_select_encoding(accept_encoding, expected):
+    middleware = CompressionMiddleware(None, encodings=['gzip'])
+    assert middleware.select_encoding(accept_encoding) == expected
+
+
+def test_compressed_response_has_weak_etag_and_vary():
+    response = make_client().get('/text', headers={'Accept-Encoding': 'gzip'})
+    assert response.headers['content-encoding'] == 'gzip'
+    assert response.text == BODY
+    assert response.headers['etag'] == 'W/"v1"'
+    assert [value.strip() for value in response.headers['vary'].split(',')] == ['Authorization', 'Accept-Encoding']
+
+
+def test_weak_etag_is_kept():
+    response = make_client().get('/weak', headers={'Accept-Encoding': 'gzip'})
+    assert response.headers['content-encoding'] == 'gzip'
+    assert response.headers['etag'] == 'W/"v1"'
+
+
+def test_uncompressed_response_keeps_strong_etag():
+    client = make_client()
+    refused = client.get('/text', headers={'Accept-Encoding': 'gzip;q=0, *'})
+    assert 'content-encoding' not in refused.headers
+    assert refused.headers['etag'] == '"v1"'
+    assert refused.headers['vary'] == 'Authorization'
+
+    small = client.get('/small', headers={'Accept-Encoding': 'gzip'})
+    assert 'content-encoding' not in small.headers
+    assert small.headers['etag'] == '"v1"'
@@ -0,0 +1,572 @@
+"""
+attom.py - Property lookups from ATTOM Data Solutions
+
+AttomClient is an async HTTP client with one persistent connection pool for
+the app. A property lookup fetches the basic profile and the home equity
+valuation concurrently. Requests that time out or get a 429 or 5xx response
+are retried with exponential backoff. A circuit breaker stops calling ATTOM
+for ATTOM_BREAKER_RESET_SECONDS after ATTOM_BREAKER_THRESHOLD requests in a
+row have failed all their retries, so an outage fails fast instead of tying
+up requests.
+
+Responses are cached per endpoint and normalized address: in MongoDB for
+ATTOM_PROFILE_CACHE_DAYS (basic profile) or ATTOM_EQUITY_CACHE_DAYS (home
+equity), and in an in-process LRU of ATTOM_MEMORY_CACHE_SIZE entries in front
+of it. Set either number of days to 0 to stop caching that endpoint.
+
+get_property_details_batch() looks up many addresses at once, at most
+ATTOM_BATCH_CONCURRENCY at a time. Every request to ATTOM, batch or not, is
+paced to ATTOM_RATE_LIMIT per second (bursts of ATTOM_RATE_BURST).
+
+Needs ATTOMDATA_HOST and ATTOMDATA_API_KEY.
+"""
+import asyncio
+from datetime import datetime, timedelta
+import os
+import random
+import re
+from time import monotonic
+from typing import Dict, List, Optional
+import httpx
+from fastapi import HTTPException, status
+from fastapi.concurrency import run_in_threadpool
+from database.property_cache_table import PropertyCacheTable
+from util.cache import TTLCache
+from util.log_util import get_logger
+from util.metrics import record_cache
+from util.tracing import traced_call
+import settings  # NOQA
+
+LOGGER = get_logger('falconapi/attom.py')
+
+ATTOM_TIMEOUT = float(os.getenv('ATTOM_TIMEOUT', '10'))    # seconds
+ATTOM_CONNECT_TIMEOUT = float(os.getenv('ATTOM_CONNECT_TIMEOUT', '3'))    # seconds
+ATTOM_MAX_CONNECTIONS = int(os.getenv('ATTOM_MAX_CONNECTIONS', '20'))
+ATTOM_MAX_RETRIES = int(os.getenv('ATTOM_MAX_RETRIES', '2'))
+ATTOM_BACKOFF_SECONDS = float(os.getenv('ATTOM_BACKOFF_SECONDS', '0.5'))
+ATTOM_MAX_BACKOFF_SECONDS = float(os.getenv('ATTOM_MAX_BACKOFF_SECONDS', '5'))
+ATTOM_BREAKER_THRESHOLD = int(os.getenv('ATTOM_BREAKER_THRESHOLD', '5'))
+ATTOM_BREAKER_RESET_SECONDS = float(os.getenv('ATTOM_BREAKER_RESET_SECONDS', '30'))
+ATTOM_PROFILE_CACHE_DAYS = float(os.getenv('ATTOM_PROFILE_CACHE_DAYS', '90'))
+ATTOM_EQUITY_CACHE_DAYS = float(os.getenv('ATTOM_EQUITY_CACHE_DAYS', '7'))
+ATTOM_MEMORY_CACHE_SIZE = int(os.getenv('ATTOM_MEMORY_CACHE_SIZE', '2048'))
+ATTOM_BATCH_CONCURRENCY = int(os.getenv('ATTOM_BATCH_CONCURRENCY', '8'))
+ATTOM_RATE_LIMIT = float(os.getenv('ATTOM_RATE_LIMIT', '20'))    # requests per second; 0 for no limit
+ATTOM_RATE_BURST = int(os.getenv('ATTOM_RATE_BURST', '40'))
+
+BASIC_PROFILE_ENDPOINT = '/property/basicprofile'
+HOME_EQUITY_ENDPOINT = '/valuation/homeequity'
+RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+NOT_FOUND_STATUS_CODES = {400, 404}  # ATTOM answers 400 when it cannot match the address
+
+# Spellings that mean the same thing in an address, so that they share a cache entry
+ADDRESS_ABBREVIATIONS = {
+    'STREET': 'ST', 'AVENUE': 'AVE', 'ROAD': 'RD', 'DRIVE': 'DR', 'BOULEVARD': 'BLVD', 'LANE': 'LN',
+    'COURT': 'CT', 'CIRCLE': 'CIR', 'PLACE': 'PL', 'PARKWAY': 'PKWY', 'HIGHWAY': 'HWY', 'TRAIL': 'TRL',
+    'TERRACE': 'TER', 'NORTH': 'N', 'SOUTH': 'S', 'EAST': 'E', 'WEST': 'W', 'APARTMENT': 'APT', 'SUITE': 'STE',
+}
+
+
+def normalize_address(address: str, city: str, state: str, zip_code: str) -> str:
+    """
+    Cache key for an address: upper case, no punctuation, common words abbreviated
+
+    Args:
+        address (str): Street address
+        city (str): City
+        state (str): State
+        zip_code (str): Zip code
+
+    Returns:
+        str: e.g. '123 MAIN ST|ANYTOWN|TX|75072'
+    """
+    def words(text: str) -> list:
+        return re.sub(r'[^A-Z0-9 ]', ' ', (text or '').upper()).split()
+
+    street = ' '.join(ADDRESS_ABBREVIATIONS.get(word, word) for word in words(address))
+    return '|'.join([street, ' '.join(words(city)), ''.join(words(state)), ''.join(words(zip_code))[:5]])
+
+
+class PropertyCache():
+    """
+    In-process LRU in front of the property_cache collection
+    """
+    def __init__(self, table: PropertyCacheTable, ttls: Dict[str, timedelta], memory_size: int = ATTOM_MEMORY_CACHE_SIZE) -> None:
+        self.table = table
+        self.ttls = ttls
+        self.memory = TTLCache(memory_size)
+
+    def caches(self, endpoint: str) -> bool:
+        return self.ttls.get(endpoint, timedelta(0)) > timedelta(0)
+
+    async def get(self, endpoint: str, address_key: str) -> Optional[dict]:
+        """
+        Get a cached response, or None
+        """
+        if not self.caches(endpoint):
+            return None
+        data = self.memory.get((endpoint, address_key))
+        record_cache('attom_memory', data is not None)
+        if data is not None:
+            return data
+        try:
+            record = await run_in_threadpool(self.table.get, endpoint, address_key)
+        except Exception as e:
+            LOGGER.error("Error reading the property cache: %s", e)
+            return None
+        record_cache('attom_mongo', record is not None)
+        if record is None:
+            return None
+        remaining = (record['expires_at'] - datetime.utcnow()).total_seconds()
+        self.memory.set((endpoint, address_key), record['data'], remaining)
+        return record['data']
+
+    async def put(self, endpoint: str, address_key: str, data: dict) -> None:
+        """
+        Cache a response for its endpoint's TTL
+        """
+        if not self.caches(endpoint):
+            return
+        ttl = self.ttls[endpoint]
+        self.memory.set((endpoint, address_key), data, ttl.total_seconds())
+        try:
+            await run_in_threadpool(self.table.put, endpoint, address_key, data, ttl)
+        except Exception as e:
+            LOGGER.error("Error writing the property cache: %s", e)
+
+
+class CircuitBreaker():
+    """
+    Stops calls to a failing service until it has had time to recover
+
+    Closed: calls go through. After failure_threshold failures in a row it
+    opens and calls are refused. After reset_seconds one trial call is let
+    through (half open); its success closes the breaker, its failure opens it again.
+    A property lookup is one call, though it makes two requests.
+    """
+    def __init__(self, failure_threshold: int = ATTOM_BREAKER_THRESHOLD, reset_seconds: float = ATTOM_BREAKER_RESET_SECONDS) -> None:
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self.trial_running = False
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return 'closed'
+        if self.trial_running or monotonic() - self.opened_at >= self.reset_seconds:
+            return 'half_open'
+        return 'open'
+
+    def retry_after(self) -> int:
+        """
+        Seconds until a trial call will be allowed
+        """
+        if self.opened_at is None:
+            return 0
+        return max(1, int(self.reset_seconds - (monotonic() - self.opened_at) + 0.999))
+
+    def allow(self) -> bool:
+        """
+        Whether a call may be made now
+        """
+        state = self.state
+        if state == 'closed':
+            return True
+        if state == 'half_open' and not self.trial_running:
+            self.trial_running = True
+            return True
+        return False
+
+    def record_success(self) -> None:
+        if self.opened_at is not None and not self.trial_running:
+            return  # Let through before the breaker opened; only a trial closes it
+        self.failures = 0
+        self.opened_at = None
+        self.trial_running = False
+
+    def release(self) -> None:
+        """
+        Forget a trial call that was cancelled before it finished
+        """
+        self.trial_running = False
+
+    def record_failure(self) -> None:
+        self.failures += 1
+        if self.trial_running or self.failures >= self.failure_threshold:
+            if self.opened_at is None or self.trial_running:
+                LOGGER.warning("ATTOM circuit breaker opened after %d failures", self.failures)
+            self.opened_at = monotonic()
+        self.trial_running = False
+
+
+class RateLimiter():
+    """
+    Spaces out calls to at most rate per second, after an initial burst
+
+    Each caller reserves the next free slot and sleeps until it comes. There
+    is no await between reading and reserving a slot, so no lock is needed.
+    """
+    def __init__(self, rate: float = ATTOM_RATE_LIMIT, burst: int = ATTOM_RATE_BURST) -> None:
+        self.rate = rate
+        self.burst = max(1, burst)
+        self.next_slot = 0.0
+
+    async def acquire(self) -> None:
+        if self.rate <= 0:
+            return
+        now = monotonic()
+        self.next_slot = max(self.next_slot, now - (self.burst - 1) / self.rate)
+        wait = self.next_slot - now
+        self.next_slot += 1 / self.rate
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+
+class AttomClient():
+    """
+    Async client for the ATTOM property API
+    """
+    def __init__(
+        self,
+        host: str = None,
+        api_key: str = None,
+        max_retries: int = ATTOM_MAX_RETRIES,
+        backoff_seconds: float = ATTOM_BACKOFF_SECONDS,
+        breaker: CircuitBreaker = None,
+        cache: PropertyCache = None,
+        rate_limiter: RateLimiter = None,
+    ) -> None:
+        self.host = host
+        self.api_key = api_key
+        self.max_retries = max_retries
+        self.backoff_seconds = backoff_seconds
+        self.breaker = breaker or CircuitBreaker()
+        self.cache = cache
+        self.rate_limiter = rate_limiter or RateLimiter()
+        self.http: Optional[httpx.AsyncClient] = None
+
+    def client(self) -> httpx.AsyncClient:
+        """
+        The pooled HTTP client, created on first use
+        """
+        if self.http is None:
+            api_key = self.api_key or os.environ.get('ATTOMDATA_API_KEY')
+            if api_key is None:
+                raise HTTPException(
+                    status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                    detail="ATTOMDATA_API_KEY not set in environment",
+                )
+            host = self.host or os.environ.get('ATTOMDATA_HOST')
+            if host is None:
+                raise HTTPException(
+                    status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                    detail="ATTOMDATA_HOST not set in environment",
+                )
+            self.http = httpx.AsyncClient(
+                base_url=host,
+                headers={'accept': 'application/json', 'apikey': api_key},
+                timeout=httpx.Timeout(ATTOM_TIMEOUT, connect=ATTOM_CONNECT_TIMEOUT),
+                limits=httpx.Limits(max_connections=ATTOM_MAX_CONNECTIONS, max_keepalive_connections=ATTOM_MAX_CONNECTIONS),
+            )
+        return self.http
+
+    async def aclose(self) -> None:
+        """
+        Close the connection pool
+        """
+        if self.http is not None:
+            await self.http.aclose()
+            self.http = None
+
+    def backoff(self, attempt: int, response: Optional[httpx.Response]) -> float:
+        """
+        Seconds to wait before retrying: Retry-After if ATTOM sent one, else exponential with jitter
+        """
+        if response is not None and response.headers.get('retry-after', '').isdigit():
+            return min(float(response.headers['retry-after']), ATTOM_MAX_BACKOFF_SECONDS)
+        return min(self.backoff_seconds * (2 ** attempt), ATTOM_MAX_BACKOFF_SECONDS) * random.uniform(0.5, 1.0)
+
+    def check_breaker(self) -> None:
+        """
+        Refuse to call ATTOM while the circuit breaker is open
+
+        Raises:
+            HTTPException: 503, with Retry-After
+        """
+        if not self.breaker.allow():
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail="Property data service is unavailable. Try again later.",
+                headers={'Retry-After': str(self.breaker.retry_after())},
+            )
+
+    async def query(self, endpoint: str, parameters: dict, check_breaker: bool = True) -> dict:
+        """
+        GET an ATTOM endpoint, retrying timeouts, 429s and 5xx responses
+
+        Args:
+            endpoint (str): Endpoint to call, e.g. '/property/basicprofile'
+            parameters (dict): Query parameters
+            check_breaker (bool): False if the caller already passed check_breaker()
+
+        Returns:
+            dict: The parsed JSON response
+
+        Raises:
+            HTTPException: 404 if ATTOM has no such property, 503 if the circuit
+            breaker is open, 504 on timeouts and 502 on other failures
+        """
+        if check_breaker:
+            self.check_breaker()
+        try:
+            return await self.query_with_retries(self.client(), endpoint, parameters)
+        except (HTTPException, asyncio.CancelledError):
+            # Failed calls were already reported; a missing setting or a cancel says nothing about ATTOM
+            self.breaker.release()
+            raise
+        except BaseException:
+            self.breaker.record_failure()
+            raise
+
+    async def query_with_retries(self, client: httpx.AsyncClient, endpoint: str, parameters: dict) -> dict:
+        """
+        The retry loop of query(). Reports the outcome to the circuit breaker.
+        """
+        error_status, error_detail = status.HTTP_502_BAD_GATEWAY, "Property data service failed"
+        for attempt in range(self.max_retries + 1):
+            response = None
+            await self.rate_limiter.acquire()
+            try:
+                with traced_call(f'attom GET {endpoint}', **{'http.request.method': 'GET', 'url.path': endpoint, 'http.request.resend_count': attempt}) as span:
+                    response = await client.get(endpoint, params=parameters)
+                    if span is not None:
+                        span.set_attribute('http.response.status_code', response.status_code)
+            except httpx.TimeoutException as e:
+                LOGGER.warning("ATTOM %s timed out (attempt %d): %s", endpoint, attempt + 1, e)
+                error_status, error_detail = status.HTTP_504_GATEWAY_TIMEOUT, "Property data service timed out"
+            except httpx.HTTPError as e:  # Connection and protocol errors, undecodable bodies, redirect loops
+                LOGGER.warning("ATTOM %s request error (attempt %d): %s", endpoint, attempt + 1, e)
+                error_status, error_detail = status.HTTP_502_BAD_GATEWAY, "Property data service failed"
+            else:
+                if response.status_code == 200:
+                    self.breaker.record_success()
+                    return response.json()
+                if response.status_code in NOT_FOUND_STATUS_CODES:
+                    self.breaker.record_success()  # ATTOM is up; the address just didn't match
+                    raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Property not found")
+                if response.status_code not in RETRY_STATUS_CODES:
+                    self.breaker.record_success()  # ATTOM is up but rejected the request, e.g. a bad API key
+                    LOGGER.error("ATTOM %s failed with status %d: %s", endpoint, response.status_code, response.text[:500])
+                    raise HTTPException(status_code=status.HTTP_502_BAD_GATEWAY, detail="Property data service failed")
+                LOGGER.warning("ATTOM %s returned %d (attempt %d)", endpoint, response.status_code, attempt + 1)
+                error_status, error_detail = status.HTTP_502_BAD_GATEWAY, "Property data service failed"
+            if attempt < self.max_retries:
+                await asyncio.sleep(self.backoff(attempt, response))
+
+        self.breaker.record_failure()
+        raise HTTPException(status_code=error_status, detail=error_detail)
+
+    async def cached_query(
+        self, endpoint: str, parameters: dict, address_key: str, force_refresh: bool = False, check_breaker: bool = True
+    ) -> dict:
+        """
+        query(), served from the cache when possible
+
+        Args:
+            endpoint (str): Endpoint to call
+            parameters (dict): Query parameters
+            address_key (str): The normalized address
+            force_refresh (bool): Skip the cache and replace its entry
+            check_breaker (bool): False if the caller already passed check_breaker()
+
+        Returns:
+            dict: The parsed JSON response
+        """
+        if self.cache is not None and not force_refresh:
+            data = await self.cache.get(endpoint, address_key)
+            if data is not None:
+                return data
+        try:
+            data = await self.query(endpoint, parameters, check_breaker)
+        except HTTPException as e:
+            if e.status_code == status.HTTP_404_NOT_FOUND and endpoint == HOME_EQUITY_ENDPOINT and self.cache is not None:
+                await self.cache.put(endpoint, address_key, {})  # No valuation is an answer too; don't pay for it again
+            raise
+        if self.cache is not None:
+            await self.cache.put(endpoint, address_key, data)
+        return data
+
+    async def get_property_details(self, address: str, city: str, state: str, zip_code: str, force_refresh: bool = False) -> dict:
+        """
+        Retrieve property description and valuation data, fetching both at once
+
+        Args:
+            address (str): Street address
+            city (str): City
+            state (str): State
+            zip_code (str): Zip code
+            force_refresh (bool): Fetch from ATTOM even if the data is cached
+
+        Returns:
+            dict: Property details
+        """
+        params = {
+            'address1': address,
+            'address2': f'{city}, {state} {zip_code}',
+        }
+        address_key = normalize_address(address, city, state, zip_code)
+        endpoints = (BASIC_PROFILE_ENDPOINT, HOME_EQUITY_ENDPOINT)
+        results = {}
+        if self.cache is not None and not force_refresh:
+            cached = await asyncio.gather(*(self.cache.get(endpoint, address_key) for endpoint in endpoints))
+            results = {endpoint: data for endpoint, data in zip(endpoints, cached) if data is not None}
+        missing = [endpoint for endpoint in endpoints if endpoint not in results]
+        if missing:
+            # Once per lookup, so a half open breaker's one trial covers both requests
+            self.check_breaker()
+            fetched = await asyncio.gather(
+                *(self.cached_query(endpoint, params, address_key, force_refresh=True, check_breaker=False) for endpoint in missing),
+                return_exceptions=True,
+            )
+            results.update(zip(missing, fetched))
+        property_data, equity_data = results[BASIC_PROFILE_ENDPOINT], results[HOME_EQUITY_ENDPOINT]
+        if isinstance(property_data, BaseException):
+            raise property_data
+        if isinstance(equity_data, HTTPException) and equity_data.status_code == status.HTTP_404_NOT_FOUND:
+            equity_data = {}  # Some properties have a profile but no valuation
+        elif isinstance(equity_data, BaseException):
+            raise equity_data
+        return {**parse_basic_property_data(property_data), **parse_home_equity_data(equity_data)}
+
+    async def get_property_details_batch(
+        self,
+        addresses: List[dict],
+        force_refresh: bool = False,
+        concurrency: int = ATTOM_BATCH_CONCURRENCY,
+    ) -> List[dict]:
+        """
+        Look up many properties at once
+
+        Addresses that normalize to the same key are looked up once. Cached
+        properties are served from the cache; the rest are fetched from ATTOM,
+        at most concurrency at a time.
+
+        Args:
+            addresses (List[dict]): Each with address, city, state and zip_code
+            force_refresh (bool): Fetch from ATTOM even if the data is cached
+            concurrency (int): Most lookups to run at once
+
+        Returns:
+            List[dict]: One result per address, in order, each with status_code
+            and either property or detail
+        """
+        semaphore = asyncio.Semaphore(max(1, concurrency))
+
+        async def lookup(address: dict) -> dict:
+            async with semaphore:
+                try:
+                    found = await self.get_property_details(
+                        address['address'], address['city'], address['state'], address['zip_code'], force_refresh
+                    )
+                    return {'status_code': status.HTTP_200_OK, 'property': found}
+                except HTTPException as e:
+                    return {'status_code': e.status_code, 'detail': e.detail}
+                except Exception as e:
+                    LOGGER.error("Property lookup failed for %s: %s", address, e)
+                    return {'status_code': status.HTTP_500_INTERNAL_SERVER_ERROR, 'detail': "Property lookup failed"}
+
+        keys = [normalize_address(address['address'], address['city'], address['state'], address['zip_code']) for address in addresses]
+        unique = {}
+        for key, address in zip(keys, addresses):
+            unique.setdefault(key, address)
+        results = dict(zip(unique, await asyncio.gather(*(lookup(address) for address in unique.values()))))
+        return [{'address': address, **results[key]} for key, address in zip(keys, addresses)]
+
+
+def parse_basic_property_data(property_data: dict) -> dict:
+    """
+    Parse property data
+
+    Args:
+        property_data (dict): Property data
+
+    Returns:
+        dict: Property description
+    """
+    property = property_data['property'][0]
+    last_sale_data = property.get('sale', {}).get('saleAmountData', {})
+    last_sale_date = last_sale_data.get('saleRecDate', 'n/a')
+    last_sale_amount = last_sale_data.get('saleAmt', 0)
+
+    assessment = property.get('assessment', {})
+    assessed_value = assessment.get('assessed', {}).get('assdTtlValue', 0)
+    county_market_value = assessment.get('market', {}).get('mktTtlValue', 0)
+    tax_year = str(int(assessment.get('tax', {}).get('taxYear', 0)))
+    tax_amount = assessment.get('tax', {}).get('taxAmt', 0)
+
+    owner = assessment.get('owner', {})
+    owners = []
+    for owner_number in range(1, 4):
+        owner_name_fn = owner.get(f'owner{owner_number}', {}).get('firstNameAndMi', '')
+        owner_name_ln = owner.get(f'owner{owner_number}', {}).get('lastName', '')
+        if owner_name_fn and owner_name_ln:
+            owners.append(f'{owner_name_fn} {owner_name_ln}'.strip())
+    owners = ', '.join(owners)
+    return {
+        'attom_id': property['identifier']['attomId'],
+        'tax_id': property['identifier']['apn'],
+        'address': property['address']['oneLine'],
+        'county': property['area']['countrySecSubd'],
+        'occupied_by': property['summary']['absenteeInd'],
+        'last_sale_date': last_sale_date,
+        'last_sale_amount': last_sale_amount,
+        'assessed_value': assessed_value,
+        'county_market_value': county_market_value,
+        'tax_year': tax_year,
+        'tax_amount': tax_amount,
+        'owners': owners,
+    }
+
+def parse_home_equity_data(equity_data: dict) -> dict:
+    """
+    Parse home equity data
+
+    Args:
+        equity_data (dict): Home equity data
+
+    Returns:
+        dict: Home equity data
+    """
+    property = equity_data.get('property')
+    if property is None:
+        LOGGER.info("No home equity data found")
+        return {
+            'approximate_value_midpoint': 0,
+            'approximate_value_high': 0,
+            'approximate_value_low': 0,
+            'equity_amount': 0,
+        }
+    property = property[0]
+    avm_data = property.get('avm', {})
+    avm_amount = avm_data.get('amount', {})
+    avm_value = avm_amount.get('value', 0)
+    avm_high = avm_amount.get('high', 0)
+    avm_low = avm_amount.get('low', 0)
+    equity_data = property.get('homeEquity', {})
+    equity_amount = equity_data.get('estimatedAvailableEquity', 0)
+
+    return {
+        'approximate_value_midpoint': avm_value,
+        'approximate_value_high': avm_high,
+        'approximate_value_low': avm_low,
+        'equity_amount': equity_amount,
+    }
+
+
+# Shared by all requests, so the connection pool and cache are reused
+ATTOM = AttomClient(cache=PropertyCache(PropertyCacheTable(), {
+    BASIC_PROFILE_ENDPOINT: timedelta(days=ATTOM_PROFILE_CACHE_DAYS),
+    HOME_EQUITY_ENDPOINT: timedelta(days=ATTOM_EQUITY_CACHE_DAYS),
+}))
@@ -0,0 +1,51 @@
+"""
+cache.py - In-process LRU cache whose entries expire
+"""
+from collections import OrderedDict
+from threading import Lock
+from time import monotonic
+from typing import Any, Hashable, Optional
+
+
+class TTLCache():
+    """
+    Least-recently-used cache of at most maxsize entries, each with its own lifetime
+    """
+    def __init__(self, maxsize: int) -> None:
+        self.maxsize = maxsize
+        self.lock = Lock()
+        self.entries: OrderedDict = OrderedDict()  # key -> (value, expires at, in monotonic() seconds)
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        """
+        Get a value, or None if it is missing or expired
+        """
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            value, expires = entry
+            if expires <= monotonic():
+                del self.entries[key]
+                return None
+            self.entries.move_to_end(key)
+            return value
+
+    def set(self, key: Hashable, value: Any, ttl: float) -> None:
+        """
+        Store a value for ttl seconds, evicting the least recently used entry if the cache is full
+        """
+        if self.maxsize <= 0 or ttl <= 0:
+            return
+        with self.lock:
+            self.entries[key] = (value, monotonic() + ttl)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+
+    def pop(self, key: Hashable) -> None:
+        with self.lock:
+            self.entries.pop(key, None)
+
+    def __len__(self) -> int:
+        return len(self.entries)
@@ -1,140 +1,503 @@
 """
 childsupport.py - Calculate child support
+
+Tax and guideline tables are versioned by tax year. Each year is a JSON file
+in TAX_TABLES_DIR (default util/tax_tables), loaded once into array-backed
+TaxTables. The directory is checked for new or changed files every
+TAX_TABLES_RELOAD_SECONDS, so a tax year can be added without a deploy.
+Requests choose a year with tax_year; DEFAULT_TAX_YEAR (default 2023) is used
+when they don't.
+
+calculate() results are memoized per normalized request and tables, in an LRU
+cache of CHILD_SUPPORT_CACHE_SIZE entries. Tables are told apart by version and
+by the file they were loaded from, so an edited file is not served from the cache.
+
+calculate_batch() and calculate_grid() compute many scenarios at once with
+NumPy, for charting support against income. They agree with calculate() to
+within a cent: NumPy and Python round half-cent amounts differently.
 """
+from bisect import bisect_right
 from collections import namedtuple
-from models.childsupport import ChildSupportRequest
+from dataclasses import dataclass
+from functools import lru_cache
+import json
+import os
+from threading import Lock
+from time import monotonic
+from typing import Dict, List, Optional, Tuple
+import numpy as np
+from models.childsupport import ChildSupportGridRequest, ChildSupportRequest
+from util.log_util import get_logger
+import settings  # NOQA
+
+LOGGER = get_logger('falconapi/childsupport.py')
 
 # Named tuple for holding tax bracket information
 TaxBracket = namedtuple('TaxBracket', ['lower_limit', 'upper_limit', 'tax_rate', 'tax_on_lower_brackets'])
 
-# Updated for 2023 Tax Tables
-TAX_TABLE_YEAR = 2023
-FEDERAL_MINIMUM_WAGE = 7.25
-SOCIAL_SECURITY_TAX_RATE = 0.062
-SOCIAL_SECURITY_CAP = 160200.00
-MEDICARE_TAX_RATE = 0.0145
-TEXAS_NET_RESOURCES_LIMIT = 9200.00
-FEDERAL_STANDARD_DEDUCTION = 13850.00
-
-# Percentage of self-employed person's employment income that is
-# subject to payroll taxes.
-SELF_EMPLOYMENT_TAXABLE_INCOME = 1.0 - (SOCIAL_SECURITY_TAX_RATE + MEDICARE_TAX_RATE)
-
-# Updated for 2023 Tax Tables
-# https://www.nerdwallet.com/article/taxes/federal-income-tax-brackets
-# [0] = upper limit of bracket
-# [1] = tax rate
-# [2] = tax on lower brackets
-#
-# So for a taxable income of $100,000:
-#    Base tax = $5,147.00
-#    Additional Tax = ($100,000 - $95,375) * .24
-#    Total Tax = Base Tax + Additional Tax
-FEDERAL_INCOME_TAX_TABLE = [
-	TaxBracket(0.00, 11000.00, 0.10, 0.00),
-	TaxBracket(11001.00, 44725.00, 0.12, 1100),
-	TaxBracket(44726.00, 95375.00, 0.22, 5147.00),
-	TaxBracket(95376.00, 182100.00, 0.24, 16290.00),
-	TaxBracket(182101.00, 231250.00, 0.32, 37104.00),
-	TaxBracket(231251.00, 578125.00, 0.35, 52832.00),
-	TaxBracket(578126.00, 99999999999.00, 0.37, 174238.25),
-]
-
-TEXAS_CHILD_FACTORS = [
-	[(1, 0, 0.20), (1, 1, 0.175), (1, 2, 0.16), (1, 3, 0.1475), (1, 4, 0.136), (1, 5, 0.1333), (1, 6, 0.1314), (1, 7, 0.13)],
-	[(2, 0, 0.25), (2, 1, .225), (2, 2, .2063), (2,3,.19), (2,4,.1833), (2,5,.1786), (2,6,.175), (2,7, .1722)],
-	[(3,0,.30), (3,1,.2738), (3,2,.252), (3,3,.24), (3,4,.2314), (3,5,.225), (3,6,.22), (3,7,.216)],
-	[(4,0,.35), (4,1,.322), (4,2,.3033), (4,3,.29), (4,4,.28), (4,5,.2722), (4,6,.266), (4,7,.2609)],
-	[(5,0,.40), (5,1,.3733), (5,2,.3543), (5,3,.34), (5,4,.3289), (5,5,.32), (5,6,.3127), (5,7,.3067)],
-	[(6,0,.40), (6,1,.3771), (6,2,.36), (6,3,.3467), (6,4,.336), (6,5,.3273), (6,6,.32), (6,7,.3138)],
-	[(7,0,.40), (7,1,.38), (7,2,.3644), (7,3,.352), (7,4,.3418), (7,5,.3333), (7,6,.3262), (7,7,.32)],
-]
+TAX_TABLES_DIR = os.getenv('TAX_TABLES_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'tax_tables'))
+TAX_TABLES_RELOAD_SECONDS = float(os.getenv('TAX_TABLES_RELOAD_SECONDS', '300'))
+DEFAULT_TAX_YEAR = int(os.getenv('DEFAULT_TAX_YEAR', '2023'))
+CHILD_SUPPORT_CACHE_SIZE = int(os.getenv('CHILD_SUPPORT_CACHE_SIZE', '4096'))
+
+# Paychecks per year for each income frequency
+INCOME_PERIODS_PER_YEAR = {'weekly': 52, 'biweekly': 26, 'semimonthly': 24, 'monthly': 12, 'annually': 1, 'yearly': 1}
+
+
+class UnknownTaxYearError(ValueError):
+	"""
+	Exception for a tax year we have no tables for
+	"""
+	def __init__(self, tax_year: int, available: List[int]):
+		self.message = f"No tax tables for {tax_year}. Available years: {', '.join(str(year) for year in available)}"
+		super().__init__(self.message)
+
+
+@dataclass(frozen=True, eq=False)
+class TaxTables:
+	"""
+	One tax year's tax and guideline tables
+
+	Brackets are kept both as a tuple of lower limits, for bisect, and as
+	arrays, for the vectorized calculations. Tables are identified by their
+	version and signature (the file's path and mtime), so calculations can be
+	cached by them.
+	"""
+	year: int
+	version: str
+	federal_minimum_wage: float
+	social_security_tax_rate: float
+	social_security_cap: float
+	medicare_tax_rate: float
+	texas_net_resources_limit: float  # Monthly
+	federal_standard_deduction: float
+	brackets: Tuple[TaxBracket, ...]
+	bracket_lower_limits: Tuple[float, ...]
+	bracket_lower_limit_array: np.ndarray
+	bracket_upper_limit_array: np.ndarray
+	bracket_tax_rate_array: np.ndarray
+	bracket_base_tax_array: np.ndarray
+	child_factors: np.ndarray  # [number of children - 1, number of other children]
+	signature: tuple = ()
+
+	@property
+	def self_employment_taxable_income(self) -> float:
+		# Percentage of self-employed person's employment income that is
+		# subject to payroll taxes.
+		return 1.0 - (self.social_security_tax_rate + self.medicare_tax_rate)
+
+	def __eq__(self, other) -> bool:
+		return isinstance(other, TaxTables) and (self.version, self.signature) == (other.version, other.signature)
+
+	def __hash__(self) -> int:
+		return hash((self.version, self.signature))
+
+	@classmethod
+	def from_dict(cls, data: dict, signature: tuple = ()) -> 'TaxTables':
+		"""
+		Build tables from the contents of a tax table file
+
+		Args:
+			data (dict): The parsed JSON
+			signature (tuple): Identifies the file, e.g. (path, mtime)
+
+		Returns:
+			TaxTables: The tables
+
+		Raises:
+			ValueError: If the brackets are out of order or the factor table is not rectangular
+		"""
+		brackets = tuple(TaxBracket(*map(float, bracket)) for bracket in data['federal_income_tax_brackets'])
+		lower_limits = tuple(bracket.lower_limit for bracket in brackets)
+		if not brackets or list(lower_limits) != sorted(lower_limits):
+			raise ValueError("federal_income_tax_brackets must be sorted by lower limit")
+		child_factors = np.array(data['texas_child_factors'], dtype=float)
+		if child_factors.ndim != 2:
+			raise ValueError("texas_child_factors must be a table with a row for each number of children")
+		child_factors.setflags(write=False)
+		tables = cls(
+			year=int(data['year']),
+			version=str(data['version']),
+			federal_minimum_wage=float(data['federal_minimum_wage']),
+			social_security_tax_rate=float(data['social_security_tax_rate']),
+			social_security_cap=float(data['social_security_cap']),
+			medicare_tax_rate=float(data['medicare_tax_rate']),
+			texas_net_resources_limit=float(data['texas_net_resources_limit']),
+			federal_standard_deduction=float(data['federal_standard_deduction']),
+			brackets=brackets,
+			bracket_lower_limits=lower_limits,
+			bracket_lower_limit_array=np.array(lower_limits),
+			bracket_upper_limit_array=np.array([bracket.upper_limit for bracket in brackets]),
+			bracket_tax_rate_array=np.array([bracket.tax_rate for bracket in brackets]),
+			bracket_base_tax_array=np.array([bracket.tax_on_lower_brackets for bracket in brackets]),
+			child_factors=child_factors,
+			signature=signature,
+		)
+		for array in (tables.bracket_lower_limit_array, tables.bracket_upper_limit_array, tables.bracket_tax_rate_array, tables.bracket_base_tax_array):
+			array.setflags(write=False)
+		return tables
+
+
+class TaxTableRegistry():
+	"""
+	The tax tables for every year in a directory, reloaded when the files change
+	"""
+	def __init__(self, directory: str = TAX_TABLES_DIR, reload_seconds: float = TAX_TABLES_RELOAD_SECONDS) -> None:
+		self.directory = directory
+		self.reload_seconds = reload_seconds
+		self.lock = Lock()
+		self.tables: Dict[int, TaxTables] = {}
+		self.signature = None
+		self.checked = 0.0
+		self.reload()
+
+	def files(self) -> List[str]:
+		try:
+			return sorted(os.path.join(self.directory, name) for name in os.listdir(self.directory) if name.endswith('.json'))
+		except OSError as e:
+			LOGGER.error("Cannot read tax tables from %s: %s", self.directory, e)
+			return []
+
+	def reload(self) -> bool:
+		"""
+		Load the tables again if any file was added, removed or changed
+
+		Returns:
+			bool: True if the tables were reloaded
+		"""
+		files = self.files()
+		signature = tuple((path, os.path.getmtime(path)) for path in files)
+		with self.lock:
+			self.checked = monotonic()
+			if signature == self.signature:
+				return False
+			tables = {}
+			for file_signature in signature:
+				path = file_signature[0]
+				try:
+					with open(path, 'r', encoding='utf-8') as f:
+						year_tables = TaxTables.from_dict(json.load(f), file_signature)
+				except (OSError, KeyError, TypeError, ValueError) as e:
+					LOGGER.error("Skipping tax table file %s: %s", path, e)
+					continue
+				tables[year_tables.year] = year_tables
+			self.tables = tables
+			self.signature = signature
+		LOGGER.info("Loaded tax tables for %s", ', '.join(table.version for table in tables.values()) or 'no years')
+		return True
+
+	@property
+	def years(self) -> List[int]:
+		return sorted(self.tables)
+
+	def get(self, tax_year: Optional[int] = None) -> TaxTables:
+		"""
+		Get the tables for a tax year
+
+		Args:
+			tax_year (int): The tax year, or None for DEFAULT_TAX_YEAR
+
+		Returns:
+			TaxTables: The tables
+
+		Raises:
+			UnknownTaxYearError: If there are no tables for the year
+		"""
+		if monotonic() - self.checked > self.reload_seconds:
+			self.reload()
+		tables = self.tables
+		if tax_year is None:
+			tax_year = DEFAULT_TAX_YEAR
+		if tax_year not in tables:
+			raise UnknownTaxYearError(tax_year, sorted(tables))
+		return tables[tax_year]
+
+
+TAX_TABLES = TaxTableRegistry()
+
+
+def calculation_cache_stats() -> dict:
+	"""
+	Hit and miss counts for the calculate() cache
+	"""
+	return calculate_normalized.cache_info()._asdict()
+
+
+@lru_cache(maxsize=CHILD_SUPPORT_CACHE_SIZE)
+def calculate_normalized(
+	tables: TaxTables,
+	number_of_children: int,
+	other_children: int,
+	annual_wage_income: float,
+	annual_nonwage_income: float,
+	self_employed: bool,
+	union_dues: float,
+	health_insurance: float,
+) -> dict:
+	"""
+	Calculate child support from annualized inputs
+
+	Requests that differ only in how their income is expressed (e.g. weekly
+	or annually) normalize to the same arguments and share a cache entry.
+	"""
+	if self_employed:
+		income_adjustment = tables.self_employment_taxable_income
+		tax_rate_adjustment = 2.0
+	else:
+		income_adjustment = 1.0
+		tax_rate_adjustment = 1.0
+
+	annual_social_security_tax = min(annual_wage_income * income_adjustment, tables.social_security_cap) * tables.social_security_tax_rate * tax_rate_adjustment
+	annual_medicare_tax = annual_wage_income * income_adjustment * tables.medicare_tax_rate * tax_rate_adjustment
+	annual_taxable_income = annual_nonwage_income + annual_wage_income - tables.federal_standard_deduction
+	federal_income_tax = federal_income_tax_for(tables, annual_taxable_income)
+	annual_net_resources = min(
+		annual_wage_income + annual_nonwage_income - annual_social_security_tax - annual_medicare_tax - federal_income_tax - union_dues * 12 - health_insurance * 12,
+		tables.texas_net_resources_limit * 12
+	)
+	factor = float(tables.child_factors[number_of_children - 1, other_children])
+	annual_child_support = annual_net_resources * factor
+	capped_flag = (annual_net_resources * 12) == tables.texas_net_resources_limit
+
+	return {
+		'net_monthly_resources': round(annual_net_resources / 12.0, 2),
+		'child_support': round(annual_child_support / 12.0, 2),
+		'capped_flag': capped_flag,
+		'tax_table_version': tables.version,
+		'child_support_factor': factor,
+		'monthly_wage_income': annual_wage_income / 12.0,
+		'monthly_nonwage_income': round(annual_nonwage_income / 12.0, 2),
+		'social_security_tax': round(annual_social_security_tax / 12.0, 2),
+		'medicare_tax': round(annual_medicare_tax / 12.0, 2),
+		'federal_income_tax': round(federal_income_tax / 12.0, 2),
+	}
+
+
+def federal_income_tax_for(tables: TaxTables, taxable_income: float) -> float:
+	"""
+	Calculate federal income tax, finding the bracket with bisect
+
+	Income below the first bracket or between two brackets' limits is not taxed.
+	"""
+	index = bisect_right(tables.bracket_lower_limits, taxable_income) - 1
+	if index < 0:
+		return 0.0
+	bracket = tables.brackets[index]
+	if taxable_income > bracket.upper_limit:
+		return 0.0
+	marginal_income = taxable_income - bracket.lower_limit + 1  # Add 1 so that we're taxing all of the income in the bracket
+	additional_tax = marginal_income * bracket.tax_rate
+	return round(bracket.tax_on_lower_brackets + additional_tax, 2)
+
+
+def factor_indexes(tables: TaxTables, number_of_children, number_of_other_children):
+	"""
+	Row and column of the child factor table. Works on ints and on arrays.
+
+	The table stops at 7 children and 7 other children; larger counts use the last row or column.
+	"""
+	rows = np.clip(number_of_children, 1, tables.child_factors.shape[0]) - 1
+	columns = np.clip(number_of_other_children, 0, tables.child_factors.shape[1] - 1)
+	return rows, columns
+
 
 class TxChildSupportCalculator():
 	"""
 	Calculate Child Support in Texas.
 	"""
 
+	def __init__(self, tax_tables: TaxTableRegistry = None) -> None:
+		self.tax_tables = tax_tables or TAX_TABLES
+
 	def calculate(self, request: ChildSupportRequest):
 		"""
 		Calculate child support
+
+		Raises:
+			UnknownTaxYearError: If there are no tables for request.tax_year
 		"""
+		tables = self.tax_tables.get(request.tax_year)
 		if request.mininum_wage:
-			request.wage_income = FEDERAL_MINIMUM_WAGE * 40.00
-			request.wage_income_frequency = 'weekly'
-
-		if request.self_employed:
-			income_adjustment = SELF_EMPLOYMENT_TAXABLE_INCOME
-			tax_rate_adjustment = 2.0
+			annual_wage_income = self.calculate_annual_income(tables.federal_minimum_wage * 40.00, 'weekly')
 		else:
-			income_adjustment = 1.0
-			tax_rate_adjustment = 1.0
-
-		annual_wage_income = self.calculate_annual_income(request.wage_income, request.wage_income_frequency)
+			annual_wage_income = self.calculate_annual_income(request.wage_income, request.wage_income_frequency)
 		annual_nonwage_income = self.calculate_annual_income(request.nonwage_income, request.nonwage_income_frequency)
-		annual_social_security_tax = min(annual_wage_income * income_adjustment, SOCIAL_SECURITY_CAP) * SOCIAL_SECURITY_TAX_RATE * tax_rate_adjustment
-		annual_medicare_tax = annual_wage_income * income_adjustment * MEDICARE_TAX_RATE * tax_rate_adjustment
-		annual_taxable_income = annual_nonwage_income + annual_wage_income - FEDERAL_STANDARD_DEDUCTION
-		federal_income_tax = self.calculate_federal_income_tax(annual_taxable_income)
-		annual_net_resources = min(
-			annual_wage_income + annual_nonwage_income - annual_social_security_tax - annual_medicare_tax - federal_income_tax - request.union_dues * 12 - request.health_insurance * 12,
-			TEXAS_NET_RESOURCES_LIMIT * 12
-		)
-		factor = self.child_support_factor(request.number_of_children, request.other_children)
-		annual_child_support = annual_net_resources * factor
-		capped_flag = (annual_net_resources * 12) == TEXAS_NET_RESOURCES_LIMIT
+		rows, columns = factor_indexes(tables, request.number_of_children, request.other_children)
 
-		return {
-			'net_monthly_resources': round(annual_net_resources / 12.0, 2),
-			'child_support': round(annual_child_support / 12.0, 2),
-			'capped_flag': capped_flag,
-			'tax_table_version': f'{TAX_TABLE_YEAR}.2',
-			'child_support_factor': factor,
-			'monthly_wage_income': annual_wage_income / 12.0,
-			'monthly_nonwage_income': round(annual_nonwage_income / 12.0, 2),
-			'social_security_tax': round(annual_social_security_tax / 12.0, 2),
-			'medicare_tax': round(annual_medicare_tax / 12.0, 2),
-			'federal_income_tax': round(federal_income_tax / 12.0, 2),
-		}
+		result = calculate_normalized(
+			tables, int(rows) + 1, int(columns), annual_wage_income, annual_nonwage_income,
+			request.self_employed, request.union_dues, request.health_insurance,
+		)
+		return dict(result)  # The cached dict is shared
 
-	def child_support_factor(self, number_of_children: int, number_of_other_children: int) -> float:
+	def child_support_factor(self, number_of_children: int, number_of_other_children: int, tax_year: int = None) -> float:
 		"""
 		Lookup the child support factor for the given number of children and other children
-		
+
 		Args:
 			number_of_children (int): Number of children before the court
 			number_of_other_children (int): Number of other children the obligor has the duty to support
+			tax_year (int): Tax year of the guideline tables, default DEFAULT_TAX_YEAR
 		"""
-		if number_of_children > 7:
-			number_of_children = 7
-		return TEXAS_CHILD_FACTORS[number_of_children-1][number_of_other_children][2]
+		tables = self.tax_tables.get(tax_year)
+		rows, columns = factor_indexes(tables, number_of_children, number_of_other_children)
+		return float(tables.child_factors[rows, columns])
 
-	def calculate_federal_income_tax(self, taxable_income: float):
+	def calculate_federal_income_tax(self, taxable_income: float, tax_year: int = None):
 		"""
 		Calculate federal income tax
 		"""
-		tax = 0.0
-		for idx, bracket in enumerate(FEDERAL_INCOME_TAX_TABLE):
-			if taxable_income >= bracket.lower_limit and taxable_income <= bracket.upper_limit:
-				marginal_income = taxable_income - bracket.lower_limit + 1  # Add 1 so that we're taxing all of the income in the bracket
-				additional_tax = marginal_income * bracket.tax_rate
-				tax = bracket.tax_on_lower_brackets + additional_tax
-				break
-		return round(tax, 2)
+		return federal_income_tax_for(self.tax_tables.get(tax_year), taxable_income)
 
 	def calculate_annual_income(self, income: float, frequency: str):
 		"""
-		Calculate monthly income
-		"""
-		if frequency == 'weekly':
-			return round(income * 52, 2)
-		elif frequency == 'biweekly':
-			return round(income * 26, 2)
-		elif frequency == 'semimonthly':
-			return round(income * 24, 2)
-		elif frequency == 'monthly':
-			return round(income * 12, 2)
-		elif frequency in ['annually', 'yearly']:
-			return round(income, 2)
+		Calculate annual income
+		"""
+		if frequency not in INCOME_PERIODS_PER_YEAR:
+			raise ValueError(f"Invalid income frequency: {frequency}")
+		return round(income * INCOME_PERIODS_PER_YEAR[frequency], 2)
+
+	def calculate_batch(self, requests: List[ChildSupportRequest]) -> dict:
+		"""
+		Calculate child support for many scenarios in one vectorized pass per tax year
+
+		Args:
+			requests (List[ChildSupportRequest]): The scenarios
+
+		Returns:
+			dict: One array per ChildSupportResponse field, in the order of the requests
+
+		Raises:
+			UnknownTaxYearError: If there are no tables for a scenario's tax_year
+		"""
+		tables_by_year = {tax_year: self.tax_tables.get(tax_year) for tax_year in {request.tax_year for request in requests}}
+		versions = [tables_by_year[request.tax_year].version for request in requests]
+
+		minimum_wage = np.array([request.mininum_wage for request in requests], dtype=bool)
+		wage_income = np.array([request.wage_income for request in requests], dtype=float)
+		wage_periods = np.array([INCOME_PERIODS_PER_YEAR[request.wage_income_frequency] for request in requests], dtype=float)
+		minimum_wages = np.array([tables_by_year[request.tax_year].federal_minimum_wage for request in requests], dtype=float)
+		wage_income = np.where(minimum_wage, minimum_wages * 40.00, wage_income)
+		wage_periods = np.where(minimum_wage, INCOME_PERIODS_PER_YEAR['weekly'], wage_periods)
+		nonwage_periods = np.array([INCOME_PERIODS_PER_YEAR[request.nonwage_income_frequency] for request in requests], dtype=float)
+		inputs = {
+			'number_of_children': np.array([request.number_of_children for request in requests], dtype=int),
+			'other_children': np.array([request.other_children for request in requests], dtype=int),
+			'annual_wage_income': np.round(wage_income * wage_periods, 2),
+			'annual_nonwage_income': np.round(np.array([request.nonwage_income for request in requests], dtype=float) * nonwage_periods, 2),
+			'self_employed': np.array([request.self_employed for request in requests], dtype=bool),
+			'union_dues': np.array([request.union_dues for request in requests], dtype=float),
+			'health_insurance': np.array([request.health_insurance for request in requests], dtype=float),
+		}
+
+		if len(tables_by_year) == 1:
+			result = self.calculate_arrays(next(iter(tables_by_year.values())), **inputs)
 		else:
-			raise ValueError(f"Invalid income frequency: {frequency}")
\ No newline at end of file
+			years = np.array([request.tax_year or 0 for request in requests])
+			result = None
+			for tax_year, tables in tables_by_year.items():
+				selected = np.flatnonzero(years == (tax_year or 0))
+				partial = self.calculate_arrays(tables, **{name: values[selected] for name, values in inputs.items()})
+				if result is None:
+					result = {name: np.empty(len(requests), dtype=values.dtype) for name, values in partial.items() if isinstance(values, np.ndarray)}
+				for name, values in result.items():
+					values[selected] = partial[name]
+			result['count'] = len(requests)
+		result['tax_table_version'] = versions
+		return result
+
+	def calculate_grid(self, request: ChildSupportGridRequest) -> dict:
+		"""
+		Calculate child support across a range of wage incomes and numbers of children
+
+		Every other input is taken from request.scenario.
+
+		Args:
+			request (ChildSupportGridRequest): The base scenario and the ranges to sweep
+
+		Returns:
+			dict: One array per ChildSupportResponse field, plus the wage_income and
+			number_of_children of each point. Points are ordered by number of children,
+			then by wage income.
+
+		Raises:
+			UnknownTaxYearError: If there are no tables for the scenario's tax_year
+		"""
+		scenario = request.scenario
+		tables = self.tax_tables.get(scenario.tax_year)
+		incomes = np.linspace(request.wage_income_min, request.wage_income_max, request.wage_income_points)
+		children, wage_income = np.meshgrid(np.array(request.children, dtype=int), incomes, indexing='ij')
+		children = children.ravel()
+		wage_income = wage_income.ravel()
+		points = wage_income.size
+
+		result = self.calculate_arrays(
+			tables,
+			number_of_children=children,
+			other_children=np.full(points, scenario.other_children, dtype=int),
+			annual_wage_income=np.round(wage_income * INCOME_PERIODS_PER_YEAR[scenario.wage_income_frequency], 2),
+			annual_nonwage_income=np.full(points, self.calculate_annual_income(scenario.nonwage_income, scenario.nonwage_income_frequency)),
+			self_employed=np.full(points, scenario.self_employed, dtype=bool),
+			union_dues=np.full(points, scenario.union_dues),
+			health_insurance=np.full(points, scenario.health_insurance),
+		)
+		result['tax_table_version'] = tables.version
+		result['wage_income'] = wage_income
+		result['number_of_children'] = children
+		return result
+
+	def calculate_arrays(
+		self,
+		tables: TaxTables,
+		number_of_children: np.ndarray,
+		other_children: np.ndarray,
+		annual_wage_income: np.ndarray,
+		annual_nonwage_income: np.ndarray,
+		self_employed: np.ndarray,
+		union_dues: np.ndarray,
+		health_insurance: np.ndarray,
+	) -> dict:
+		"""
+		The calculation in calculate_normalized(), on arrays of scenarios
+		"""
+		income_adjustment = np.where(self_employed, tables.self_employment_taxable_income, 1.0)
+		tax_rate_adjustment = np.where(self_employed, 2.0, 1.0)
+
+		annual_social_security_tax = np.minimum(annual_wage_income * income_adjustment, tables.social_security_cap) * tables.social_security_tax_rate * tax_rate_adjustment
+		annual_medicare_tax = annual_wage_income * income_adjustment * tables.medicare_tax_rate * tax_rate_adjustment
+		annual_taxable_income = annual_nonwage_income + annual_wage_income - tables.federal_standard_deduction
+		federal_income_tax = self.federal_income_tax_array(tables, annual_taxable_income)
+		annual_net_resources = np.minimum(
+			annual_wage_income + annual_nonwage_income - annual_social_security_tax - annual_medicare_tax - federal_income_tax - union_dues * 12 - health_insurance * 12,
+			tables.texas_net_resources_limit * 12
+		)
+		rows, columns = factor_indexes(tables, number_of_children, other_children)
+		factor = tables.child_factors[rows, columns]
+		annual_child_support = annual_net_resources * factor
+
+		return {
+			'count': int(annual_net_resources.size),
+			'net_monthly_resources': np.round(annual_net_resources / 12.0, 2),
+			'child_support': np.round(annual_child_support / 12.0, 2),
+			'capped_flag': (annual_net_resources * 12) == tables.texas_net_resources_limit,
+			'child_support_factor': factor,
+			'monthly_wage_income': annual_wage_income / 12.0,
+			'monthly_nonwage_income': np.round(annual_nonwage_income / 12.0, 2),
+			'social_security_tax': np.round(annual_social_security_tax / 12.0, 2),
+			'medicare_tax': np.round(annual_medicare_tax / 12.0, 2),
+			'federal_income_tax': np.round(federal_income_tax / 12.0, 2),
+		}
+
+	def federal_income_tax_array(self, tables: TaxTables, taxable_income: np.ndarray) -> np.ndarray:
+		"""
+		Calculate federal income tax for an array of taxable incomes
+
+		Finds each income's bracket with searchsorted. Like federal_income_tax_for(),
+		income below the first bracket or between two brackets' limits is not taxed.
+		"""
+		brackets = np.searchsorted(tables.bracket_lower_limit_array, taxable_income, side='right') - 1
+		index = np.clip(brackets, 0, len(tables.brackets) - 1)
+		in_bracket = (brackets >= 0) & (taxable_income <= tables.bracket_upper_limit_array[index])
+		marginal_income = taxable_income - tables.bracket_lower_limit_array[index] + 1  # Add 1 so that we're taxing all of the income in the bracket
+		tax = tables.bracket_base_tax_array[index] + marginal_income * tables.bracket_tax_rate_array[index]
+		return np.round(np.where(in_bracket, tax, 0.0), 2)
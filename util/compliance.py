@@ -0,0 +1,89 @@
+"""
+compliance.py - Compliance classification configuration
+
+A compliance matrix needs, for each compliance classification, the
+sub-classification fields that identify an account and a way to turn a
+document's sub_classification into a compliance key. Both come from
+doc_classifier's PromptData, which parses its prompt configuration each time
+it is created.
+
+get_compliance_config() reads that configuration once into an immutable
+lookup, classification -> ComplianceRule, and keeps it until the installed
+doc_classifier version changes.
+"""
+from dataclasses import dataclass
+from functools import lru_cache, partial
+from importlib import metadata
+from types import MappingProxyType
+from typing import Callable, Mapping, Optional, Tuple
+from util.log_util import get_logger
+
+LOGGER = get_logger('falconapi/compliance.py')
+
+DOC_CLASSIFIER_DISTRIBUTION = 'doc-classifier'
+
+
+@dataclass(frozen=True)
+class ComplianceRule:
+    """
+    How documents of one classification are grouped in a compliance matrix
+    """
+    classification: str
+    key_fields: Tuple[str, ...]
+    make_key: Callable[[dict], Optional[str]]  # sub_classification -> compliance key
+
+
+@dataclass(frozen=True)
+class ComplianceConfig:
+    """
+    Compliance rules for every compliance classification
+    """
+    version: str
+    rules: Mapping[str, ComplianceRule]
+
+    @property
+    def classifications(self) -> Tuple[str, ...]:
+        return tuple(sorted(self.rules))
+
+
+def prompt_data_version() -> str:
+    """
+    The installed doc_classifier version, which changes when its prompt data does
+    """
+    try:
+        return metadata.version(DOC_CLASSIFIER_DISTRIBUTION)
+    except metadata.PackageNotFoundError:
+        return 'unknown'
+
+
+@lru_cache(maxsize=1)
+def load_compliance_config(version: str) -> ComplianceConfig:
+    """
+    Read the compliance configuration from doc_classifier
+
+    Args:
+        version (str): The doc_classifier version. Only used as the cache key.
+
+    Returns:
+        ComplianceConfig: The rules for each compliance classification
+    """
+    # doc_classifier is heavy to import and only the compliance report needs it
+    from doc_classifier.openai_prompt_data import PromptData
+    prompt_data = PromptData()
+    rules = {
+        classification: ComplianceRule(
+            classification=classification,
+            key_fields=tuple(prompt_data.compliance_key_fields(classification)),
+            make_key=partial(prompt_data.make_compliance_key, classification),
+        )
+        for classification in prompt_data.compliance_classifications()
+    }
+    LOGGER.info("Loaded compliance configuration for %d classifications (doc_classifier %s)", len(rules), version)
+    return ComplianceConfig(version=version, rules=MappingProxyType(rules))
+
+
+def get_compliance_config() -> ComplianceConfig:
+    """
+    The current compliance configuration, reloaded if doc_classifier was upgraded
+    """
+    return load_compliance_config(prompt_data_version())
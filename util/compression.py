@@ -0,0 +1,276 @@
+"""
+compression.py - Response compression middleware
+
+Compresses response bodies with gzip, and with brotli or zstd when those
+packages are installed and the client asks for them. Small responses and
+content types that do not compress well are passed through untouched.
+Streaming responses are compressed chunk by chunk. Compressed responses get
+Vary: Accept-Encoding, and a strong ETag is made weak (W/) since the bytes
+sent are no longer the ones it was computed for.
+"""
+from threading import Lock
+from typing import List, Optional
+import zlib
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover - optional dependency
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:  # pragma: no cover - optional dependency
+    zstandard = None
+
+
+DEFAULT_MINIMUM_SIZE = 1024
+DEFAULT_CONTENT_TYPES = ['application/json', 'text/csv', 'text/plain', 'text/html', 'text/markdown']
+DEFAULT_ENCODINGS = ['br', 'zstd', 'gzip']  # In order of preference
+
+
+def available_encodings(encodings: List[str]) -> List[str]:
+    """
+    Filter a list of encodings down to the ones we can produce
+
+    Args:
+        encodings (List[str]): Encodings in order of preference
+
+    Returns:
+        List[str]: The encodings whose compressor is installed
+    """
+    installed = {'gzip': True, 'br': brotli is not None, 'zstd': zstandard is not None}
+    return [encoding for encoding in encodings if installed.get(encoding, False)]
+
+
+class CompressionStats():
+    """
+    Running totals of what the compression middleware has done
+    """
+    def __init__(self):
+        self.lock = Lock()
+        self.responses = {}         # encoding -> responses compressed
+        self.bytes_in = {}          # encoding -> bytes before compression
+        self.bytes_out = {}         # encoding -> bytes after compression
+
+    def record(self, encoding: str, bytes_in: int, bytes_out: int) -> None:
+        """
+        Record one compressed response (or one streamed chunk)
+        """
+        with self.lock:
+            self.bytes_in[encoding] = self.bytes_in.get(encoding, 0) + bytes_in
+            self.bytes_out[encoding] = self.bytes_out.get(encoding, 0) + bytes_out
+
+    def record_response(self, encoding: str) -> None:
+        """
+        Count one compressed response
+        """
+        with self.lock:
+            self.responses[encoding] = self.responses.get(encoding, 0) + 1
+
+    def snapshot(self) -> dict:
+        """
+        Return the totals, including bytes saved, keyed by encoding
+        """
+        with self.lock:
+            return {
+                encoding: {
+                    'responses': self.responses.get(encoding, 0),
+                    'bytes_in': self.bytes_in.get(encoding, 0),
+                    'bytes_out': self.bytes_out.get(encoding, 0),
+                    'bytes_saved': self.bytes_in.get(encoding, 0) - self.bytes_out.get(encoding, 0),
+                }
+                for encoding in set(self.bytes_in) | set(self.responses)
+            }
+
+
+COMPRESSION_STATS = CompressionStats()
+
+
+class Compressor():
+    """
+    Incremental compressor for one response body
+    """
+    def __init__(self, encoding: str, level: int = 6):
+        self.encoding = encoding
+        if encoding == 'br':
+            self.compressor = brotli.Compressor(quality=min(level, 11))
+        elif encoding == 'zstd':
+            self.compressor = zstandard.ZstdCompressor(level=level).compressobj()
+        else:
+            self.compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+
+    def compress(self, data: bytes) -> bytes:
+        """
+        Compress a chunk and flush it so the client can decode it right away
+        """
+        if self.encoding == 'br':
+            return self.compressor.process(data) + self.compressor.flush()
+        if self.encoding == 'zstd':
+            return self.compressor.compress(data) + self.compressor.flush(zstandard.COMPRESSOBJ_FLUSH_BLOCK)
+        return self.compressor.compress(data) + self.compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self) -> bytes:
+        """
+        Return whatever is needed to end the compressed stream
+        """
+        if self.encoding == 'br':
+            return self.compressor.finish()
+        return self.compressor.flush()
+
+
+class CompressionMiddleware():
+    """
+    ASGI middleware that compresses responses
+
+    Args:
+        app (ASGIApp): The application to wrap
+        minimum_size (int): Responses smaller than this many bytes are not compressed.
+            Streaming responses are always compressed because their size is not known.
+        content_types (List[str]): Content types that will be compressed
+        encodings (List[str]): Content encodings we may use, in order of preference
+        level (int): Compression level
+    """
+    def __init__(
+        self,
+        app: ASGIApp,
+        minimum_size: int = DEFAULT_MINIMUM_SIZE,
+        content_types: Optional[List[str]] = None,
+        encodings: Optional[List[str]] = None,
+        level: int = 6,
+    ) -> None:
+        self.app = app
+        self.minimum_size = minimum_size
+        self.content_types = [ct.strip().lower() for ct in (content_types or DEFAULT_CONTENT_TYPES) if ct.strip()]
+        self.encodings = available_encodings(encodings or DEFAULT_ENCODINGS)
+        self.level = level
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+        encoding = self.select_encoding(Headers(scope=scope).get('accept-encoding', ''))
+        if not encoding:
+            await self.app(scope, receive, send)
+            return
+        responder = CompressionResponder(self, encoding, send)
+        await self.app(scope, receive, responder.send)
+
+    def select_encoding(self, accept_encoding: str) -> Optional[str]:
+        """
+        Pick the encoding we prefer among those the client accepts
+
+        Args:
+            accept_encoding (str): The request's Accept-Encoding header
+
+        Returns:
+            str: The chosen encoding or None if we should not compress
+        """
+        qualities = {}
+        for item in accept_encoding.lower().split(','):
+            parts = [part.strip() for part in item.split(';')]
+            if not parts[0]:
+                continue
+            quality = 1.0
+            for param in parts[1:]:
+                if param.startswith('q='):
+                    try:
+                        quality = float(param[2:])
+                    except ValueError:
+                        quality = 0.0
+            qualities[parts[0]] = quality
+        # '*' only covers the encodings the client did not name, so 'gzip;q=0, *' refuses gzip
+        wildcard = qualities.get('*', 0.0)
+        for encoding in self.encodings:
+            if qualities.get(encoding, wildcard) > 0:
+                return encoding
+        return None
+
+    def is_compressible(self, headers: Headers) -> bool:
+        """
+        Check whether a response's headers allow us to compress it
+        """
+        if 'content-encoding' in headers:
+            return False
+        content_type = headers.get('content-type', '').split(';')[0].strip().lower()
+        return content_type in self.content_types
+
+
+class CompressionResponder():
+    """
+    Wraps the ASGI send callable for one response
+    """
+    def __init__(self, middleware: CompressionMiddleware, encoding: str, send: Send) -> None:
+        self.middleware = middleware
+        self.encoding = encoding
+        self.downstream_send = send
+        self.start_message: Optional[Message] = None
+        self.compressor: Optional[Compressor] = None
+        self.passthrough = False
+
+    async def send(self, message: Message) -> None:
+        if message['type'] == 'http.response.start':
+            # Hold the start message until we see the first chunk of the body.
+            self.start_message = message
+            return
+        if message['type'] != 'http.response.body':
+            await self.downstream_send(message)
+            return
+
+        body = message.get('body', b'')
+        more_body = message.get('more_body', False)
+
+        if self.start_message is not None:
+            await self.start(body, more_body)
+            if self.passthrough:
+                await self.downstream_send(message)
+                return
+            if not more_body:
+                # The whole body arrived at once and has already been sent
+                return
+
+        if self.passthrough:
+            await self.downstream_send(message)
+            return
+
+        compressed = self.compressor.compress(body) if body else b''
+        if not more_body:
+            compressed += self.compressor.finish()
+        COMPRESSION_STATS.record(self.encoding, len(body), len(compressed))
+        await self.downstream_send({'type': 'http.response.body', 'body': compressed, 'more_body': more_body})
+
+    async def start(self, body: bytes, more_body: bool) -> None:
+        """
+        Decide whether to compress this response and send the start message
+        """
+        start_message = self.start_message
+        self.start_message = None
+        headers = MutableHeaders(raw=start_message['headers'])
+
+        if not self.middleware.is_compressible(headers) or (not more_body and len(body) < self.middleware.minimum_size):
+            self.passthrough = True
+            await self.downstream_send(start_message)
+            return
+
+        self.compressor = Compressor(self.encoding, self.middleware.level)
+        COMPRESSION_STATS.record_response(self.encoding)
+        headers['Content-Encoding'] = self.encoding
+        headers.add_vary_header('Accept-Encoding')
+        etag = headers.get('etag')
+        if etag and not etag.startswith('W/'):
+            # The compressed body is not byte for byte the one the strong ETag was made for
+            headers['ETag'] = f'W/{etag}'
+
+        if more_body:
+            # Streaming - the final length is unknown
+            if 'content-length' in headers:
+                del headers['Content-Length']
+            await self.downstream_send(start_message)
+            return
+
+        compressed = self.compressor.compress(body) + self.compressor.finish()
+        COMPRESSION_STATS.record(self.encoding, len(body), len(compressed))
+        headers['Content-Length'] = str(len(compressed))
+        await self.downstream_send(start_message)
+        await self.downstream_send({'type': 'http.response.body', 'body': compressed})
@@ -0,0 +1,86 @@
+"""
+diff.py - Field-level differences between two records
+
+Used by the audit log so that an update stores what changed instead of full
+copies of the record before and after.
+"""
+from typing import Any, Optional
+from pydantic import BaseModel
+
+
+def as_record(data: Any) -> dict:
+    """
+    Convert a model or dict to a JSON-compatible dict
+
+    Args:
+        data (Any): A pydantic model, a dict, or None
+
+    Returns:
+        dict: The record, or an empty dict for None
+    """
+    if data is None:
+        return {}
+    if isinstance(data, BaseModel):
+        return data.model_dump(mode='json', exclude_none=True)
+    return dict(data)
+
+
+def list_diff(old: list, new: list) -> dict:
+    """
+    Describe the change to a list as the items added and removed
+
+    Args:
+        old (list): The list before the change
+        new (list): The list after the change
+
+    Returns:
+        dict: {'added': [...], 'removed': [...]}, omitting empty keys
+    """
+    try:
+        old_items, new_items = set(old), set(new)
+        added = [item for item in new if item not in old_items]
+        removed = [item for item in old if item not in new_items]
+    except TypeError:
+        # Unhashable items, e.g. a list of dicts
+        added = [item for item in new if item not in old]
+        removed = [item for item in old if item not in new]
+    changes = {}
+    if added:
+        changes['added'] = added
+    if removed:
+        changes['removed'] = removed
+    return changes
+
+
+def field_diff(old_data: Any, new_data: Any, ignore: Optional[set] = None) -> dict:
+    """
+    Compare two records field by field
+
+    Lists are reported as the items added and removed, so linking one document
+    to a tracker does not copy the tracker's whole documents list. Other fields
+    are reported as their old and new values.
+
+    Args:
+        old_data (Any): The record before the change (model, dict, or None)
+        new_data (Any): The record after the change (model, dict, or None)
+        ignore (set): Field names to leave out
+
+    Returns:
+        dict: field name -> {'old': ..., 'new': ...} or {'added': [...], 'removed': [...]}
+    """
+    old, new = as_record(old_data), as_record(new_data)
+    ignore = ignore or set()
+    changes = {}
+    for field in list(old) + [field for field in new if field not in old]:
+        if field in ignore:
+            continue
+        old_value, new_value = old.get(field), new.get(field)
+        if old_value == new_value:
+            continue
+        if isinstance(old_value, list) or isinstance(new_value, list):
+            change = list_diff(old_value or [], new_value or [])
+            if change:
+                changes[field] = change
+            continue
+        changes[field] = {'old': old_value, 'new': new_value}
+    return changes
@@ -0,0 +1,100 @@
+"""
+etag.py - ETag and If-None-Match helpers
+
+Every record we store carries a version uuid that changes on each write, so
+the version is the record's ETag. A list's ETag is a hash of its members'
+versions. Routes read just the version(s) first and answer 304 Not Modified
+when the client already has the current representation.
+"""
+from hashlib import sha1
+from typing import Iterable, Optional
+from fastapi import Request, Response, status
+
+
+def make_etag(version: Optional[str]) -> Optional[str]:
+    """
+    Make an ETag from a record's version
+
+    Args:
+        version (str): The record's version
+
+    Returns:
+        str: The quoted ETag or None if the record has no version
+    """
+    if not version:
+        return None
+    return f'"{version}"'
+
+
+def list_etag(versions: Iterable[Optional[str]]) -> str:
+    """
+    Make an ETag for a list of records from their versions
+
+    The order of the versions matters, so callers must read them in the same
+    order that the list is returned in.
+
+    Args:
+        versions (Iterable[str]): The versions of the records in the list
+
+    Returns:
+        str: The quoted ETag
+    """
+    digest = sha1()
+    for version in versions:
+        digest.update((version or '*unversioned*').encode('utf-8'))
+        digest.update(b'\n')
+    return f'"{digest.hexdigest()}"'
+
+
+def etag_matches(request: Request, etag: Optional[str]) -> bool:
+    """
+    Check the request's If-None-Match header against an ETag
+
+    Uses the weak comparison that RFC 9110 requires for If-None-Match.
+
+    Args:
+        request (Request): The incoming request
+        etag (str): The current ETag
+
+    Returns:
+        bool: True if the client already has this representation
+    """
+    if not etag:
+        return False
+    if_none_match = request.headers.get('if-none-match')
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == '*':
+        return True
+    current = etag[2:] if etag.startswith('W/') else etag
+    for candidate in if_none_match.split(','):
+        candidate = candidate.strip()
+        if candidate.startswith('W/'):
+            candidate = candidate[2:]
+        if candidate == current:
+            return True
+    return False
+
+
+def not_modified(etag: str) -> Response:
+    """
+    Build a 304 Not Modified response
+    """
+    return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers={'ETag': etag})
+
+
+def records_etag(records: Iterable[dict]) -> str:
+    """
+    Make an ETag for a list of records read with an {'id': 1, 'version': 1} projection
+
+    The records are sorted by id first, so the ETag does not depend on the
+    order the database returned them in.
+
+    Args:
+        records (Iterable[dict]): Records with 'id' and 'version' keys
+
+    Returns:
+        str: The quoted ETag
+    """
+    pairs = sorted((record.get('id') or '', record.get('version') or '') for record in records)
+    return list_etag(f'{record_id}:{version}' for record_id, version in pairs)
@@ -0,0 +1,212 @@
+"""
+job_queue.py - Submitting work to the distributed work queue
+
+Every job is handed to the queue with DistributedWorkQueue.enqueue_work(), so
+the queue keeps control of its own keys and message format. JobSubmitter adds
+what the API needs around that call:
+
+    - A status record for each job, in the layout util/job_status.py describes.
+    - Batches, whose progress can be checked as a whole.
+    - Deduplication. A request is identified by its task, document, document
+      version and model. If that work is already queued or running, the
+      request gets the existing job's id and nothing is queued. A claim on
+      the work lasts until the job completes or fails, or for at most
+      JOB_INFLIGHT_TTL_MINUTES, so a job that crashes without reporting
+      blocks the work only briefly. Pass force=True to queue it again anyway.
+    - Idempotency keys. A client that retries with the same Idempotency-Key
+      gets the first submission's id back.
+"""
+from typing import Callable, Dict, List
+from uuid import uuid4
+from fastapi.concurrency import run_in_threadpool
+from models.queue_request import QueueRequest
+from util.job_status import FAILED, JobStatusStore
+from util.log_util import get_logger
+from util.metrics import record_coalesced, record_enqueue
+from util.tracing import traced_call
+
+LOGGER = get_logger('falconapi/job_queue.py')
+
+
+def work_key(request: QueueRequest, versions: Dict[str, str]) -> str:
+    """
+    What a request asks for: its task, run on one version of a document with one model
+
+    Requests with the same key would do the same work, so only one of them is queued.
+
+    Args:
+        request (QueueRequest): The request
+        versions (Dict[str, str]): doc_id -> current version, for payloads that don't name one
+
+    Returns:
+        str: The key
+    """
+    doc_id = request.payload['doc_id']
+    version = request.payload.get('version') or versions.get(doc_id, '')
+    return f"{request.task}|{doc_id}|{request.payload['model']}|{version}"
+
+
+def count_tasks(requests: List[QueueRequest]) -> Dict[str, int]:
+    counts = {}
+    for request in requests:
+        counts[request.task] = counts.get(request.task, 0) + 1
+    return counts
+
+
+class JobSubmitter():
+    """
+    Queues requests on a DistributedWorkQueue, recording, batching and deduplicating them
+    """
+    def __init__(
+        self,
+        work_queue,
+        job_status: JobStatusStore,
+        queue_name: str,
+        get_versions: Callable[[List[str]], Dict[str, str]],
+    ) -> None:
+        """
+        Args:
+            work_queue (DistributedWorkQueue): The queue
+            job_status (JobStatusStore): Where jobs, batches and claims are recorded
+            queue_name (str): The queue's name, for metrics and tracing
+            get_versions (Callable): doc_ids -> {doc_id: version}, e.g. DocumentsDict.get_versions
+        """
+        self.work_queue = work_queue
+        self.job_status = job_status
+        self.queue_name = queue_name
+        self.get_versions = get_versions
+
+    async def document_versions(self, requests: List[QueueRequest]) -> Dict[str, str]:
+        """
+        The current version of each request's document, unless the payload names one
+        """
+        doc_ids = list({request.payload['doc_id'] for request in requests if not request.payload.get('version')})
+        if not doc_ids:
+            return {}
+        return await run_in_threadpool(self.get_versions, doc_ids)
+
+    async def submit(self, request: QueueRequest, username: str, idempotency_key: str = None, force: bool = False) -> dict:
+        """
+        Queue one request, unless the same work is already queued or running
+
+        Args:
+            request (QueueRequest): Request to be queued
+            username (str): Who is queueing it; scopes the idempotency key
+            idempotency_key (str): Optional Idempotency-Key header
+            force (bool): Queue it even if the same work is in flight
+
+        Returns:
+            dict: message, id and duplicate, which is True when an existing job's id is returned
+        """
+        if idempotency_key:
+            existing = await self.job_status.claim_idempotency_key(username, idempotency_key, request.request_id)
+            if existing:
+                record_coalesced(self.queue_name, request.task, 'idempotency_key')
+                return {"message": f"{request.task} task already queued", "id": existing, "duplicate": True}
+
+        claimed = {}
+        try:
+            # Everything after the idempotency key is claimed runs here, so a failure frees the key for a retry
+            claim = {work_key(request, await self.document_versions([request])): request.request_id}
+            existing = next(iter((await self.job_status.claim_in_flight(claim, force)).values()), None)
+            if existing:
+                if idempotency_key:
+                    await self.job_status.set_idempotency_key(username, idempotency_key, existing)
+                record_coalesced(self.queue_name, request.task, 'in_flight')
+                return {"message": f"{request.task} task already queued", "id": existing, "duplicate": True}
+            claimed = claim
+
+            # Record the job before queueing it, so a fast worker's status is not overwritten
+            with traced_call('redis add_job', **{'db.system': 'redis'}):
+                await self.job_status.add_job(request.request_id)
+            with traced_call('redis enqueue_work', **{'db.system': 'redis', 'messaging.destination.name': self.queue_name, 'falcon.task': request.task}):
+                await run_in_threadpool(self.work_queue.enqueue_work, request.json())
+        except Exception as e:
+            if claimed:
+                await self.job_status.set_status(request.request_id, FAILED, f"Could not be queued: {e}")
+                await self.job_status.release_in_flight(claimed)
+            if idempotency_key:
+                await self.job_status.set_idempotency_key(username, idempotency_key, None)
+            raise
+        record_enqueue(self.queue_name, request.task)
+        return {"message": f"{request.task} task queued", "id": request.request_id, "duplicate": False}
+
+    async def submit_batch(
+        self, requests: List[QueueRequest], username: str, idempotency_key: str = None, force: bool = False
+    ) -> dict:
+        """
+        Queue many requests as one batch
+
+        'stop' requests are ignored, as they are by /util/enqueue, and a request
+        id that appears more than once is queued once. Requests for work that is
+        already queued or running, in this batch or an earlier one, are
+        coalesced: the existing job is reported and counted in the batch's
+        progress instead of queueing the work again.
+
+        Args:
+            requests (List[QueueRequest]): Requests to be queued
+            username (str): Who is queueing them; scopes the idempotency key
+            idempotency_key (str): Optional Idempotency-Key header. A retry gets the first batch back.
+            force (bool): Queue every request even if the same work is in flight
+
+        Returns:
+            dict: message, batch_id, count (newly queued), coalesced and the batch's request ids,
+                queued jobs first, then the existing jobs that were coalesced
+        """
+        requests = list({request.request_id: request for request in requests if request.task != 'stop'}.values())
+        if not requests:
+            return {"message": "No tasks queued", "batch_id": None, "count": 0, "coalesced": 0, "ids": []}
+        batch_id = str(uuid4())
+        task_counts = count_tasks(requests)
+        tasks = ','.join(sorted(task_counts))
+
+        if idempotency_key:
+            existing_batch = await self.job_status.claim_idempotency_key(username, idempotency_key, batch_id)
+            if existing_batch:
+                for task, count in task_counts.items():
+                    record_coalesced(self.queue_name, task, 'idempotency_key', count)
+                ids = await self.job_status.get_batch_request_ids(existing_batch)
+                return {"message": "Batch already queued", "batch_id": existing_batch, "count": 0, "coalesced": len(ids), "ids": ids}
+
+        claimed, to_queue, existing_ids, pushed = {}, [], [], 0
+
+        def enqueue_all():
+            nonlocal pushed
+            for request in to_queue:
+                self.work_queue.enqueue_work(request.json())
+                pushed += 1
+
+        try:
+            # Everything after the idempotency key is claimed runs here, so a failure frees the key for a retry
+            versions = await self.document_versions(requests)
+            unique = {}
+            for request in requests:
+                unique.setdefault(work_key(request, versions), request)
+            claims = {key: request.request_id for key, request in unique.items()}
+            existing = await self.job_status.claim_in_flight(claims, force)
+            to_queue = [request for key, request in unique.items() if key not in existing]
+            claimed = {key: request_id for key, request_id in claims.items() if key not in existing}
+
+            existing_ids = list(dict.fromkeys(existing.values()))
+            await self.job_status.record_batch([request.request_id for request in to_queue], batch_id, tasks, existing_ids)
+            with traced_call('redis enqueue_work', **{'db.system': 'redis', 'messaging.destination.name': self.queue_name, 'messaging.batch.message_count': len(to_queue)}):
+                await run_in_threadpool(enqueue_all)
+        except Exception as e:
+            LOGGER.error("Batch %s: queued %d of %d tasks: %s", batch_id, pushed, len(to_queue), e)
+            unqueued = {request.request_id for request in to_queue[pushed:]}
+            await self.job_status.set_statuses(list(unqueued), FAILED, f"Could not be queued: {e}")
+            await self.job_status.release_in_flight({key: request_id for key, request_id in claimed.items() if request_id in unqueued})
+            if idempotency_key and not pushed:
+                await self.job_status.set_idempotency_key(username, idempotency_key, None)
+            raise
+
+        queued_counts = count_tasks(to_queue)
+        for task, count in task_counts.items():
+            if queued_counts.get(task):
+                record_enqueue(self.queue_name, task, queued_counts[task])
+            if count > queued_counts.get(task, 0):
+                record_coalesced(self.queue_name, task, 'in_flight', count - queued_counts.get(task, 0))
+        coalesced = len(requests) - len(to_queue)
+        ids = [request.request_id for request in to_queue] + existing_ids  # The batch's jobs, as recorded
+        LOGGER.info("Queued batch %s: %d %s tasks, %d coalesced", batch_id, len(to_queue), tasks, coalesced)
+        return {"message": f"{len(to_queue)} tasks queued", "batch_id": batch_id, "count": len(to_queue), "coalesced": coalesced, "ids": ids}
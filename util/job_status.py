@@ -0,0 +1,366 @@
+"""
+job_status.py - Status of queued jobs, shared by every API worker
+
+Statuses are kept in the work queue's Redis server, so every uvicorn worker
+gives the same answer for a job. Each change is also published over Redis
+pub/sub. Clients can follow their jobs with GET /util/status/stream instead
+of polling.
+
+How records are stored, for the workers that process jobs:
+    job_status:<request_id>          A hash with fields id, status, detail and
+                                     updated_at (ISO 8601, UTC). It expires
+                                     JOB_STATUS_TTL_DAYS after its last change.
+    channel job_status:<request_id>  The same fields as JSON, published on every change.
+    job_batch:<batch_id>             A hash with fields id, tasks, total and created_at,
+                                     for jobs that were queued together.
+    job_batch:<batch_id>:jobs        A list of the batch's request ids.
+    job_inflight:<dedupe_key>        The request id of the queued or running job for
+                                     a piece of work, e.g. classify one version of a
+                                     document with one model. Expires after
+                                     JOB_INFLIGHT_TTL_MINUTES.
+    job_idempotency:<user>:<key>     The request or batch id of a submission that
+                                     carried an Idempotency-Key header.
+
+Workers report progress with PUT /util/status, with JobStatusStore.set_status(),
+or by writing the hash and publishing to the channel themselves. 'completed'
+and 'failed' are final statuses.
+
+The distributed_work_queue workers do not report here yet. Until they do,
+every job stays 'queued', and a status stream closes after
+JOB_STATUS_STREAM_SECONDS instead of when its jobs finish.
+"""
+from datetime import datetime
+import json
+import os
+from time import monotonic
+from typing import AsyncIterator, Dict, List, Optional
+import redis.asyncio as redis
+import settings  # NOQA
+
+JOB_STATUS_TTL_DAYS = int(os.getenv('JOB_STATUS_TTL_DAYS', '7'))
+JOB_STATUS_HEARTBEAT_SECONDS = float(os.getenv('JOB_STATUS_HEARTBEAT_SECONDS', '15'))
+JOB_STATUS_STREAM_SECONDS = float(os.getenv('JOB_STATUS_STREAM_SECONDS', '300'))  # Longest a stream stays open
+JOB_INFLIGHT_TTL_MINUTES = int(os.getenv('JOB_INFLIGHT_TTL_MINUTES', '15'))  # Work stuck longer than this can be queued again
+JOB_IDEMPOTENCY_TTL_HOURS = int(os.getenv('JOB_IDEMPOTENCY_TTL_HOURS', '24'))
+
+KEY_PREFIX = 'job_status:'
+BATCH_KEY_PREFIX = 'job_batch:'
+INFLIGHT_KEY_PREFIX = 'job_inflight:'
+IDEMPOTENCY_KEY_PREFIX = 'job_idempotency:'
+QUEUED = 'queued'
+RUNNING = 'running'
+COMPLETED = 'completed'
+FAILED = 'failed'
+UNKNOWN = 'unknown'
+FINAL_STATUSES = {COMPLETED, FAILED}
+
+# KEYS[1] is the in-flight key; ARGV is the new request id, the TTL in seconds, KEY_PREFIX
+# and '1' to claim the key even if its job is still in flight.
+# Returns the request id already registered, unless that job has finished, in which case
+# the new request id takes its place and nothing is returned. A registered job without a
+# status is being queued by another request, so it counts as in flight.
+CLAIM_IN_FLIGHT_SCRIPT = """
+local existing = redis.call('GET', KEYS[1])
+if existing and ARGV[4] ~= '1' then
+    local status = redis.call('HGET', ARGV[3] .. existing, 'status')
+    if status ~= 'completed' and status ~= 'failed' then
+        return existing
+    end
+end
+redis.call('SET', KEYS[1], ARGV[1], 'EX', ARGV[2])
+return false
+"""
+# Deletes an in-flight key only if it still holds our request id (ARGV[1])
+RELEASE_IN_FLIGHT_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+
+def job_key(request_id: str) -> str:
+    """
+    Redis key of a job's status hash, which is also its pub/sub channel
+    """
+    return f'{KEY_PREFIX}{request_id}'
+
+
+def batch_key(batch_id: str) -> str:
+    """
+    Redis key of a batch's hash; its request ids are in the list batch_key(batch_id) + ':jobs'
+    """
+    return f'{BATCH_KEY_PREFIX}{batch_id}'
+
+
+class JobStatusStore():
+    """
+    Job statuses in Redis
+    """
+    def __init__(
+        self, host: str = 'localhost', port: int = 6379, db: int = 0, ttl_days: int = JOB_STATUS_TTL_DAYS, client: redis.Redis = None
+    ) -> None:
+        """
+        Args:
+            host (str): Redis host
+            port (int): Redis port
+            db (int): Redis database
+            ttl_days (int): How long status records are kept after their last change
+            client (redis.Redis): A client to use instead of connecting to host:port/db.
+                It must decode responses.
+        """
+        self.redis = client or redis.Redis(host=host, port=port, db=db, decode_responses=True)
+        self.ttl_seconds = ttl_days * 24 * 60 * 60
+        self.inflight_ttl_seconds = JOB_INFLIGHT_TTL_MINUTES * 60
+        self.idempotency_ttl_seconds = JOB_IDEMPOTENCY_TTL_HOURS * 60 * 60
+        self.claim_script = self.redis.register_script(CLAIM_IN_FLIGHT_SCRIPT)
+        self.release_script = self.redis.register_script(RELEASE_IN_FLIGHT_SCRIPT)
+
+    async def aclose(self) -> None:
+        await self.redis.aclose()
+
+    async def set_status(self, request_id: str, status: str, detail: str = None) -> dict:
+        """
+        Record a job's status and publish the change
+
+        Args:
+            request_id (str): The job's request id
+            status (str): e.g. 'queued', 'running', 'completed' or 'failed'
+            detail (str): Optional message, e.g. an error
+
+        Returns:
+            dict: The status record
+        """
+        record = {
+            'id': request_id,
+            'status': status,
+            'detail': detail or '',
+            'updated_at': datetime.utcnow().isoformat(),
+        }
+        key = job_key(request_id)
+        async with self.redis.pipeline(transaction=True) as pipe:
+            pipe.hset(key, mapping=record)
+            pipe.expire(key, self.ttl_seconds)
+            pipe.publish(key, json.dumps(record))
+            await pipe.execute()
+        return record
+
+    async def add_job(self, request_id: str) -> dict:
+        """
+        Record that a job was queued
+        """
+        return await self.set_status(request_id, QUEUED)
+
+    async def get_status(self, request_id: str) -> Optional[dict]:
+        """
+        Get a job's status
+
+        Returns:
+            dict: The status record, or None if the job is unknown or expired
+        """
+        record = await self.redis.hgetall(job_key(request_id))
+        return record or None
+
+    async def get_statuses(self, request_ids: List[str]) -> Dict[str, Optional[dict]]:
+        """
+        Get the status of several jobs in one round trip
+        """
+        async with self.redis.pipeline(transaction=False) as pipe:
+            for request_id in request_ids:
+                pipe.hgetall(job_key(request_id))
+            records = await pipe.execute()
+        return {request_id: record or None for request_id, record in zip(request_ids, records)}
+
+    async def claim_in_flight(self, dedupe_keys: Dict[str, str], force: bool = False) -> Dict[str, str]:
+        """
+        Register jobs as the in-flight work for their dedupe keys, in one round trip
+
+        Args:
+            dedupe_keys (Dict[str, str]): dedupe key -> request id of the job that would do the work
+            force (bool): Take over the keys even from jobs that are still in flight
+
+        Returns:
+            Dict[str, str]: dedupe key -> request id of the job already queued or running,
+                for each key that was not claimed. Those jobs should not be queued.
+        """
+        if not dedupe_keys:
+            return {}
+        async with self.redis.pipeline(transaction=False) as pipe:
+            for dedupe_key, request_id in dedupe_keys.items():
+                await self.claim_script(
+                    keys=[INFLIGHT_KEY_PREFIX + dedupe_key],
+                    args=[request_id, self.inflight_ttl_seconds, KEY_PREFIX, '1' if force else '0'],
+                    client=pipe,
+                )
+            existing = await pipe.execute()
+        return {dedupe_key: request_id for dedupe_key, request_id in zip(dedupe_keys, existing) if request_id}
+
+    async def release_in_flight(self, dedupe_keys: Dict[str, str]) -> None:
+        """
+        Remove in-flight registrations after the jobs could not be queued
+
+        Args:
+            dedupe_keys (Dict[str, str]): dedupe key -> request id, as passed to claim_in_flight()
+        """
+        if not dedupe_keys:
+            return
+        async with self.redis.pipeline(transaction=False) as pipe:
+            for dedupe_key, request_id in dedupe_keys.items():
+                await self.release_script(keys=[INFLIGHT_KEY_PREFIX + dedupe_key], args=[request_id], client=pipe)
+            await pipe.execute()
+
+    async def claim_idempotency_key(self, scope: str, key: str, value: str) -> Optional[str]:
+        """
+        Record the request or batch id for a client's Idempotency-Key
+
+        Args:
+            scope (str): Whose key it is, e.g. the username, so clients can't collide
+            key (str): The Idempotency-Key header
+            value (str): The id this submission would create
+
+        Returns:
+            str: The id recorded by an earlier submission with the same key, or None
+                if this is the first one
+        """
+        redis_key = f'{IDEMPOTENCY_KEY_PREFIX}{scope}:{key}'
+        async with self.redis.pipeline(transaction=True) as pipe:
+            pipe.set(redis_key, value, nx=True, ex=self.idempotency_ttl_seconds)
+            pipe.get(redis_key)
+            claimed, existing = await pipe.execute()
+        return None if claimed else existing
+
+    async def set_idempotency_key(self, scope: str, key: str, value: Optional[str]) -> None:
+        """
+        Point an Idempotency-Key at a different id, or forget it when value is None
+        """
+        redis_key = f'{IDEMPOTENCY_KEY_PREFIX}{scope}:{key}'
+        if value is None:
+            await self.redis.delete(redis_key)
+        else:
+            await self.redis.set(redis_key, value, ex=self.idempotency_ttl_seconds)
+
+    async def record_batch(self, request_ids: List[str], batch_id: str, tasks: str, existing_ids: List[str] = None) -> dict:
+        """
+        Record jobs as queued and group them under a batch id, in one round trip
+
+        Call this before the jobs are handed to the work queue, so that workers
+        never see a job that has no status and a fast worker's status is not
+        overwritten with 'queued'.
+
+        Args:
+            request_ids (List[str]): The jobs about to be queued
+            batch_id (str): Id that groups the jobs
+            tasks (str): The batch's task names, for reporting
+            existing_ids (List[str]): Jobs that were already queued but belong in the
+                batch's progress, e.g. coalesced duplicates
+
+        Returns:
+            dict: The batch record
+        """
+        now = datetime.utcnow().isoformat()
+        all_ids = list(request_ids) + list(existing_ids or [])
+        batch = {'id': batch_id, 'tasks': tasks, 'total': len(all_ids), 'created_at': now}
+        async with self.redis.pipeline(transaction=True) as pipe:
+            for request_id in request_ids:
+                key = job_key(request_id)
+                pipe.hset(key, mapping={'id': request_id, 'status': QUEUED, 'detail': '', 'updated_at': now})
+                pipe.expire(key, self.ttl_seconds)
+            pipe.hset(batch_key(batch_id), mapping=batch)
+            pipe.rpush(batch_key(batch_id) + ':jobs', *all_ids)
+            pipe.expire(batch_key(batch_id), self.ttl_seconds)
+            pipe.expire(batch_key(batch_id) + ':jobs', self.ttl_seconds)
+            await pipe.execute()
+        return batch
+
+    async def set_statuses(self, request_ids: List[str], status: str, detail: str = None) -> None:
+        """
+        Give several jobs the same status, e.g. 'failed' for jobs that could not be queued
+        """
+        if not request_ids:
+            return
+        async with self.redis.pipeline(transaction=True) as pipe:
+            for request_id in request_ids:
+                record = {'id': request_id, 'status': status, 'detail': detail or '', 'updated_at': datetime.utcnow().isoformat()}
+                key = job_key(request_id)
+                pipe.hset(key, mapping=record)
+                pipe.expire(key, self.ttl_seconds)
+                pipe.publish(key, json.dumps(record))
+            await pipe.execute()
+
+    async def get_batch_request_ids(self, batch_id: str) -> List[str]:
+        """
+        The request ids of a batch's jobs
+        """
+        return await self.redis.lrange(batch_key(batch_id) + ':jobs', 0, -1)
+
+    async def get_batch_progress(self, batch_id: str) -> Optional[dict]:
+        """
+        Count a batch's jobs by status
+
+        Returns:
+            dict: The batch record with 'counts' ({status: jobs}) and 'finished'
+                (every job completed or failed), or None if the batch is unknown or expired
+        """
+        async with self.redis.pipeline(transaction=False) as pipe:
+            pipe.hgetall(batch_key(batch_id))
+            pipe.lrange(batch_key(batch_id) + ':jobs', 0, -1)
+            batch, request_ids = await pipe.execute()
+        if not batch:
+            return None
+        async with self.redis.pipeline(transaction=False) as pipe:
+            for request_id in request_ids:
+                pipe.hget(job_key(request_id), 'status')
+            statuses = await pipe.execute()
+        counts = {}
+        for job_status in statuses:
+            job_status = job_status or UNKNOWN
+            counts[job_status] = counts.get(job_status, 0) + 1
+        batch['total'] = int(batch['total'])
+        batch['counts'] = counts
+        batch['finished'] = all(job_status in FINAL_STATUSES for job_status in statuses)
+        return batch
+
+    async def watch(
+        self,
+        request_ids: List[str],
+        heartbeat: float = JOB_STATUS_HEARTBEAT_SECONDS,
+        max_seconds: float = JOB_STATUS_STREAM_SECONDS,
+    ) -> AsyncIterator[Optional[dict]]:
+        """
+        Yield each job's current status, then every change, until all of them are final
+
+        Jobs we have no record of are reported as 'unknown' and watched in case
+        they are queued later.
+
+        Args:
+            request_ids (List[str]): The jobs to watch
+            heartbeat (float): Yield None after this many seconds without a change
+            max_seconds (float): Stop after this long even if some jobs are not final
+
+        Yields:
+            dict: Status records, or None as a heartbeat
+        """
+        pubsub = self.redis.pubsub()
+        # Subscribe before reading the current statuses so that no change falls in between
+        await pubsub.subscribe(*(job_key(request_id) for request_id in request_ids))
+        try:
+            pending = set(request_ids)
+            for request_id, record in (await self.get_statuses(request_ids)).items():
+                record = record or {'id': request_id, 'status': UNKNOWN, 'detail': '', 'updated_at': ''}
+                if record['status'] in FINAL_STATUSES:
+                    pending.discard(request_id)
+                yield record
+
+            deadline = monotonic() + max_seconds
+            while pending and monotonic() < deadline:
+                message = await pubsub.get_message(ignore_subscribe_messages=True, timeout=heartbeat)
+                if message is None:
+                    yield None
+                    continue
+                record = json.loads(message['data'])
+                if record.get('status') in FINAL_STATUSES:
+                    pending.discard(record.get('id'))
+                yield record
+        finally:
+            await pubsub.unsubscribe()
+            await pubsub.aclose()
@@ -0,0 +1,282 @@
+"""
+metrics.py - Prometheus metrics
+
+Collects per-route request counts and latency, in-flight requests, MongoDB
+command latency and connection pool checkout waits, work-queue submissions and
+cache hit rates, and serves them in the Prometheus text format at /metrics.
+
+Everything is an in-process counter or histogram that is only read when
+Prometheus scrapes, so it is cheap enough to leave on in production. Set
+METRICS_ENABLED=false to turn it off.
+
+When uvicorn runs several workers, set PROMETHEUS_MULTIPROC_DIR to an empty
+directory so that /metrics reports the totals of all workers.
+"""
+import os
+from threading import Lock
+from time import perf_counter
+from typing import Callable, Dict
+from fastapi import Response
+from pymongo import monitoring
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+import settings  # NOQA
+
+try:
+    from prometheus_client import (
+        CONTENT_TYPE_LATEST, CollectorRegistry, Counter, Gauge, Histogram, REGISTRY, generate_latest,
+    )
+    from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily
+except ImportError:  # pragma: no cover - optional dependency
+    REGISTRY = None
+
+METRICS_ENABLED = REGISTRY is not None and os.getenv('METRICS_ENABLED', 'True').lower() == 'true'
+PROMETHEUS_MULTIPROC_DIR = os.getenv('PROMETHEUS_MULTIPROC_DIR')
+
+UNMATCHED_ROUTE = 'unmatched'  # Keeps 404s for random paths from creating a label per path
+
+if METRICS_ENABLED:
+    HTTP_REQUESTS = Counter(
+        'falconapi_http_requests_total', 'HTTP requests', ['method', 'route', 'status']
+    )
+    HTTP_REQUEST_DURATION = Histogram(
+        'falconapi_http_request_duration_seconds', 'HTTP request latency', ['method', 'route'],
+        buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0),
+    )
+    HTTP_REQUESTS_IN_PROGRESS = Gauge(
+        'falconapi_http_requests_in_progress', 'HTTP requests being handled', ['method'],
+        multiprocess_mode='livesum',
+    )
+    MONGO_COMMAND_DURATION = Histogram(
+        'falconapi_mongodb_command_duration_seconds', 'MongoDB command latency', ['command', 'collection'],
+        buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 5.0),
+    )
+    MONGO_COMMAND_FAILURES = Counter(
+        'falconapi_mongodb_command_failures_total', 'Failed MongoDB commands', ['command', 'collection']
+    )
+    MONGO_POOL_CHECKOUT_WAIT = Histogram(
+        'falconapi_mongodb_pool_checkout_wait_seconds', 'Time spent waiting for a pooled MongoDB connection',
+        buckets=(0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0),
+    )
+    MONGO_POOL_CHECKOUT_FAILURES = Counter(
+        'falconapi_mongodb_pool_checkout_failures_total', 'Failed MongoDB connection checkouts', ['reason']
+    )
+    WORK_QUEUE_ENQUEUED = Counter(
+        'falconapi_work_queue_enqueued_total', 'Requests submitted to the work queue', ['queue', 'task']
+    )
+    WORK_QUEUE_COALESCED = Counter(
+        'falconapi_work_queue_coalesced_total', 'Submissions answered with an existing job instead of new work',
+        ['queue', 'task', 'reason'],
+    )
+    CACHE_REQUESTS = Counter(
+        'falconapi_cache_requests_total', 'Cache lookups', ['cache', 'result']
+    )
+
+
+def record_enqueue(queue_name: str, task: str, count: int = 1) -> None:
+    """
+    Count requests submitted to a work queue
+
+    Args:
+        queue_name (str): The queue's name
+        task (str): The task, e.g. 'classify'
+        count (int): How many were submitted
+    """
+    if METRICS_ENABLED:
+        WORK_QUEUE_ENQUEUED.labels(queue_name, task).inc(count)
+
+
+def record_coalesced(queue_name: str, task: str, reason: str, count: int = 1) -> None:
+    """
+    Count submissions that were not queued because the same work was already queued
+
+    Args:
+        queue_name (str): The queue's name
+        task (str): The task, e.g. 'classify'
+        reason (str): 'in_flight' for a duplicate of a queued or running job,
+            'idempotency_key' for a retried submission
+        count (int): How many were coalesced
+    """
+    if METRICS_ENABLED:
+        WORK_QUEUE_COALESCED.labels(queue_name, task, reason).inc(count)
+
+
+def record_cache(cache: str, hit: bool) -> None:
+    """
+    Count a lookup in one of our caching layers
+
+    Args:
+        cache (str): The cache's name
+        hit (bool): True for a hit, False for a miss
+    """
+    if METRICS_ENABLED:
+        CACHE_REQUESTS.labels(cache, 'hit' if hit else 'miss').inc()
+
+
+class StatsCollector():
+    """
+    Reports counters that other modules already keep, when Prometheus scrapes
+
+    Register a function that returns a snapshot dict of numbers with
+    register_stats(). Nested dicts, like the compression stats keyed by
+    encoding, become a label.
+    """
+    def __init__(self) -> None:
+        self.lock = Lock()
+        self.sources: Dict[str, tuple] = {}  # name -> (snapshot function, label name)
+
+    def register(self, name: str, snapshot: Callable[[], dict], label: str = 'key') -> None:
+        with self.lock:
+            self.sources[name] = (snapshot, label)
+
+    def collect(self):
+        with self.lock:
+            sources = list(self.sources.items())
+        for name, (snapshot, label) in sources:
+            try:
+                stats = snapshot()
+            except Exception:
+                continue
+            flat = {key: value for key, value in stats.items() if isinstance(value, (int, float))}
+            for key, value in flat.items():
+                metric = GaugeMetricFamily(f'falconapi_{name}_{key}', f'{name} {key}')
+                metric.add_metric([], value)
+                yield metric
+            nested = {key: value for key, value in stats.items() if isinstance(value, dict)}
+            fields = sorted({field for values in nested.values() for field in values})
+            for field in fields:
+                metric = CounterMetricFamily(f'falconapi_{name}_{field}', f'{name} {field}', labels=[label])
+                for key, values in nested.items():
+                    if field in values:
+                        metric.add_metric([key], values[field])
+                yield metric
+
+
+STATS_COLLECTOR = StatsCollector()
+if METRICS_ENABLED:
+    REGISTRY.register(STATS_COLLECTOR)
+
+
+def register_stats(name: str, snapshot: Callable[[], dict], label: str = 'key') -> None:
+    """
+    Expose an existing snapshot() function's counters at /metrics
+
+    Args:
+        name (str): Metric name prefix, e.g. 'audit'
+        snapshot (Callable): Returns a dict of numbers, or of dicts of numbers
+        label (str): Label name for the keys of nested dicts
+    """
+    STATS_COLLECTOR.register(name, snapshot, label)
+
+
+def metrics_response() -> Response:
+    """
+    Render all metrics in the Prometheus text format
+    """
+    if not METRICS_ENABLED:
+        return Response("Metrics are disabled\n", status_code=404, media_type='text/plain')
+    if PROMETHEUS_MULTIPROC_DIR:
+        from prometheus_client import multiprocess
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        registry.register(STATS_COLLECTOR)
+        return Response(generate_latest(registry), media_type=CONTENT_TYPE_LATEST)
+    return Response(generate_latest(REGISTRY), media_type=CONTENT_TYPE_LATEST)
+
+
+class MetricsMiddleware():
+    """
+    ASGI middleware that times each request and counts it by route template and status
+    """
+    def __init__(self, app: ASGIApp) -> None:
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope['type'] != 'http' or not METRICS_ENABLED:
+            await self.app(scope, receive, send)
+            return
+
+        method = scope.get('method', 'GET')
+        status_code = 500
+
+        async def send_wrapper(message: Message) -> None:
+            nonlocal status_code
+            if message['type'] == 'http.response.start':
+                status_code = message['status']
+            await send(message)
+
+        in_progress = HTTP_REQUESTS_IN_PROGRESS.labels(method)
+        in_progress.inc()
+        start = perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            elapsed = perf_counter() - start
+            in_progress.dec()
+            route = scope.get('route')
+            route_path = getattr(route, 'path', None) or UNMATCHED_ROUTE
+            HTTP_REQUEST_DURATION.labels(method, route_path).observe(elapsed)
+            HTTP_REQUESTS.labels(method, route_path, str(status_code)).inc()
+
+
+class MongoMetricsListener(monitoring.CommandListener):
+    """
+    pymongo command listener that records command latency by command and collection
+    """
+    def __init__(self) -> None:
+        self.lock = Lock()
+        self.collections = {}  # (connection_id, request_id) -> collection name
+
+    def started(self, event: monitoring.CommandStartedEvent) -> None:
+        collection = event.command.get(event.command_name)
+        with self.lock:
+            self.collections[(event.connection_id, event.request_id)] = collection if isinstance(collection, str) else ''
+
+    def succeeded(self, event: monitoring.CommandSucceededEvent) -> None:
+        with self.lock:
+            collection = self.collections.pop((event.connection_id, event.request_id), '')
+        MONGO_COMMAND_DURATION.labels(event.command_name, collection).observe(event.duration_micros / 1_000_000)
+
+    def failed(self, event: monitoring.CommandFailedEvent) -> None:
+        with self.lock:
+            collection = self.collections.pop((event.connection_id, event.request_id), '')
+        MONGO_COMMAND_DURATION.labels(event.command_name, collection).observe(event.duration_micros / 1_000_000)
+        MONGO_COMMAND_FAILURES.labels(event.command_name, collection).inc()
+
+
+class MongoPoolMetricsListener(monitoring.ConnectionPoolListener):
+    """
+    pymongo pool listener that records how long requests wait for a connection
+    """
+    def connection_checked_out(self, event: monitoring.ConnectionCheckedOutEvent) -> None:
+        if event.duration is not None:
+            MONGO_POOL_CHECKOUT_WAIT.observe(event.duration)
+
+    def connection_check_out_failed(self, event: monitoring.ConnectionCheckOutFailedEvent) -> None:
+        MONGO_POOL_CHECKOUT_FAILURES.labels(str(event.reason)).inc()
+
+    def pool_created(self, event) -> None:
+        pass
+
+    def pool_ready(self, event) -> None:
+        pass
+
+    def pool_cleared(self, event) -> None:
+        pass
+
+    def pool_closed(self, event) -> None:
+        pass
+
+    def connection_created(self, event) -> None:
+        pass
+
+    def connection_ready(self, event) -> None:
+        pass
+
+    def connection_closed(self, event) -> None:
+        pass
+
+    def connection_check_out_started(self, event) -> None:
+        pass
+
+    def connection_checked_in(self, event) -> None:
+        pass
@@ -0,0 +1,109 @@
+"""
+responses.py - Fast JSON responses
+
+FastJSONResponse serializes with orjson instead of the standard library's json
+module. It is the application's default response class.
+
+trusted_response() is for data that comes straight from our own table classes.
+Returning a Response object from a route makes FastAPI skip response_model
+validation and jsonable_encoder, so the data is serialized exactly once.
+Routes that use it keep their response_model for the OpenAPI documentation.
+"""
+from typing import Any, List, Type
+from bson.objectid import ObjectId
+from fastapi.responses import JSONResponse
+import orjson
+from pydantic import BaseModel
+
+
+ORJSON_OPTIONS = orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY
+
+
+def orjson_default(obj: Any) -> Any:
+    """
+    Serialize the types orjson does not handle natively
+    """
+    if isinstance(obj, BaseModel):
+        return obj.model_dump()
+    if isinstance(obj, ObjectId):
+        return str(obj)
+    if isinstance(obj, (set, frozenset, tuple)):
+        return list(obj)
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+class FastJSONResponse(JSONResponse):
+    """
+    JSON response rendered with orjson
+    """
+    media_type = 'application/json'
+
+    def render(self, content: Any) -> bytes:
+        return orjson.dumps(content, default=orjson_default, option=ORJSON_OPTIONS)
+
+
+def trusted_response(content: Any, status_code: int = 200, headers: dict = None) -> FastJSONResponse:
+    """
+    Return already-validated data without re-validating it against the route's response_model
+
+    Args:
+        content (Any): Dicts, lists, or pydantic models read from our own tables
+        status_code (int): HTTP status code
+        headers (dict): Extra response headers
+
+    Returns:
+        FastJSONResponse: The serialized response
+    """
+    return FastJSONResponse(content, status_code=status_code, headers=headers)
+
+
+def model_projection(model: Type[BaseModel]) -> dict:
+    """
+    Build a MongoDB projection that returns only a model's fields
+
+    Use this with trusted_response() so that raw database records have the same
+    shape as the response_model would have given them.
+
+    Args:
+        model (Type[BaseModel]): The pydantic model class
+
+    Returns:
+        dict: The projection, which always excludes '_id'
+    """
+    projection = {field: 1 for field in model.model_fields}
+    projection['_id'] = 0
+    return projection
+
+
+def model_defaults(model: Type[BaseModel]) -> dict:
+    """
+    Get the default value of every model field that has one
+
+    Args:
+        model (Type[BaseModel]): The pydantic model class
+
+    Returns:
+        dict: field name -> default value
+    """
+    defaults = {}
+    for name, field in model.model_fields.items():
+        if field.default_factory is not None:
+            defaults[name] = field.default_factory()
+        elif not field.is_required():
+            defaults[name] = field.default
+    return defaults
+
+
+def with_model_defaults(model: Type[BaseModel], records: List[dict]) -> List[dict]:
+    """
+    Fill in defaults for fields that older records do not have
+
+    Args:
+        model (Type[BaseModel]): The pydantic model class the records were written from
+        records (List[dict]): Records read with model_projection(model)
+
+    Returns:
+        List[dict]: The records with every optional field present
+    """
+    defaults = model_defaults(model)
+    return [{**defaults, **record} for record in records]
@@ -0,0 +1,202 @@
+"""
+tracing.py - OpenTelemetry tracing
+
+Creates a server span for every request, a child span for every MongoDB
+command, and client spans around outbound calls (ATTOM, the Redis work queue).
+
+Tracing is off unless OTEL_TRACES_EXPORTER is set:
+    otlp     Send spans to an OpenTelemetry collector. The exporter reads the
+             standard OTEL_EXPORTER_OTLP_* variables, e.g. OTEL_EXPORTER_OTLP_ENDPOINT.
+    console  Print spans to stdout, for local use.
+    file     Write spans as JSON lines to TRACE_FILE (default traces.jsonl).
+
+OTEL_SERVICE_NAME names the service (default 'falconapi').
+
+Needs opentelemetry-sdk, plus opentelemetry-exporter-otlp for the otlp
+exporter. Without them every helper here does nothing.
+"""
+from contextlib import contextmanager, nullcontext
+import os
+from threading import Lock
+from pymongo import monitoring
+from starlette.datastructures import Headers
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+from util.log_util import get_logger
+import settings  # NOQA
+
+try:
+    from opentelemetry import propagate, trace
+    from opentelemetry.trace import SpanKind, Status, StatusCode
+except ImportError:  # pragma: no cover - optional dependency
+    trace = None
+
+LOGGER = get_logger('falconapi/tracing.py')
+
+OTEL_TRACES_EXPORTER = os.getenv('OTEL_TRACES_EXPORTER', 'none').lower()
+OTEL_SERVICE_NAME = os.getenv('OTEL_SERVICE_NAME', 'falconapi')
+TRACE_FILE = os.getenv('TRACE_FILE', 'traces.jsonl')
+TRACING_ENABLED = trace is not None and OTEL_TRACES_EXPORTER not in ('', 'none')
+
+TRACER_NAME = 'falconapi'
+
+
+def setup_tracing() -> bool:
+    """
+    Install the tracer provider and exporter named by OTEL_TRACES_EXPORTER
+
+    Returns:
+        bool: True if tracing is on
+    """
+    if not TRACING_ENABLED:
+        return False
+    try:
+        from opentelemetry.sdk.resources import Resource
+        from opentelemetry.sdk.trace import TracerProvider
+        from opentelemetry.sdk.trace.export import BatchSpanProcessor, ConsoleSpanExporter
+    except ImportError:
+        LOGGER.error("OTEL_TRACES_EXPORTER=%s but opentelemetry-sdk is not installed; tracing is off", OTEL_TRACES_EXPORTER)
+        return False
+
+    if OTEL_TRACES_EXPORTER == 'otlp':
+        try:
+            from opentelemetry.exporter.otlp.proto.http.trace_exporter import OTLPSpanExporter
+        except ImportError:
+            LOGGER.error("opentelemetry-exporter-otlp is not installed; tracing is off")
+            return False
+        exporter = OTLPSpanExporter()
+    elif OTEL_TRACES_EXPORTER == 'console':
+        exporter = ConsoleSpanExporter()
+    elif OTEL_TRACES_EXPORTER == 'file':
+        trace_file = open(TRACE_FILE, 'a', encoding='utf-8')
+        exporter = ConsoleSpanExporter(out=trace_file, formatter=lambda span: span.to_json(indent=None) + '\n')
+    else:
+        LOGGER.error("Unknown OTEL_TRACES_EXPORTER '%s'; tracing is off", OTEL_TRACES_EXPORTER)
+        return False
+
+    provider = TracerProvider(resource=Resource.create({'service.name': OTEL_SERVICE_NAME}))
+    provider.add_span_processor(BatchSpanProcessor(exporter))
+    trace.set_tracer_provider(provider)
+    LOGGER.info("Tracing enabled: exporter=%s service=%s", OTEL_TRACES_EXPORTER, OTEL_SERVICE_NAME)
+    return True
+
+
+def get_tracer():
+    """
+    Return our tracer, or None if OpenTelemetry is not installed
+    """
+    if trace is None:
+        return None
+    return trace.get_tracer(TRACER_NAME)
+
+
+def client_span(name: str, **attributes):
+    """
+    Context manager that wraps an outbound call in a client span
+
+    Args:
+        name (str): Span name, e.g. 'attom GET /property/basicprofile'
+        attributes: Span attributes
+
+    Returns:
+        A context manager yielding the span, or a no-op when tracing is off
+    """
+    if not TRACING_ENABLED:
+        return nullcontext()
+    return get_tracer().start_as_current_span(name, kind=SpanKind.CLIENT, attributes=attributes)
+
+
+@contextmanager
+def traced_call(name: str, **attributes):
+    """
+    Like client_span(), but also marks the span as failed when the call raises
+    """
+    with client_span(name, **attributes) as span:
+        try:
+            yield span
+        except Exception as e:
+            if span is not None:
+                span.set_status(Status(StatusCode.ERROR, str(e)))
+            raise
+
+
+class TracingMiddleware():
+    """
+    ASGI middleware that wraps each HTTP request in a server span
+
+    The span is named after the matched route template (e.g. 'GET /api/v1_0/trackers/{tracker_id}/documents')
+    so that requests for different records are grouped together. A traceparent
+    header on the request continues the caller's trace.
+    """
+    def __init__(self, app: ASGIApp) -> None:
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope['type'] != 'http' or not TRACING_ENABLED:
+            await self.app(scope, receive, send)
+            return
+
+        method = scope.get('method', 'GET')
+        parent = propagate.extract(dict(Headers(scope=scope)))
+        with get_tracer().start_as_current_span(
+            f"{method} {scope.get('path', '')}",
+            context=parent,
+            kind=SpanKind.SERVER,
+            attributes={'http.request.method': method, 'url.path': scope.get('path', '')},
+        ) as span:
+            async def send_wrapper(message: Message) -> None:
+                if message['type'] == 'http.response.start':
+                    status_code = message['status']
+                    span.set_attribute('http.response.status_code', status_code)
+                    if status_code >= 500:
+                        span.set_status(Status(StatusCode.ERROR))
+                await send(message)
+
+            try:
+                await self.app(scope, receive, send_wrapper)
+            finally:
+                route = scope.get('route')
+                if route is not None and getattr(route, 'path', None):
+                    span.update_name(f"{method} {route.path}")
+                    span.set_attribute('http.route', route.path)
+
+
+class MongoTracingListener(monitoring.CommandListener):
+    """
+    pymongo command listener that records each database command as a child span
+
+    Only the command name and collection are recorded, never the filter or the
+    documents, so no client data ends up in the traces.
+    """
+    def __init__(self) -> None:
+        self.lock = Lock()
+        self.spans = {}  # (connection_id, request_id) -> span
+
+    def started(self, event: monitoring.CommandStartedEvent) -> None:
+        collection = event.command.get(event.command_name)
+        attributes = {
+            'db.system': 'mongodb',
+            'db.name': event.database_name,
+            'db.operation': event.command_name,
+        }
+        if isinstance(collection, str):
+            attributes['db.mongodb.collection'] = collection
+        if event.connection_id:
+            attributes['server.address'] = str(event.connection_id[0])
+            attributes['server.port'] = event.connection_id[1]
+        name = f"{event.command_name} {collection}" if isinstance(collection, str) else event.command_name
+        span = get_tracer().start_span(name, kind=SpanKind.CLIENT, attributes=attributes)
+        with self.lock:
+            self.spans[(event.connection_id, event.request_id)] = span
+
+    def succeeded(self, event: monitoring.CommandSucceededEvent) -> None:
+        with self.lock:
+            span = self.spans.pop((event.connection_id, event.request_id), None)
+        if span is not None:
+            span.end()
+
+    def failed(self, event: monitoring.CommandFailedEvent) -> None:
+        with self.lock:
+            span = self.spans.pop((event.connection_id, event.request_id), None)
+        if span is not None:
+            span.set_status(Status(StatusCode.ERROR, str(event.failure.get('errmsg', ''))))
+            span.end()